@@ -36,42 +36,23 @@ def init_db_if_available():
 
 # Imports condicionais para lidar com dependências ausentes
 try:
-    from monitor_dw.services.redshift_monitor import get_queries_over_threshold, get_queries_list
-    REDSHIFT_AVAILABLE = True
-except ImportError as e:
-    st.error(f"⚠️ Módulo Redshift não disponível: {e}")
-    REDSHIFT_AVAILABLE = False
-    get_queries_over_threshold = lambda x: 0
-    get_queries_list = lambda x, y: None
-
-try:
-    from monitor_dw.services.powerbi import get_last_refresh, has_powerbi_anomaly, get_refresh_status_info
+    from monitor_dw.services.powerbi import has_powerbi_anomaly, get_refresh_status_info
     POWERBI_AVAILABLE = True
 except ImportError as e:
     st.error(f"⚠️ Módulo PowerBI não disponível: {e}")
     POWERBI_AVAILABLE = False
-    get_last_refresh = lambda: (None, 0)
     has_powerbi_anomaly = lambda x: False
     get_refresh_status_info = lambda x: {"is_anomaly": False}
 
 try:
-    from monitor_dw.services.jira_client import get_open_tickets, has_jira_anomaly, format_issues_for_display
+    from monitor_dw.services.jira_client import has_jira_anomaly, format_issues_for_display
     JIRA_AVAILABLE = True
 except ImportError as e:
     st.error(f"⚠️ Módulo Jira não disponível: {e}")
     JIRA_AVAILABLE = False
-    get_open_tickets = lambda: (0, [])
     has_jira_anomaly = lambda x: False
     format_issues_for_display = lambda x: []
 
-try:
-    from monitor_dw.services.kpis import get_all_kpis
-    KPIS_AVAILABLE = True
-except ImportError as e:
-    st.error(f"⚠️ Módulo KPIs não disponível: {e}")
-    KPIS_AVAILABLE = False
-    get_all_kpis = lambda: {}
-
 try:
     from monitor_dw.services.alerts import send_alert_if_needed
     ALERTS_AVAILABLE = True
@@ -84,7 +65,7 @@ try:
     from monitor_dw.ui.sidebar import render_auth_ui, render_auth_sidebar, render_auto_refresh_controls, render_system_info
     from monitor_dw.ui.cards import (
         render_overview_card, render_redshift_card, render_powerbi_card, 
-        render_jira_card, render_kpis_card, render_slack_diagnostic_card
+        render_jira_card, render_kpis_card, render_slack_diagnostic_card, render_source_badge
     )
     UI_AVAILABLE = True
 except ImportError as e:
@@ -147,6 +128,14 @@ div[role="tablist"] > button[aria-selected="true"] {
   background: color-mix(in srgb, var(--primary) 18%, transparent);
   border-color: color-mix(in srgb, var(--primary) 50%, #000);
 }
+div[role="radiogroup"] > label {
+  border-radius: 999px; margin-right: 6px; padding: 6px 12px;
+  border: 1px solid #ffffff10; background: #1116;
+}
+div[role="radiogroup"] > label:has(input:checked) {
+  background: color-mix(in srgb, var(--primary) 18%, transparent);
+  border-color: color-mix(in srgb, var(--primary) 50%, #000);
+}
 
 /* primary buttons */
 button[kind="primary"] {
@@ -226,11 +215,34 @@ render_auth_sidebar()
 redshift_threshold, refresh_alert_min, auto_refresh, auto_refresh_sec = render_auto_refresh_controls()
 render_system_info()
 
+# ======================== COLETOR ========================
+# Se o coletor (python -m monitor_dw.collector) estiver publicando snapshots recentes,
+# a UI lê os dados dele em vez de consultar as fontes a cada rerun de cada sessão
+try:
+    from monitor_dw.collector import load_snapshot, snapshot_source
+    collected = load_snapshot()
+except Exception as e:
+    print(f"⚠️ Snapshot do coletor indisponível: {e}")
+    collected = None
+    snapshot_source = lambda snap, name: None
+
 # ======================== MAIN CONTENT ========================
-# Tabs
-tab_overview, tab_redshift, tab_powerbi, tab_jira, tab_kpis, tab_kestra, tab_monitors, tab_history = st.tabs([
+# Abas: st.tabs executa o corpo de todas as abas a cada rerun, mesmo as ocultas.
+# Com a navegação por radio apenas a aba visível é renderizada.
+tab_overview, tab_redshift, tab_powerbi, tab_jira, tab_kpis, tab_kestra, tab_monitors, tab_history = TABS = [
     "🧭 Visão Geral", "🟥 Redshift", "🟨 Power BI (CD)", "🟦 Jira", "🍇 KPIs Evino", "🔄 Kestra", "🆕 Monitoramentos", "📊 Histórico"
-])
+]
+active_tab = st.radio("Aba", TABS, horizontal=True, key="active_tab", label_visibility="collapsed")
+
+# Snapshot único do rerun: cada fonte é consultada uma vez (em paralelo) e
+# compartilhada entre a aba visível e os alertas do Slack
+from monitor_dw.services.snapshot import build_snapshot
+snapshot = build_snapshot(
+    redshift_threshold, collected,
+    sources=("redshift", "powerbi", "jira")
+    + (("kpis",) if active_tab in (tab_overview, tab_kpis) else ())
+    + (("kestra",) if active_tab == tab_kestra else ()),
+)
 
 # Funções de verificação de anomalias
 def has_query_anomaly(running_over: int, threshold: int) -> bool:
@@ -242,13 +254,14 @@ def has_kpi_anomaly(kpi_evino_pct, kpi_min: float) -> bool:
     return float(kpi_evino_pct) < float(kpi_min)
 
 # -------- VISÃO GERAL --------
-with tab_overview:
-    # Coleta dados para overview
-    running_over = get_queries_over_threshold(redshift_threshold)
-    last_refresh_utc, age_min = get_last_refresh()
+if active_tab == tab_overview:
+    render_source_badge("redshift", "postgres", "jira", "slack")
+    # Dados do snapshot do rerun
+    running_over = snapshot.running_over
+    last_refresh_utc = snapshot.last_refresh_utc
     powerbi_bad = has_powerbi_anomaly(last_refresh_utc)
-    total_abertos, issues = get_open_tickets()
-    kpis_data = get_all_kpis()
+    total_abertos = snapshot.jira_total
+    kpis_data = snapshot.kpis
 
     # Monitors quick
     def _load_monitors_quick() -> list[dict]:
@@ -273,10 +286,15 @@ with tab_overview:
     # Render overview card
     render_overview_card(
         running_over, last_refresh_utc, powerbi_bad, total_abertos, 
-        kpis_data["today"]["today_revenue"], kpis_data["fc_day"]["today_forecast"],
+        kpis_data.get("today", {}).get("today_revenue", 0), kpis_data.get("fc_day", {}).get("today_forecast", 0),
         redshift_threshold, len(mons), stale
     )
 
+    st.caption("⏱️ Fontes deste rerun: " + " • ".join(
+        f"{name} ({origin}{', ' + str(snapshot.timings[name]) + 's' if name in snapshot.timings else ''})"
+        for name, origin in snapshot.origin.items()
+    ))
+
     # Diagnóstico Slack
     render_slack_diagnostic_card()
 
@@ -291,36 +309,99 @@ with tab_overview:
     })
 
 # -------- REDSHIFT --------
-with tab_redshift:
-    running_over = get_queries_over_threshold(redshift_threshold)
-    df_list = None
+if active_tab == tab_redshift:
+    render_source_badge("redshift")
+    running_over = snapshot.running_over
+    df_list = snapshot.queries
     if running_over > 0:
-        df_list = get_queries_list(redshift_threshold, 20)
         log_error("redshift_queries_over_10min", f"Count: {running_over}, Threshold: {redshift_threshold}min")
     
-    render_redshift_card(running_over, redshift_threshold, df_list)
+    render_redshift_card(running_over, redshift_threshold, df_list, snapshot.queries_by_user)
+
+    # Ciclo de vida das queries longas (o coletor alimenta; sem coletor, o próprio app faz o poll)
+    from monitor_dw.services.query_tracker import (
+        maybe_poll_tracker, get_longest_queries_today, get_runtime_p95_by_user, get_fingerprint_stats,
+    )
+    if snapshot_source(collected, "tracker") is None:
+        try:
+            maybe_poll_tracker()
+        except Exception as e:
+            print(f"⚠️ Rastreador de queries: {e}")
+    with st.expander("📈 Queries longas de hoje", expanded=False):
+        try:
+            c1, c2 = st.columns([3, 2])
+            with c1:
+                st.caption("Mais longas iniciadas hoje")
+                st.dataframe(get_longest_queries_today(10), use_container_width=True, hide_index=True)
+            with c2:
+                st.caption("Duração p95 por usuário")
+                st.dataframe(get_runtime_p95_by_user(1), use_container_width=True, hide_index=True)
+            st.caption("Padrões recorrentes (SQL normalizado) — últimos 7 dias")
+            st.dataframe(get_fingerprint_stats(days=7), use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.caption(f"Histórico de queries indisponível: {e}")
+
+    # Fila do WLM e concurrency scaling (amostrados pelo coletor ou, sem ele, por este processo)
+    from monitor_dw.services.wlm_monitor import maybe_sample_wlm, get_wlm_history, get_wlm_current, get_cs_usage_today
+    if snapshot_source(collected, "wlm") is None:
+        try:
+            maybe_sample_wlm()
+        except Exception as e:
+            print(f"⚠️ Amostragem do WLM: {e}")
+    with st.expander("🚦 Filas do WLM", expanded=False):
+        try:
+            wlm_hours = st.selectbox("Janela", options=[1, 6, 24], index=1, format_func=lambda h: f"{h}h", key="wlm_hours")
+            df_wlm = get_wlm_history(wlm_hours)
+            if df_wlm.empty:
+                st.caption("Sem amostras do WLM ainda.")
+            else:
+                st.dataframe(get_wlm_current(df_wlm), use_container_width=True, hide_index=True)
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.caption("Queries na fila")
+                    st.line_chart(df_wlm.pivot_table(index="ts", columns="queue", values="queued", aggfunc="sum"))
+                with c2:
+                    st.caption("Maior tempo em fila (s)")
+                    st.line_chart(df_wlm.pivot_table(index="ts", columns="queue", values="max_queue_sec", aggfunc="max"))
+                cs_usage = get_cs_usage_today()
+                if cs_usage is not None:
+                    st.caption(f"⚡ Concurrency scaling hoje: {cs_usage / 60:.1f} min")
+        except Exception as e:
+            st.caption(f"Telemetria do WLM indisponível: {e}")
+
+    # Auto-cancelamento: roda só no coletor (independe do dashboard aberto); aqui, status e auditoria
+    from monitor_dw.config import AUTO_CANCEL_ENABLED, AUTO_CANCEL_DRY_RUN
+    from monitor_dw.services.auto_cancel import load_policy, get_audit_log
+    with st.expander("🛑 Auto-cancelamento", expanded=False):
+        try:
+            if not AUTO_CANCEL_ENABLED:
+                st.caption("Desligado (AUTO_CANCEL_ENABLED=0).")
+            else:
+                st.caption("Modo: " + ("dry-run (só auditoria)" if AUTO_CANCEL_DRY_RUN else "ativo — cancela queries acima do limite"))
+            st.json(load_policy(), expanded=False)
+            st.dataframe(get_audit_log(7), use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.caption(f"Auto-cancelamento indisponível: {e}")
 
 # -------- POWER BI --------
-with tab_powerbi:
-    refresh_info = get_refresh_status_info(get_last_refresh()[0])
+if active_tab == tab_powerbi:
+    render_source_badge("postgres")
+    refresh_info = get_refresh_status_info(snapshot.last_refresh_utc)
     if refresh_info["is_anomaly"]:
         log_error("powerbi_refresh_delay", f"Last refresh: {refresh_info['last_refresh_utc']}, Current: {time.time()}")
     
     render_powerbi_card(refresh_info, refresh_alert_min)
 
 # -------- JIRA --------
-with tab_jira:
+if active_tab == tab_jira:
+    render_source_badge("jira")
     try:
-        st.caption("🔍 Carregando dados do Jira...")
-        total_abertos, issues = get_open_tickets()
+        total_abertos, issues = snapshot.jira_total, snapshot.jira_issues
         
         # Debug info
         st.caption(f"📊 Debug: total_abertos={total_abertos}, issues_count={len(issues) if issues else 0}")
         
-        # Registrar chamados abertos no histórico
-        if total_abertos > 0 and DB_AVAILABLE:
-            from monitor_dw.db import log_jira_tickets
-            log_jira_tickets(total_abertos)
+        # O registro no histórico é feito uma vez por rerun, junto dos alertas (fim da página)
         
         if issues:
             formatted_issues = format_issues_for_display(issues)
@@ -334,20 +415,22 @@ with tab_jira:
         st.caption("Verifique as configurações do Jira no arquivo secrets.toml")
 
 # -------- KPIs EVINO --------
-with tab_kpis:
-    kpis_data = get_all_kpis()
-    render_kpis_card(kpis_data)
+if active_tab == tab_kpis:
+    render_source_badge("redshift")
+    render_kpis_card(snapshot.kpis)
 
 # -------- KESTRA --------
-with tab_kestra:
+if active_tab == tab_kestra:
     from monitor_dw.ui.cards import render_kestra_card
-    # Lista de flows específicos para monitorar (opcional)
-    # Se deixar vazio, tentará obter automaticamente
-    kestra_flows = []  # Exemplo: ["flow1", "flow2", "flow3"]
-    render_kestra_card(kestra_flows)
+    render_source_badge("kestra")
+    # Flows monitorados: KESTRA_FLOW_IDS (config.py); vazio = os primeiros da API
+    if snapshot.origin.get("kestra") == "coletor":
+        st.caption(f"🛰️ Coletor: {len(snapshot.kestra.get('flows', []))} flows encontrados no Kestra")
+    render_kestra_card(snapshot.kestra, snapshot.errors.get("kestra"))
 
 # -------- MONITORAMENTOS (NOVO) --------
-with tab_monitors:
+if active_tab == tab_monitors:
+    render_source_badge("redshift")
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("🆕 Criar/visualizar monitoramentos do DW")
 
@@ -399,6 +482,11 @@ with tab_monitors:
             else:
                 st.warning("⚠️ Nenhuma tabela encontrada")
                 st.caption("Verifique permissões ou se o schema existe")
+            if st.button("🔄 Atualizar catálogo", key="mon_catalog_refresh",
+                         help="Relê do Redshift as tabelas e colunas deste schema"):
+                from monitor_dw.services.catalog import invalidate_catalog
+                invalidate_catalog(schema)
+                st.rerun()
         except Exception as e:
             st.error(f"❌ Erro ao listar tabelas: {e}")
             tables = []
@@ -419,14 +507,23 @@ with tab_monitors:
     ts_col = st.selectbox("Coluna de data/hora (opcional)", options=[""] + ts_suggestions + df_cols["column"].tolist() if not df_cols.empty else [""], index=0, help="Usada para achar última atualização e ordenar prévia")
     ts_col = ts_col or None
 
+    # Modo de contagem: COUNT(*) varre a tabela inteira; os demais usam o catálogo
+    from monitor_dw.services.redshift_monitor import METRICS_MODES
+    from monitor_dw.config import MONITOR_METRICS_MODE
+    metrics_mode = st.selectbox(
+        "Modo das métricas", options=list(METRICS_MODES), format_func=METRICS_MODES.get,
+        index=list(METRICS_MODES).index(MONITOR_METRICS_MODE), key="mon_metrics_mode",
+        help="Exata faz COUNT(*) (varredura completa); Estimada usa svv_table_info; Amostrada faz COUNT(*) só periodicamente",
+    )
+
     st.divider()
     if schema and table:
         # Métricas da tabela
         st.markdown("### 📊 Métricas da Tabela")
-        metrics = get_table_metrics(schema, table, ts_col)
+        metrics = get_table_metrics(schema, table, ts_col, metrics_mode)
         m1, m2, m3 = st.columns(3)
         with m1:
-            st.markdown(f"<div class='metric'><div class='label'>Linhas (COUNT)</div><div class='value'>{metrics.get('row_count') or '—'}</div></div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='metric'><div class='label'>Linhas ({METRICS_MODES[metrics_mode]})</div><div class='value'>{metrics.get('row_count') or '—'}</div></div>", unsafe_allow_html=True)
         with m2:
             st.markdown(f"<div class='metric'><div class='label'>Linhas (svv_table_info)</div><div class='value'>{metrics.get('est_rows') or '—'}</div></div>", unsafe_allow_html=True)
         with m3:
@@ -442,6 +539,8 @@ with tab_monitors:
             try:
                 df_prev = get_table_preview(schema, table, ts_col, 20)
                 st.dataframe(df_prev, use_container_width=True, height=340)
+                if df_prev.attrs.get("truncated"):
+                    st.caption(f"⚠️ Prévia cortada em {len(df_prev)} linhas (limite de memória da prévia).")
             except Exception as e:
                 st.caption(f"Falha ao consultar prévia: {e}")
 
@@ -459,6 +558,7 @@ with tab_monitors:
                     "schema": schema,
                     "table": table,
                     "ts_col": ts_col,
+                    "metrics_mode": metrics_mode,
                     "name": mon_name,
                     "notes": notes,
                     "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -492,11 +592,24 @@ with tab_monitors:
     else:
         st.caption(f"📊 {len(mons)} monitor(es) configurado(s)")
         
-        # Status rápido de cada monitor
+        # Status rápido de cada monitor (todas as métricas em lote)
+        from monitor_dw.services.redshift_monitor import get_monitors_metrics
+        mon_key = lambda m: m.get("id") or f"{m.get('schema')}.{m.get('table')}"
+        try:
+            df_metrics = get_monitors_metrics(tuple(
+                (mon_key(m), m.get("schema"), m.get("table"), m.get("ts_col"), m.get("metrics_mode")) for m in mons
+            ))
+        except Exception as e:
+            st.error(f"❌ Erro ao consultar métricas dos monitores: {e}")
+            df_metrics = pd.DataFrame()
         rows = []
         for m in mons:
             try:
-                mt = get_table_metrics(m.get("schema"), m.get("table"), m.get("ts_col"))
+                if mon_key(m) not in df_metrics.index:
+                    raise RuntimeError("métricas indisponíveis")
+                mt = df_metrics.loc[mon_key(m)]
+                if isinstance(mt.get("error"), str):
+                    raise RuntimeError(mt["error"])
                 max_ts = mt.get("max_ts")
                 if isinstance(max_ts, pd.Timestamp):
                     last_ts_s = max_ts.tz_convert(TZ).strftime("%d/%m %H:%M")
@@ -504,12 +617,16 @@ with tab_monitors:
                     last_ts_s = "Sem dados"
                 else:
                     last_ts_s = "Sem coluna de data"
+                last_insert = mt.get("last_insert_at")
                 rows.append({
                     "Nome": m.get("name") or f"{m.get('schema')}.{m.get('table')}",
                     "Schema": m.get("schema"),
                     "Tabela": m.get("table"),
                     "Última atualização": last_ts_s,
-                    "Linhas": mt.get("row_count"),
+                    "Linhas": int(mt["row_count"]) if pd.notna(mt.get("row_count")) else None,
+                    "Linhas (est.)": int(mt["est_rows"]) if pd.notna(mt.get("est_rows")) else None,
+                    "Última carga": last_insert.tz_convert(TZ).strftime("%d/%m %H:%M") if isinstance(last_insert, pd.Timestamp) else "—",
+                    "Modo": mt.get("mode"),
                     "Coluna TS": m.get("ts_col") or "—",
                     "Notas": (m.get("notes") or "")[:80],
                 })
@@ -520,6 +637,9 @@ with tab_monitors:
                     "Tabela": m.get("table"),
                     "Última atualização": "❌ erro",
                     "Linhas": "❌ erro",
+                    "Linhas (est.)": None,
+                    "Última carga": "—",
+                    "Modo": m.get("metrics_mode") or MONITOR_METRICS_MODE,
                     "Coluna TS": m.get("ts_col") or "—",
                     "Notas": str(e)[:80],
                 })
@@ -555,7 +675,7 @@ with tab_monitors:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # -------- HISTÓRICO --------
-with tab_history:
+if active_tab == tab_history:
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("📊 Histórico de Logins e Erros")
 
@@ -563,7 +683,7 @@ with tab_history:
     st.markdown("### 📅 Filtros")
     col_filter1, col_filter2, col_filter3 = st.columns(3)
     with col_filter1:
-        days_filter = st.selectbox("Período", options=[1, 3, 7, 14, 30], index=2, help="Selecione o número de dias para análise")
+        days_filter = st.selectbox("Período", options=[1, 3, 7, 14, 30, 90, 365], index=2, help="Selecione o número de dias para análise")
     with col_filter2:
         if st.button("📥 Exportar dados", help="Exporta os dados do histórico"):
             if DB_AVAILABLE:
@@ -578,6 +698,14 @@ with tab_history:
                 st.download_button("💾 Download CSV", csv, "historico_erros.csv", "text/csv")
             else:
                 st.warning("Nenhum dado para exportar")
+            if DB_AVAILABLE:
+                # Eventos de erro arquivados no período (dias completos), lidos só das partições do intervalo
+                from monitor_dw.archive import export_parquet_bytes
+                start_day = (pd.Timestamp.now(tz=TZ) - pd.Timedelta(days=days_filter)).strftime("%Y-%m-%d")
+                parquet = export_parquet_bytes("errors", start=start_day)
+                if parquet:
+                    st.download_button("💾 Download Parquet (erros arquivados)", parquet,
+                                       "historico_erros.parquet", "application/vnd.apache.parquet")
     with col_filter3:
         if st.button("🧹 Limpar dados duplicados", help="Remove entradas duplicadas de erros"):
             if DB_AVAILABLE:
@@ -600,8 +728,21 @@ with tab_history:
         else:
             st.warning("⚠️ Módulo de banco de dados não disponível")
     
+    if DB_AVAILABLE:
+        with st.expander("🗄️ Arquivo Parquet"):
+            from monitor_dw.archive import archive_status
+            st.caption("Dias completos exportados por métrica (ARCHIVE_DIR); séries longas são lidas daqui com `read_archive`.")
+            st.dataframe(archive_status(), use_container_width=True, hide_index=True)
+
     # Get error statistics
     if DB_AVAILABLE:
+        if snapshot_source(collected, "retention") is None:
+            # Sem coletor, a retenção/rollup roda em segundo plano a partir daqui (no máximo 1x por hora)
+            from monitor_dw.retention import maybe_run_retention
+            maybe_run_retention()
+        if snapshot_source(collected, "archive") is None:
+            from monitor_dw.archive import maybe_run_archive
+            maybe_run_archive()
         from monitor_dw.db import get_error_stats
         stats = get_error_stats(days_filter)
     else:
@@ -704,20 +845,8 @@ with tab_history:
     
     with col1:
         st.markdown(f"#### 🔐 Logins dos últimos {days_filter} dias")
-        import sqlite3
-        from monitor_dw.config import HISTORY_DB_PATH
-        conn = sqlite3.connect(HISTORY_DB_PATH)
-        conn.execute("PRAGMA encoding = 'UTF-8'")
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT username, COUNT(*) as login_count, MAX(login_time) as last_login
-            FROM user_logins 
-            WHERE login_time >= datetime('now', '-{} days')
-            GROUP BY username
-            ORDER BY login_count DESC
-        """.format(days_filter))
-        login_stats = cursor.fetchall()
-        conn.close()
+        from monitor_dw.db import get_login_stats
+        login_stats = get_login_stats(days_filter)
         
         if login_stats:
             df_logins = pd.DataFrame(login_stats, columns=["Usuário", "Logins", "Último Login"])
@@ -749,13 +878,14 @@ with tab_history:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ======================== SLACK ALERTS ========================
-# Coleta de variáveis dos painéis já renderizados (para não mudar lógica)
-running_over = get_queries_over_threshold(redshift_threshold)
-last_refresh_utc, age_min = get_last_refresh()
-total_abertos, _ = get_open_tickets()
-
-# Registrar chamados do Jira no histórico (backup)
-if total_abertos > 0 and DB_AVAILABLE:
+# Mesmo snapshot usado pelas abas: nenhuma consulta extra às fontes
+running_over = snapshot.running_over
+last_refresh_utc, age_min = snapshot.last_refresh_utc, snapshot.age_min
+total_abertos = snapshot.jira_total
+
+# Registrar chamados do Jira no histórico (no máximo uma vez por intervalo no processo, só mudanças do total;
+# com o Jira fora do ar o total 0 não conta, senão a volta somaria todos os chamados como novos)
+if DB_AVAILABLE and "jira" not in snapshot.errors:
     from monitor_dw.db import log_jira_tickets
     log_jira_tickets(total_abertos)
 
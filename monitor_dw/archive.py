@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivo colunar (Parquet) do histórico local
+
+Cada dia completo de erros, logins, resumos diários, queries rastreadas e
+snapshots de KPIs vira um arquivo em ARCHIVE_DIR/metric=<métrica>/day=<AAAA-MM-DD>/.
+A exportação é incremental (marca d'água por métrica em archive_state) e lê o
+SQLite em blocos de ARCHIVE_CHUNK_ROWS — cada bloco vira um row group, então a
+memória não cresce com o tamanho do dia.
+
+A leitura (read_archive / scan_archive) usa pyarrow.dataset: o filtro de dias
+descarta partições inteiras e os demais filtros são avaliados contra as
+estatísticas de cada row group antes de ler os dados. Séries longas saem
+daqui em vez de carregar o SQLite inteiro no pandas.
+
+Os dias são UTC, exceto daily_summaries, que já é gravado por data local. Só
+entram dias anteriores a hoje (fuso local), e a exportação precisa rodar
+dentro de HISTORY_RAW_DAYS para pegar erros/logins antes do expurgo.
+"""
+
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .config import TZ, ARCHIVE_DIR, ARCHIVE_CHUNK_ROWS, ARCHIVE_INTERVAL_SEC
+from .history import DAILY_SUMMARY_COUNTERS, KPI_SNAPSHOT_COLUMNS, get_history_conn
+from .parallel import run_throttled
+
+# pyarrow é opcional: sem ele o arquivo fica desligado e o restante do painel segue normal
+PYARROW_AVAILABLE = None
+pa = pq = ds = None
+
+
+def _get_pyarrow():
+    """Importa pyarrow só quando necessário"""
+    global PYARROW_AVAILABLE, pa, pq, ds
+    if PYARROW_AVAILABLE is None:
+        try:
+            import pyarrow as pa
+            import pyarrow.dataset as ds
+            import pyarrow.parquet as pq
+            PYARROW_AVAILABLE = True
+        except ImportError:
+            PYARROW_AVAILABLE = False
+            print("⚠️ pyarrow não disponível. Arquivo Parquet desativado.")
+    return PYARROW_AVAILABLE
+
+
+ARCHIVE_DDL = """
+    CREATE TABLE IF NOT EXISTS archive_state (
+        metric TEXT PRIMARY KEY,
+        next_day TEXT NOT NULL
+    )
+"""
+
+
+# ======================== MÉTRICAS ========================
+def _metrics() -> dict:
+    """
+    Por métrica: coluna que define o dia (com índice, quando possível), SELECT
+    de um dia ([d, d+1) como texto) e schema Arrow do arquivo
+    """
+    ts = pa.timestamp("us", tz="UTC")
+    return {
+        "errors": {
+            "day_col": "timestamp",
+            "sql": "SELECT timestamp, error_type, details FROM error_counts "
+                   "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+            "schema": pa.schema([("ts", ts), ("error_type", pa.string()), ("details", pa.string())]),
+        },
+        "logins": {
+            "day_col": "login_time",
+            "sql": "SELECT login_time, username FROM user_logins "
+                   "WHERE login_time >= ? AND login_time < ? ORDER BY login_time",
+            "schema": pa.schema([("ts", ts), ("username", pa.string())]),
+        },
+        "daily_summaries": {
+            "day_col": "date",
+            "sql": f"SELECT date, {', '.join(DAILY_SUMMARY_COUNTERS)} FROM daily_summaries "
+                   "WHERE date >= ? AND date < ?",
+            "schema": pa.schema([("date", pa.date32()), *((c, pa.int64()) for c in DAILY_SUMMARY_COUNTERS)]),
+        },
+        "queries": {
+            "day_col": "ended_at",
+            "sql": "SELECT pid, starttime, user_name, fingerprint, first_seen, last_seen, ended_at, end_state, "
+                   "peak_duration_sec, query_text FROM query_lifecycle "
+                   "WHERE end_state <> 'running' AND ended_at >= ? AND ended_at < ? ORDER BY ended_at",
+            "schema": pa.schema([
+                ("pid", pa.int64()), ("starttime", ts), ("user_name", pa.string()), ("fingerprint", pa.string()),
+                ("first_seen", ts), ("last_seen", ts), ("ended_at", ts), ("end_state", pa.string()),
+                ("peak_duration_sec", pa.float64()), ("query_text", pa.string()),
+            ]),
+        },
+        "kpis": {
+            "day_col": "ts",
+            "sql": f"SELECT ts, {', '.join(KPI_SNAPSHOT_COLUMNS)}, partial_errors FROM kpi_snapshots "
+                   "WHERE ts >= ? AND ts < ? ORDER BY ts",
+            "schema": pa.schema([("ts", ts), *((c, pa.float64()) for c in KPI_SNAPSHOT_COLUMNS),
+                                 ("partial_errors", pa.int64())]),
+        },
+    }
+
+
+METRICS = ("errors", "logins", "daily_summaries", "queries", "kpis")
+_TABLES = {"errors": "error_counts", "logins": "user_logins", "daily_summaries": "daily_summaries",
+           "queries": "query_lifecycle", "kpis": "kpi_snapshots"}
+
+
+def _to_batch(rows: list[tuple], schema) -> "pa.RecordBatch":
+    """Bloco do SQLite -> RecordBatch tipado (textos de data viram timestamp UTC / date)"""
+    df = pd.DataFrame.from_records(rows, columns=schema.names)
+    for field in schema:
+        if pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name], utc=True, format="ISO8601")
+        elif pa.types.is_date32(field.type):
+            df[field.name] = pd.to_datetime(df[field.name]).dt.date
+    return pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+# ======================== EXPORTAÇÃO ========================
+def _day_path(metric: str, day: str, root: str) -> str:
+    return os.path.join(root, f"metric={metric}", f"day={day}")
+
+
+def _export_day(conn, metric: str, spec: dict, day: str, root: str) -> int:
+    """Grava um dia (sobrescreve de forma atômica); dia sem linhas não gera arquivo"""
+    next_day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    cur = conn.execute(spec["sql"], (day, next_day))
+    rows = cur.fetchmany(ARCHIVE_CHUNK_ROWS)
+    if not rows:
+        return 0
+    directory = _day_path(metric, day, root)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, ".part-0.parquet.tmp")
+    total = 0
+    try:
+        with pq.ParquetWriter(tmp_path, spec["schema"], compression="zstd") as writer:
+            while rows:
+                writer.write_batch(_to_batch(rows, spec["schema"]))
+                total += len(rows)
+                rows = cur.fetchmany(ARCHIVE_CHUNK_ROWS)
+        os.replace(tmp_path, os.path.join(directory, "part-0.parquet"))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return total
+
+
+def _pending_days(conn, metric: str, spec: dict, cutoff: str):
+    """Dias com linhas em [marca d'água, cutoff), pulando os vazios pelo índice"""
+    row = conn.execute("SELECT next_day FROM archive_state WHERE metric = ?", (metric,)).fetchone()
+    day = row[0] if row else None
+    table, col = _TABLES[metric], spec["day_col"]
+    while True:
+        first = conn.execute(
+            f"SELECT MIN({col}) FROM {table} WHERE {col} >= ?", (day or "",)
+        ).fetchone()[0]
+        if first is None or first[:10] >= cutoff:
+            return
+        day = first[:10]
+        yield day
+        day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def export_archive(root: str = ARCHIVE_DIR, metrics: tuple[str, ...] = METRICS) -> dict:
+    """Exporta os dias completos ainda não arquivados de cada métrica"""
+    if not _get_pyarrow():
+        return {"enabled": False}
+    t0 = time.perf_counter()
+    cutoff = datetime.now(TZ).strftime("%Y-%m-%d")
+    specs = _metrics()
+    conn = get_history_conn()
+    with conn:
+        conn.execute(ARCHIVE_DDL)
+    result = {}
+    for metric in metrics:
+        spec = specs[metric]
+        days = rows = 0
+        for day in list(_pending_days(conn, metric, spec, cutoff)):
+            rows += _export_day(conn, metric, spec, day, root)
+            days += 1
+        with conn:
+            conn.execute(
+                "INSERT INTO archive_state (metric, next_day) VALUES (?, ?) "
+                "ON CONFLICT (metric) DO UPDATE SET next_day = excluded.next_day",
+                (metric, cutoff),
+            )
+        result[metric] = {"days": days, "rows": rows}
+    result["elapsed_sec"] = round(time.perf_counter() - t0, 3)
+    print(f"✅ Arquivo Parquet: {result}")
+    return result
+
+
+def maybe_run_archive() -> None:
+    """Sem coletor: dispara export_archive em segundo plano, no máximo 1x por ARCHIVE_INTERVAL_SEC"""
+    def _start():
+        threading.Thread(target=_safe_run, name="history-archive", daemon=True).start()
+        return True
+
+    run_throttled("history_archive", ARCHIVE_INTERVAL_SEC, _start)
+
+
+def _safe_run() -> None:
+    try:
+        export_archive()
+    except Exception as e:
+        print(f"⚠️ Arquivo Parquet: {e}")
+
+
+# ======================== LEITURA ========================
+def _dataset(metric: str, root: str):
+    path = os.path.join(root, f"metric={metric}")
+    if not os.path.isdir(path):
+        return None
+    # ".part-0.parquet.tmp" de uma gravação em andamento é ignorado (prefixo ".")
+    partitioning = ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+    return ds.dataset(path, format="parquet", partitioning=partitioning, schema=_schema(metric))
+
+
+def _schema(metric: str):
+    """Schema do arquivo + coluna de partição"""
+    return _metrics()[metric]["schema"].append(pa.field("day", pa.string()))
+
+
+def _filter(start: str | None, end: str | None, filters):
+    """
+    Intervalo de dias (inclusivo) + filtros do usuário: uma expressão do
+    pyarrow (ds.field("error_type") == "x") ou a lista DNF do pyarrow.parquet
+    ([("error_type", "=", "x")])
+    """
+    expr = None
+    if start:
+        expr = ds.field("day") >= start
+    if end:
+        expr = (ds.field("day") <= end) if expr is None else expr & (ds.field("day") <= end)
+    if filters is not None:
+        extra = filters if isinstance(filters, ds.Expression) else pq.filters_to_expression(filters)
+        expr = extra if expr is None else expr & extra
+    return expr
+
+
+def scan_archive(metric: str, start: str | None = None, end: str | None = None, columns: list[str] | None = None,
+                 filters=None, root: str = ARCHIVE_DIR):
+    """Itera RecordBatches de uma métrica com partições/row groups já podados pelos filtros"""
+    if not _get_pyarrow():
+        raise RuntimeError("pyarrow não disponível")
+    if metric not in METRICS:
+        raise ValueError(f"Métrica desconhecida no arquivo: {metric!r}")
+    dataset = _dataset(metric, root)
+    if dataset is None:
+        return
+    yield from dataset.to_batches(columns=columns, filter=_filter(start, end, filters),
+                                  batch_size=ARCHIVE_CHUNK_ROWS)
+
+
+def read_archive(metric: str, start: str | None = None, end: str | None = None, columns: list[str] | None = None,
+                 filters=None, root: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """
+    Lê uma métrica do arquivo como DataFrame
+    Ex.: read_archive("errors", "2024-01-01", "2024-03-31", filters=[("error_type", "=", "redshift_connection")])
+    """
+    batches = list(scan_archive(metric, start, end, columns, filters, root))
+    if not batches:
+        schema = _schema(metric)
+        empty = schema if columns is None else pa.schema([schema.field(c) for c in columns])
+        return empty.empty_table().to_pandas()
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+def export_parquet_bytes(metric: str, start: str | None = None, end: str | None = None,
+                         filters=None, root: str = ARCHIVE_DIR) -> bytes | None:
+    """Trecho do arquivo num único Parquet em memória (download na UI); None se vazio"""
+    if not _get_pyarrow():
+        return None
+    batches = list(scan_archive(metric, start, end, None, filters, root))
+    if not batches:
+        return None
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_batches(batches), buf, compression="zstd")
+    return buf.getvalue()
+
+
+def archive_status(root: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """Dias, intervalo e tamanho em disco de cada métrica arquivada"""
+    rows = []
+    for metric in METRICS:
+        path = os.path.join(root, f"metric={metric}")
+        days = sorted(d[4:] for d in os.listdir(path) if d.startswith("day=")) if os.path.isdir(path) else []
+        size = sum(os.path.getsize(os.path.join(dp, f)) for dp, _, files in os.walk(path) for f in files) if days else 0
+        rows.append({
+            "Métrica": metric,
+            "Dias": len(days),
+            "Primeiro dia": days[0] if days else "—",
+            "Último dia": days[-1] if days else "—",
+            "Tamanho (MB)": round(size / 1024 / 1024, 2),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker por fonte externa (Redshift, Postgres, Jira, Kestra, Slack)
+
+Depois de BREAKER_FAILURE_THRESHOLD falhas seguidas o circuito abre e as
+chamadas falham na hora (CircuitOpenError), sem esperar timeout de conexão
+nem dormir em retry na thread do render. Passada a pausa (com jitter, dobrando
+a cada reabertura até BREAKER_OPEN_MAX_SEC), uma única chamada de teste passa
+(half-open): sucesso fecha o circuito, falha reabre.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+from .config import TZ, BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SEC, BREAKER_OPEN_MAX_SEC
+
+SOURCE_LABELS = {
+    "redshift": "Redshift",
+    "postgres": "Postgres (Power BI)",
+    "jira": "Jira",
+    "kestra": "Kestra",
+    "slack": "Slack",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Fonte com circuito aberto: a chamada nem chegou a ser feita"""
+
+    def __init__(self, source: str, retry_in: float | None = None):
+        when = "teste da fonte em andamento" if retry_in is None else f"nova tentativa em {retry_in:.0f}s"
+        super().__init__(f"{SOURCE_LABELS.get(source, source)} indisponível (circuito aberto, {when})")
+        self.source = source
+        self.retry_in = retry_in
+
+
+def is_source_failure(e: BaseException) -> bool:
+    """
+    Só falhas da fonte contam para o circuito: erros de quem chama
+    (SQL inválido, dado inválido, HTTP 4xx) mostram que a fonte respondeu
+    """
+    pgcode = getattr(e, "pgcode", None)
+    if pgcode and pgcode[:2] in ("22", "23", "42"):
+        return False
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+def backoff_delay(attempt: int, base_sec: float, max_sec: float) -> float:
+    """Backoff exponencial com jitter completo: sessões não tentam todas no mesmo instante"""
+    return random.uniform(0, min(max_sec, base_sec * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Estados closed → open → half_open (uma chamada de teste) → closed/open"""
+
+    def __init__(self, source: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_sec: float = BREAKER_OPEN_SEC, open_max_sec: float = BREAKER_OPEN_MAX_SEC):
+        self.source = source
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_sec = open_sec
+        self.open_max_sec = open_max_sec
+
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0        # falhas seguidas
+        self._opens = 0          # aberturas seguidas, sem sucesso entre elas (dobra a pausa)
+        self._open_until = 0.0
+        self._probing = False
+        self.last_success: datetime | None = None
+        self.last_failure: datetime | None = None
+        self.last_error: str | None = None
+        self.stats = {"calls": 0, "failed": 0, "rejected": 0, "opened": 0}
+
+    # ---------- internos ----------
+    def _open(self) -> None:
+        self._opens += 1
+        pause = min(self.open_max_sec, self.open_sec * 2 ** (self._opens - 1))
+        pause = random.uniform(pause / 2, pause)
+        self.state = "open"
+        self._open_until = time.monotonic() + pause
+        self._probing = False
+        self.stats["opened"] += 1
+        print(f"⚠️ Circuito de {self.source} aberto por {pause:.0f}s: {self.last_error}")
+
+    # ---------- API ----------
+    def before_call(self) -> None:
+        """Libera a chamada ou levanta CircuitOpenError (aberto, ou teste do half-open já em andamento)"""
+        with self._lock:
+            if self.state == "open":
+                remaining = self._open_until - time.monotonic()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.source, remaining)
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.source)
+                self._probing = True
+            self.stats["calls"] += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print(f"✅ Circuito de {self.source} fechado")
+            self.state = "closed"
+            self.failures = 0
+            self._opens = 0
+            self._probing = False
+            self.last_success = datetime.now(TZ)
+
+    def record_reachable(self) -> None:
+        """A fonte respondeu, mas com erro de quem chamou: fecha o circuito sem contar como valor bom"""
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._opens = 0
+            self._probing = False
+
+    def record_failure(self, error) -> None:
+        with self._lock:
+            self.failures += 1
+            self.stats["failed"] += 1
+            self.last_failure = datetime.now(TZ)
+            self.last_error = str(error)[:200]
+            # Já aberto: falhas de chamadas que estavam em andamento só contam, não reabrem
+            # (cada reabertura dobra a pausa)
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self._open()
+
+    def release(self) -> None:
+        """Chamada interrompida sem resultado (ex.: rerun do Streamlit): só libera o teste do half-open"""
+        with self._lock:
+            self._probing = False
+
+    def record_error(self, e: BaseException) -> None:
+        """Classifica a exceção da chamada: falha da fonte, erro de quem chamou ou interrupção"""
+        if not isinstance(e, Exception):
+            self.release()
+        elif is_source_failure(e):
+            self.record_failure(e)
+        else:
+            self.record_reachable()
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) atrás do circuito"""
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def info(self) -> dict:
+        with self._lock:
+            state = self.state
+            if state == "open" and time.monotonic() >= self._open_until:
+                state = "half_open"   # próxima chamada será o teste
+            return {
+                "source": self.source,
+                "state": state,
+                "failures": self.failures,
+                "retry_in": max(0.0, self._open_until - time.monotonic()) if state == "open" else None,
+                "last_success": self.last_success,
+                "last_failure": self.last_failure,
+                "last_error": self.last_error,
+                **self.stats,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(source: str) -> CircuitBreaker:
+    """Circuito da fonte (um por processo)"""
+    with _breakers_lock:
+        breaker = _breakers.get(source)
+        if breaker is None:
+            breaker = _breakers[source] = CircuitBreaker(source)
+        return breaker
+
+
+def breaker_stats() -> dict:
+    """Estado e contadores de todas as fontes conhecidas"""
+    return {source: get_breaker(source).info() for source in SOURCE_LABELS}
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de resultados por fonte com stale-while-revalidate
+
+Substitui o st.cache_data de TTL fixo nos serviços. Dentro do TTL da fonte o
+valor sai direto do cache; vencido, mas dentro da janela de stale, o valor
+antigo volta na hora e uma única thread recarrega em segundo plano. Só espera
+pela consulta quem não encontra nenhum valor utilizável (primeira carga ou
+valor velho demais), e sessões concorrentes com a mesma chave esperam uma
+consulta só (single_flight). TTLs e janelas ficam em CACHE_SOURCES (config.py).
+"""
+
+import copy
+import functools
+import inspect
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from .config import CACHE_SOURCES, CACHE_MAX_ENTRIES, CACHE_SWR_ENABLED
+from .parallel import single_flight, single_flight_stats
+
+_STAT_KEYS = ("hits", "stale_hits", "misses", "refreshes", "refresh_errors", "fallbacks", "evictions")
+_MISSING = object()
+
+_lock = threading.Lock()
+# (fonte, função, argumentos) -> {"value", "stored_at", "refreshing", "retry_at"}; ordem = LRU
+_entries: OrderedDict = OrderedDict()
+_stats: dict[str, dict] = {}
+_generation = 0   # incrementado a cada limpeza: recargas em andamento não regravam valores descartados
+
+
+def _source_stats(source: str) -> dict:
+    return _stats.setdefault(source, dict.fromkeys(_STAT_KEYS, 0))
+
+
+def _freeze(value):
+    """Argumentos mutáveis (dict/list/set) viram tuplas para compor a chave"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+def _make_key(source: str, name: str, sig: inspect.Signature, args: tuple, kwargs: dict):
+    """Chave estável (defaults aplicados); None quando os argumentos não têm como virar chave"""
+    bound = sig.bind(*args, **kwargs)
+    bound.apply_defaults()
+    key = (source, name, _freeze(tuple(bound.arguments.items())))
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        pass
+    try:
+        return (source, name, pickle.dumps(tuple(bound.arguments.items())))
+    except Exception:
+        return None
+
+
+def _store(source: str, key, value, generation: int) -> None:
+    with _lock:
+        if generation != _generation:
+            entry = _entries.get(key)
+            if entry is not None:
+                entry["refreshing"] = False
+            return
+        _entries[key] = {"value": value, "stored_at": time.monotonic(), "refreshing": False, "retry_at": 0.0}
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_MAX_ENTRIES:
+            old_key, _ = _entries.popitem(last=False)
+            _source_stats(old_key[0])["evictions"] += 1
+
+
+def _load(source: str, key, fn, args: tuple, kwargs: dict, generation: int):
+    """Consulta e grava; roda dentro do single_flight, então o valor já está no cache quando os demais acordam"""
+    value = fn(*args, **kwargs)
+    _store(source, key, value, generation)
+    return value
+
+
+def _refresh(source: str, key, fn, args: tuple, kwargs: dict, generation: int) -> None:
+    """Recarga em segundo plano; se falhar, o valor antigo continua valendo até a próxima tentativa"""
+    ttl, _ = CACHE_SOURCES[source]
+    try:
+        single_flight(source, key, _load, source, key, fn, args, kwargs, generation)
+    except Exception as e:
+        with _lock:
+            _source_stats(source)["refresh_errors"] += 1
+            entry = _entries.get(key)
+            if entry is not None:
+                entry["refreshing"] = False
+                entry["retry_at"] = time.monotonic() + ttl
+        print(f"⚠️ Falha ao recarregar cache de {source}: {e}")
+        return
+    with _lock:
+        _source_stats(source)["refreshes"] += 1
+
+
+def _lookup(source: str, key, fn, args: tuple, kwargs: dict):
+    ttl, stale_sec = CACHE_SOURCES[source]
+    now = time.monotonic()
+    refresh = False
+    with _lock:
+        stats = _source_stats(source)
+        entry = _entries.get(key)
+        if entry is not None:
+            age = now - entry["stored_at"]
+            if age < ttl:
+                _entries.move_to_end(key)
+                stats["hits"] += 1
+                return True, entry["value"], _generation
+            if CACHE_SWR_ENABLED and age < ttl + stale_sec:
+                _entries.move_to_end(key)
+                stats["stale_hits"] += 1
+                # Uma recarga por chave (as demais sessões só leem o valor antigo)
+                if not entry["refreshing"] and now >= entry["retry_at"]:
+                    entry["refreshing"] = refresh = True
+                value, generation = entry["value"], _generation
+            else:
+                stats["misses"] += 1
+                return False, entry["value"], _generation   # velho demais, mas é o último valor bom
+        else:
+            stats["misses"] += 1
+            return False, _MISSING, _generation
+    if refresh:
+        threading.Thread(target=_refresh, args=(source, key, fn, args, kwargs, generation),
+                         name=f"cache-refresh-{source}", daemon=True).start()
+    return True, value, generation
+
+
+def get_or_load(source: str, key, fn, args: tuple = (), kwargs: dict | None = None):
+    """
+    Valor de fn(*args, **kwargs) pelo cache da fonte
+    Sem valor utilizável, sessões concorrentes com a mesma chave esperam uma única consulta;
+    se ela falhar (fonte fora do ar, circuito aberto), volta o último valor bom, de qualquer idade
+    Devolve sempre uma cópia (como o st.cache_data): quem chama pode alterar o resultado
+    """
+    kwargs = kwargs or {}
+    if key is None:
+        return fn(*args, **kwargs)
+    found, value, generation = _lookup(source, key, fn, args, kwargs)
+    if not found:
+        try:
+            value = single_flight(source, key, _load, source, key, fn, args, kwargs, generation)
+        except Exception as e:
+            if value is _MISSING:
+                raise
+            with _lock:
+                _source_stats(source)["fallbacks"] += 1
+            print(f"⚠️ {source}: servindo último valor bom do cache ({e})")
+    return copy.deepcopy(value)
+
+
+def source_cache(source: str):
+    """
+    Decorator no lugar de @st.cache_data(ttl=...): TTL e janela de stale vêm de CACHE_SOURCES[source]
+    A função decorada ganha .clear() (só as entradas dela)
+    """
+    if source not in CACHE_SOURCES:
+        raise ValueError(f"Fonte de cache desconhecida: {source}")
+
+    def decorator(fn):
+        sig = inspect.signature(fn)
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return get_or_load(source, _make_key(source, name, sig, args, kwargs), fn, args, kwargs)
+
+        wrapper.clear = lambda: clear_cache(source, name)
+        return wrapper
+
+    return decorator
+
+
+def clear_cache(source: str | None = None, name: str | None = None) -> int:
+    """Descarta entradas (todas, de uma fonte ou de uma função); retorna quantas saíram"""
+    global _generation
+    with _lock:
+        keys = [k for k in _entries if (source is None or k[0] == source) and (name is None or k[1] == name)]
+        for k in keys:
+            del _entries[k]
+        _generation += 1
+    return len(keys)
+
+
+def cache_stats() -> dict:
+    """
+    Contadores por fonte (hits, stale_hits, misses, refreshes, refresh_errors, fallbacks, evictions),
+    entradas e coalesced: consultas poupadas porque outra sessão já buscava a mesma chave
+    """
+    flights = single_flight_stats()
+    with _lock:
+        entries: dict[str, int] = {}
+        for k in _entries:
+            entries[k[0]] = entries.get(k[0], 0) + 1
+        return {
+            source: {
+                "ttl_sec": CACHE_SOURCES[source][0],
+                "stale_sec": CACHE_SOURCES[source][1],
+                "entries": entries.get(source, 0),
+                **_source_stats(source),
+                "coalesced": flights.get(source, {}).get("coalesced", 0),
+            }
+            for source in CACHE_SOURCES
+        }
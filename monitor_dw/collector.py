@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Coletor em segundo plano do Monitor DW
+
+Uso: python -m monitor_dw.collector [--once] [--threshold MIN]
+
+Consulta Redshift, Postgres, Jira e Kestra em um cronograma próprio e publica
+um snapshot versionado em disco. A aplicação Streamlit só lê esse snapshot,
+então a carga nas fontes não depende de quantas pessoas abrem o painel.
+"""
+
+import argparse
+import io
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from .config import (
+    COLLECTOR_SNAPSHOT_PATH, COLLECTOR_TICK_SEC, COLLECTOR_MAX_AGE_SEC,
+    COLLECTOR_JOB_INTERVALS, REDSHIFT_THRESHOLD_MIN,
+)
+from .services.snapshot import FETCHERS
+
+SNAPSHOT_FORMAT = 1
+
+# Cache do último snapshot lido (por mtime) para não decodificar o JSON a cada rerun
+_read_lock = threading.Lock()
+_read_cache = {"mtime": None, "data": None}
+
+
+# ======================== SERIALIZAÇÃO ========================
+def _encode(obj):
+    """Converte tipos do pandas/datetime em estruturas JSON marcadas"""
+    if isinstance(obj, pd.DataFrame):
+        return {"__df__": obj.to_json(orient="split", date_format="iso", date_unit="s")}
+    if isinstance(obj, (pd.Timestamp, datetime)):
+        return {"__ts__": obj.isoformat()}
+    if hasattr(obj, "item"):  # escalares numpy
+        return obj.item()
+    raise TypeError(f"Tipo não serializável no snapshot: {type(obj).__name__}")
+
+
+def _decode(d: dict):
+    """Reverte as marcações feitas por _encode"""
+    if "__ts__" in d:
+        return pd.Timestamp(d["__ts__"])
+    if "__df__" in d:
+        return pd.read_json(io.StringIO(d["__df__"]), orient="split")
+    return d
+
+
+# ======================== JOBS DE COLETA ========================
+def _collect_kpis(threshold_min: int) -> dict:
+    kpis = FETCHERS["kpis"](threshold_min)
+    if not kpis:
+        raise RuntimeError("get_all_kpis não retornou dados")
+    return kpis
+
+
+def _collect_tracker(threshold_min: int) -> dict:
+    from .services.query_tracker import poll_tracker
+    return poll_tracker()
+
+
+def _collect_wlm(threshold_min: int) -> dict:
+    from .services.wlm_monitor import sample_wlm
+    return sample_wlm()
+
+
+def _collect_autocancel(threshold_min: int) -> dict:
+    from .services.auto_cancel import enforce_policy
+    return enforce_policy()
+
+
+def _collect_archive(threshold_min: int) -> dict:
+    from .archive import export_archive
+    return export_archive()
+
+
+def _collect_retention(threshold_min: int) -> dict:
+    from .retention import run_retention
+    return run_retention()
+
+
+# (nome, função) — o intervalo de cada job vem de COLLECTOR_JOB_INTERVALS
+JOBS = [
+    ("redshift", FETCHERS["redshift"]),
+    ("powerbi", FETCHERS["powerbi"]),
+    ("jira", FETCHERS["jira"]),
+    ("kpis", _collect_kpis),
+    ("kestra", FETCHERS["kestra"]),
+    ("tracker", _collect_tracker),
+    ("wlm", _collect_wlm),
+    ("autocancel", _collect_autocancel),
+    ("archive", _collect_archive),
+    ("retention", _collect_retention),
+]
+
+
+# ======================== PUBLICAÇÃO / LEITURA ========================
+def publish_snapshot(snapshot: dict, path: str = COLLECTOR_SNAPSHOT_PATH) -> None:
+    """Grava o snapshot de forma atômica (arquivo temporário + rename)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, default=_encode, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(max_age_sec: int | None = COLLECTOR_MAX_AGE_SEC,
+                  path: str = COLLECTOR_SNAPSHOT_PATH) -> dict | None:
+    """
+    Lê o último snapshot publicado pelo coletor
+    Retorna None se não existir, estiver corrompido ou mais velho que max_age_sec
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _read_lock:
+        if _read_cache["mtime"] != mtime:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f, object_hook=_decode)
+            except Exception as e:
+                print(f"⚠️ Snapshot do coletor ilegível: {e}")
+                return None
+            if data.get("format") != SNAPSHOT_FORMAT:
+                return None
+            _read_cache["mtime"] = mtime
+            _read_cache["data"] = data
+        data = _read_cache["data"]
+
+    if max_age_sec is not None:
+        age = (pd.Timestamp.now(tz="UTC") - data["published_at"]).total_seconds()
+        if age > max_age_sec:
+            return None
+    return data
+
+
+def snapshot_source(snapshot: dict | None, name: str):
+    """Retorna os dados de uma fonte do snapshot, ou None se ausente/sem sucesso"""
+    if not snapshot:
+        return None
+    entry = snapshot.get("sources", {}).get(name)
+    if not entry or entry.get("data") is None:
+        return None
+    return entry["data"]
+
+
+# ======================== LOOP PRINCIPAL ========================
+def run_collector(threshold_min: int = REDSHIFT_THRESHOLD_MIN, once: bool = False,
+                  stop_event: threading.Event | None = None,
+                  path: str = COLLECTOR_SNAPSHOT_PATH) -> dict:
+    """Executa os jobs no seu cronograma e publica um snapshot a cada rodada com mudanças"""
+    stop_event = stop_event or threading.Event()
+    started_at = datetime.now(timezone.utc)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "version": 0,
+        "pid": os.getpid(),
+        "started_at": started_at,
+        "published_at": started_at,
+        "sources": {},
+    }
+    next_run = {name: 0.0 for name, _ in JOBS}
+
+    while not stop_event.is_set():
+        ran_any = False
+        for name, fn in JOBS:
+            now_mono = time.monotonic()
+            if now_mono < next_run[name]:
+                continue
+            next_run[name] = now_mono + COLLECTOR_JOB_INTERVALS.get(name, 60)
+            ran_any = True
+
+            t0 = time.perf_counter()
+            entry = snapshot["sources"].get(name, {"data": None})
+            try:
+                entry = {
+                    "data": fn(threshold_min),
+                    "collected_at": datetime.now(timezone.utc),
+                    "duration_sec": round(time.perf_counter() - t0, 3),
+                    "error": None,
+                }
+            except Exception as e:
+                # Mantém o último valor bom e registra o erro
+                entry = {**entry, "error": str(e)[:500], "failed_at": datetime.now(timezone.utc)}
+                print(f"❌ Coletor: falha em '{name}': {e}")
+            snapshot["sources"][name] = entry
+
+        if ran_any:
+            snapshot["version"] += 1
+            snapshot["published_at"] = datetime.now(timezone.utc)
+            try:
+                publish_snapshot(snapshot, path)
+            except Exception as e:
+                print(f"❌ Coletor: falha ao publicar snapshot: {e}")
+
+        if once:
+            break
+        stop_event.wait(COLLECTOR_TICK_SEC)
+
+    return snapshot
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Coletor em segundo plano do Monitor DW")
+    parser.add_argument("--once", action="store_true", help="Executa uma rodada de coleta e sai")
+    parser.add_argument("--threshold", type=int, default=REDSHIFT_THRESHOLD_MIN,
+                        help="Limite (min) para queries longas no Redshift")
+    parser.add_argument("--path", default=COLLECTOR_SNAPSHOT_PATH, help="Arquivo do snapshot")
+    args = parser.parse_args(argv)
+
+    stop_event = threading.Event()
+
+    def _stop(signum, frame):
+        print("🛑 Coletor: encerrando...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    print(f"🚀 Coletor iniciado (pid={os.getpid()}, snapshot={args.path})")
+    snap = run_collector(args.threshold, once=args.once, stop_event=stop_event, path=args.path)
+    print(f"✅ Coletor finalizado na versão {snap['version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,7 +3,7 @@
 Configurações e constantes do Monitor DW
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 
 # Usar zoneinfo padrão do Python 3.9+
@@ -12,14 +12,54 @@ from zoneinfo import ZoneInfo
 # ======================== CONFIGURAÇÕES GERAIS ========================
 TZ = ZoneInfo("America/Sao_Paulo")
 HISTORY_DB_PATH = "monitor_history.db"
+HISTORY_BUSY_TIMEOUT_SEC = float(os.getenv("HISTORY_BUSY_TIMEOUT_SEC", "10"))  # espera por lock de escrita no SQLite
+HISTORY_POOL_MAX_IDLE = int(os.getenv("HISTORY_POOL_MAX_IDLE", "4"))           # conexões SQLite livres mantidas para reuso
+HISTORY_WRITER_ASYNC = os.getenv("HISTORY_WRITER_ASYNC", "1") == "1"            # eventos gravados por thread em segundo plano
+HISTORY_FLUSH_WINDOW_SEC = float(os.getenv("HISTORY_FLUSH_WINDOW_SEC", "0.5"))  # janela de agrupamento de cada lote
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))                # acima disso, eventos são descartados
+HISTORY_BATCH_MAX = int(os.getenv("HISTORY_BATCH_MAX", "500"))
+HISTORY_RAW_DAYS = int(os.getenv("HISTORY_RAW_DAYS", "14"))          # eventos brutos (erros/logins)
+HISTORY_HOURLY_DAYS = int(os.getenv("HISTORY_HOURLY_DAYS", "90"))    # rollups por hora; depois só por dia
+HISTORY_RETENTION_INTERVAL_SEC = int(os.getenv("HISTORY_RETENTION_INTERVAL_SEC", "3600"))
+HISTORY_ROLLUP_MAX_DAYS = int(os.getenv("HISTORY_ROLLUP_MAX_DAYS", "31"))  # trecho agregado por rodada (recuperação de atraso)
+HISTORY_DELETE_BATCH = int(os.getenv("HISTORY_DELETE_BATCH", "5000"))      # linhas por DELETE
+HISTORY_DELETE_MAX_BATCHES = int(os.getenv("HISTORY_DELETE_MAX_BATCHES", "20"))
+HISTORY_VACUUM_PAGES = int(os.getenv("HISTORY_VACUUM_PAGES", "2000"))     # páginas livres devolvidas por rodada (incremental_vacuum)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", ".archive")                    # Parquet particionado por métrica/dia
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "50000"))    # linhas lidas do SQLite por row group
+ARCHIVE_INTERVAL_SEC = int(os.getenv("ARCHIVE_INTERVAL_SEC", "3600"))
 USERS_DB_PATH = os.getenv("USERS_DB_PATH", ".users.json")
 
 # ======================== THRESHOLDS E LIMITES ========================
 REDSHIFT_THRESHOLD_MIN = 10     # queries > 10 min
 REFRESH_ALERT_MIN = 180         # refresh > 180 min
 AUTO_REFRESH_SEC = 60
+REDSHIFT_PROBE_TTL_SEC = int(os.getenv("REDSHIFT_PROBE_TTL_SEC", "30"))  # memo da leitura do stv_recents
+TRACKER_MIN_DURATION_SEC = int(os.getenv("TRACKER_MIN_DURATION_SEC", "60"))  # queries rastreadas (ciclo de vida)
+TRACKER_POLL_SEC = int(os.getenv("TRACKER_POLL_SEC", "30"))
+WLM_SAMPLE_SEC = int(os.getenv("WLM_SAMPLE_SEC", "30"))             # cadência das amostras do WLM
+WLM_RETENTION_DAYS = int(os.getenv("WLM_RETENTION_DAYS", "7"))
+JIRA_TICKETS_LOG_SEC = int(os.getenv("JIRA_TICKETS_LOG_SEC", "300"))  # registro do total de chamados no histórico
 KPI_ALERT_PCT = float(os.getenv("KPI_ALERT_PCT", "0.20"))
 
+# ======================== AUTO-CANCELAMENTO (REDSHIFT) ========================
+AUTO_CANCEL_ENABLED = os.getenv("AUTO_CANCEL_ENABLED", "0") == "1"     # liga o motor de regras no coletor
+AUTO_CANCEL_DRY_RUN = os.getenv("AUTO_CANCEL_DRY_RUN", "1") == "1"     # só audita, não cancela
+AUTO_CANCEL_POLICY_PATH = os.getenv("AUTO_CANCEL_POLICY_PATH", ".auto_cancel_policy.json")
+AUTO_CANCEL_MAX_ATTEMPTS = int(os.getenv("AUTO_CANCEL_MAX_ATTEMPTS", "3"))  # tentativas por query antes de desistir
+
+# ======================== KPIs ========================
+KPI_PARALLEL = os.getenv("KPI_PARALLEL", "1") == "1"                    # consultas de KPI em paralelo
+KPI_QUERY_TIMEOUT_SEC = float(os.getenv("KPI_QUERY_TIMEOUT_SEC", "45"))  # timeout de cada consulta
+KPI_QUERY_MODE = os.getenv("KPI_QUERY_MODE", "standard")  # "standard" | "fused" (dia/mês/top em uma leitura) | "incremental" (dia por watermark)
+KPI_INCREMENTAL_OVERLAP_MIN = int(os.getenv("KPI_INCREMENTAL_OVERLAP_MIN", "5"))             # minutos relidos a cada ciclo (linhas atrasadas)
+KPI_INCREMENTAL_FULL_REFRESH_SEC = int(os.getenv("KPI_INCREMENTAL_FULL_REFRESH_SEC", "900"))  # releitura completa do dia
+
+# ======================== KESTRA ========================
+KESTRA_FLOW_IDS = [f.strip() for f in os.getenv("KESTRA_FLOW_IDS", "").split(",") if f.strip()]  # flows monitorados (vazio = os primeiros da API)
+KESTRA_MAX_FLOWS = int(os.getenv("KESTRA_MAX_FLOWS", "5"))                  # flows monitorados quando KESTRA_FLOW_IDS está vazio
+KESTRA_RECENT_EXECUTIONS = int(os.getenv("KESTRA_RECENT_EXECUTIONS", "5"))  # execuções recentes por flow no snapshot
+
 # ======================== CONSTANTES DE NEGÓCIO ========================
 FIRST_ORDER_MAGENTO = "2023-06-20"
 
@@ -28,6 +68,74 @@ CACHE_TTL_SHORT = 5    # 5 segundos para queries críticas
 CACHE_TTL_MEDIUM = 60  # 1 minuto para dados menos críticos
 CACHE_TTL_LONG = 300   # 5 minutos para dados estáticos
 
+CACHE_SWR_ENABLED = os.getenv("CACHE_SWR_ENABLED", "1") == "1"   # serve o valor vencido enquanto recarrega em segundo plano
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))   # LRU do cache de resultados (todas as fontes)
+CACHE_SOURCES = {   # fonte: (TTL em s, janela em s em que o valor vencido ainda é servido)
+    "redshift": (5, 60),
+    "redshift_probe": (REDSHIFT_PROBE_TTL_SEC, 60),
+    "postgres": (5, 60),
+    "queries": (CACHE_TTL_MEDIUM, 300),
+    "monitors": (CACHE_TTL_MEDIUM, 300),
+    "kpis": (60, 120),
+    "jira": (60, 300),
+    "kestra_flows": (30, 300),
+    "kestra": (10, 120),
+    "kestra_status": (5, 60),
+}
+# Espera máxima de quem aguarda a mesma consulta de outra sessão (single_flight), por fonte:
+# o timeout da própria consulta com folga; passou disso, desiste (o cache serve o último valor bom)
+SINGLE_FLIGHT_WAIT_SEC = {
+    "kpis": KPI_QUERY_TIMEOUT_SEC + 15,
+    "jira": 30,            # requests com timeout=12
+    "kestra_flows": 15,    # requests com timeout=10
+    "kestra": 15,
+    "kestra_status": 15,
+}
+SINGLE_FLIGHT_WAIT_DEFAULT_SEC = float(os.getenv("SINGLE_FLIGHT_WAIT_DEFAULT_SEC", "120"))  # Redshift/Postgres e demais
+
+CATALOG_TTL_SEC = int(os.getenv("CATALOG_TTL_SEC", "600"))  # catálogo do Redshift (schemas/tabelas/colunas)
+MONITOR_BATCH_CHUNK = int(os.getenv("MONITOR_BATCH_CHUNK", "25"))  # monitores por consulta UNION ALL
+MONITOR_METRICS_MODE = os.getenv("MONITOR_METRICS_MODE", "estimated")  # padrão dos monitores: exact | estimated | sampled
+MONITOR_SAMPLED_EXACT_SEC = int(os.getenv("MONITOR_SAMPLED_EXACT_SEC", "3600"))  # COUNT(*) exato no modo sampled
+
+# ======================== POOL DE CONEXÕES ========================
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))                       # conexões por fonte
+DB_POOL_MAX_LIFETIME_SEC = int(os.getenv("DB_POOL_MAX_LIFETIME_SEC", "1800"))    # recicla conexões antigas
+DB_POOL_CHECKOUT_TIMEOUT_SEC = float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT_SEC", "30"))
+DB_POOL_HEALTH_CHECK_IDLE_SEC = 30  # testa com SELECT 1 conexões ociosas há mais que isso
+
+# ======================== CIRCUIT BREAKER ========================
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))   # falhas seguidas até abrir o circuito
+BREAKER_OPEN_SEC = float(os.getenv("BREAKER_OPEN_SEC", "15"))                  # pausa antes do teste (half-open); dobra a cada reabertura
+BREAKER_OPEN_MAX_SEC = float(os.getenv("BREAKER_OPEN_MAX_SEC", "300"))
+SOURCE_RETRY_ATTEMPTS = int(os.getenv("SOURCE_RETRY_ATTEMPTS", "2"))           # tentativas por consulta ao Redshift/Postgres
+SOURCE_RETRY_BASE_SEC = float(os.getenv("SOURCE_RETRY_BASE_SEC", "0.5"))       # backoff com jitter entre tentativas
+SOURCE_RETRY_MAX_SEC = float(os.getenv("SOURCE_RETRY_MAX_SEC", "2"))
+
+# ======================== STREAMING DE RESULTADOS ========================
+QUERY_FETCH_ROWS = int(os.getenv("QUERY_FETCH_ROWS", "5000"))                    # linhas por FETCH do cursor no servidor
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "200000"))                      # acima disso o resultado é truncado
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", str(256 * 1024 * 1024)))      # orçamento de memória por resultado
+PREVIEW_MAX_BYTES = int(os.getenv("PREVIEW_MAX_BYTES", str(8 * 1024 * 1024)))    # prévia de tabela (colunas largas)
+QUERY_PREPARE = os.getenv("QUERY_PREPARE", "1") == "1"                        # consultas registradas via PREPARE/EXECUTE
+
+# ======================== COLETOR EM SEGUNDO PLANO ========================
+COLLECTOR_SNAPSHOT_PATH = os.getenv("COLLECTOR_SNAPSHOT_PATH", ".collector_snapshot.json")
+COLLECTOR_TICK_SEC = int(os.getenv("COLLECTOR_TICK_SEC", "5"))          # granularidade do loop
+COLLECTOR_MAX_AGE_SEC = int(os.getenv("COLLECTOR_MAX_AGE_SEC", "180"))  # snapshot mais velho que isso é ignorado pela UI
+COLLECTOR_JOB_INTERVALS = {   # intervalo (s) entre coletas de cada fonte
+    "redshift": 30,
+    "powerbi": 60,
+    "jira": 60,
+    "kpis": 60,
+    "kestra": 120,
+    "tracker": 30,
+    "wlm": 30,
+    "autocancel": 30,
+    "archive": 3600,      # antes da retenção: o dia sai do SQLite bruto já arquivado
+    "retention": 3600,
+}
+
 # ======================== CONFIGURAÇÕES DE UI ========================
 PRIMARY = "#0EA5E9"   # azul
 OK      = "#22C55E"   # verde
@@ -82,5 +190,5 @@ def get_now_kestra_style() -> datetime:
     """Obtém datetime atual com lógica do Kestra"""
     now = datetime.now(tz=TZ)
     if now.hour == 0 and now.minute < 30:
-        now = now - datetime.timedelta(minutes=now.minute + 1)
+        now = now - timedelta(minutes=now.minute + 1)
     return now
@@ -3,11 +3,26 @@
 Conexões e executores de banco de dados
 """
 
-import sqlite3
+import itertools
+import re
+import threading
+import time
+import weakref
+import numpy as np
 import pandas as pd
 import streamlit as st
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from .config import HISTORY_DB_PATH, TZ
+from .config import (
+    TZ, DB_POOL_MAX_SIZE, DB_POOL_MAX_LIFETIME_SEC,
+    DB_POOL_CHECKOUT_TIMEOUT_SEC, DB_POOL_HEALTH_CHECK_IDLE_SEC,
+    QUERY_FETCH_ROWS, QUERY_MAX_ROWS, QUERY_MAX_BYTES, QUERY_PREPARE,
+    SOURCE_RETRY_ATTEMPTS, SOURCE_RETRY_BASE_SEC, SOURCE_RETRY_MAX_SEC, JIRA_TICKETS_LOG_SEC,
+)
+from .breaker import CircuitOpenError, backoff_delay, get_breaker, is_source_failure
+from .cache import source_cache
+from .history import get_history_conn, get_history_writer, submit_event   # histórico local (SQLite)
+from .parallel import run_throttled
 
 # psycopg2 will be imported only when needed
 PSYCOPG2_AVAILABLE = None
@@ -34,227 +49,325 @@ def _get_psycopg2():
 
 # ======================== HISTORY DATABASE ========================
 def init_history_db():
-    """Inicializa o banco de dados de histórico"""
-    conn = sqlite3.connect(HISTORY_DB_PATH)
-    conn.execute("PRAGMA encoding = 'UTF-8'")
-    cursor = conn.cursor()
-    
-    # User logins table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_logins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT
-        )
-    """)
-    
-    # Error counts table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS error_counts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            error_type TEXT NOT NULL,
-            error_count INTEGER DEFAULT 1,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            details TEXT
-        )
-    """)
-    
-    # Daily summaries table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS daily_summaries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            redshift_queries_over_10min INTEGER DEFAULT 0,
-            jira_tickets_opened INTEGER DEFAULT 0,
-            powerbi_refresh_delays INTEGER DEFAULT 0,
-            kpi_anomalies INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+    """Inicializa o banco de dados de histórico (WAL, tabelas, índices e migrações)"""
+    get_history_conn()
 
 
 def log_user_login(username: str):
-    """Registra login do usuário"""
+    """Registra login do usuário (gravação assíncrona)"""
     try:
-        conn = sqlite3.connect(HISTORY_DB_PATH)
-        conn.execute("PRAGMA encoding = 'UTF-8'")
-        cursor = conn.cursor()
-        
-        # Garantir que a tabela existe
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_logins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                ip_address TEXT,
-                user_agent TEXT
-            )
-        """)
-        
         # Use current timestamp with timezone for accurate time tracking
-        now_utc = datetime.now(timezone.utc)
-        cursor.execute("""
-            INSERT INTO user_logins (username, login_time)
-            VALUES (?, ?)
-        """, (username, now_utc.isoformat()))
-        conn.commit()
-        conn.close()
+        submit_event("login", (username, datetime.now(timezone.utc).isoformat()))
     except Exception as e:
         print(f"Erro ao registrar login: {e}")
-        if 'conn' in locals():
-            conn.close()
 
 
 def log_error(error_type: str, details: str = ""):
-    """Registra erro no histórico"""
+    """
+    Registra erro no histórico (gravação assíncrona)
+    O mesmo tipo de erro é registrado no máximo uma vez a cada 30 minutos
+    """
     try:
-        conn = sqlite3.connect(HISTORY_DB_PATH)
-        conn.execute("PRAGMA encoding = 'UTF-8'")
-        cursor = conn.cursor()
-        
-        # Check if we already logged this error type recently (within last 30 minutes)
-        cursor.execute("""
-            SELECT COUNT(*) FROM error_counts 
-            WHERE error_type = ? 
-            AND timestamp >= datetime('now', '-30 minutes')
-        """, (error_type,))
-        
-        recent_count = cursor.fetchone()[0]
-        
-        # Only log if we haven't logged this error type recently
-        if recent_count == 0:
-            cursor.execute("""
-                INSERT INTO error_counts (error_type, details, timestamp)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            """, (error_type, details))
-            conn.commit()
-            print(f"✅ Erro logado: {error_type} - {details}")
-        else:
-            print(f"⏭️ Erro já logado recentemente: {error_type}")
-        
-        conn.close()
+        # mesmo formato do CURRENT_TIMESTAMP do SQLite (UTC), capturado no momento do erro
+        submit_event("error", (error_type, details, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
     except Exception as e:
         print(f"❌ Erro ao logar erro: {str(e)}")
 
 
 def get_error_stats(days: int = 7) -> dict:
-    """Obtém estatísticas de erros dos últimos N dias"""
-    conn = sqlite3.connect(HISTORY_DB_PATH)
-    conn.execute("PRAGMA encoding = 'UTF-8'")
-    cursor = conn.cursor()
-    
-    # Get error counts for last N days
-    cursor.execute("""
-        SELECT error_type, COUNT(*) as count
-        FROM error_counts 
-        WHERE timestamp >= datetime('now', '-{} days')
-        GROUP BY error_type
-    """.format(days))
-    
-    error_stats = dict(cursor.fetchall())
-    
+    """Obtém estatísticas de erros dos últimos N dias (bruto ou rollups, conforme a janela)"""
+    from .retention import get_error_counts
+
     # Get daily summaries
-    cursor.execute("""
+    daily_stats = get_history_conn().execute("""
         SELECT date, redshift_queries_over_10min, jira_tickets_opened, powerbi_refresh_delays, kpi_anomalies
-        FROM daily_summaries 
-        WHERE date >= date('now', '-{} days')
+        FROM daily_summaries
+        WHERE date >= date('now', ?)
         ORDER BY date DESC
-    """.format(days))
-    
-    daily_stats = cursor.fetchall()
-    
-    conn.close()
-    
+    """, (f"-{int(days)} days",)).fetchall()
+
     return {
-        "error_counts": error_stats,
+        "error_counts": get_error_counts(days),
         "daily_summaries": daily_stats
     }
 
 
-def cleanup_duplicate_errors():
-    """Remove entradas duplicadas de erros"""
-    conn = sqlite3.connect(HISTORY_DB_PATH)
-    conn.execute("PRAGMA encoding = 'UTF-8'")
-    cursor = conn.cursor()
-    
-    # Remove duplicate jira_tickets_opened entries (keep only 1 per day)
-    cursor.execute("""
-        DELETE FROM error_counts 
-        WHERE error_type = 'jira_tickets_opened' 
-        AND id NOT IN (
-            SELECT MIN(id) 
-            FROM error_counts 
-            WHERE error_type = 'jira_tickets_opened'
-            GROUP BY DATE(timestamp)
-        )
-    """)
-    
-    # Remove excessive powerbi_refresh_delay entries (keep only 1 per hour)
-    cursor.execute("""
-        DELETE FROM error_counts 
-        WHERE error_type = 'powerbi_refresh_delay' 
-        AND id NOT IN (
-            SELECT MIN(id) 
-            FROM error_counts 
-            WHERE error_type = 'powerbi_refresh_delay'
-            GROUP BY DATE(timestamp), strftime('%H', timestamp)
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+def get_login_stats(days: int = 7) -> list[tuple]:
+    """Logins por usuário nos últimos N dias: (username, logins, último login)"""
+    from .retention import get_login_stats as _get_login_stats
+    return _get_login_stats(days)
+
+
+def cleanup_duplicate_errors(since: str | None = None):
+    """
+    Remove entradas duplicadas de erros
+    since (YYYY-MM-DD HH:MM:SS): só apaga linhas a partir desse instante (rodada de retenção:
+    o trecho ainda não agregado); a linha mantida de cada dia/hora pode ser anterior a ele
+    """
+    since = since or "0000-00-00"
+    day_start = since[:10]   # início do dia de since: a primeira linha do dia/hora conta mesmo se já agregada
+    with get_history_conn() as conn:
+        # Remove duplicate jira_tickets_opened entries (keep only 1 per day)
+        conn.execute("""
+            DELETE FROM error_counts
+            WHERE error_type = 'jira_tickets_opened' AND timestamp >= ?
+            AND id NOT IN (
+                SELECT MIN(id)
+                FROM error_counts
+                WHERE error_type = 'jira_tickets_opened' AND timestamp >= ?
+                GROUP BY DATE(timestamp)
+            )
+        """, (since, day_start))
+
+        # Remove excessive powerbi_refresh_delay entries (keep only 1 per hour)
+        conn.execute("""
+            DELETE FROM error_counts
+            WHERE error_type = 'powerbi_refresh_delay' AND timestamp >= ?
+            AND id NOT IN (
+                SELECT MIN(id)
+                FROM error_counts
+                WHERE error_type = 'powerbi_refresh_delay' AND timestamp >= ?
+                GROUP BY DATE(timestamp), strftime('%H', timestamp)
+            )
+        """, (since, day_start))
 
 
 def update_daily_summary(date_str: str, redshift_queries: int = 0, jira_tickets: int = 0, 
                         powerbi_delays: int = 0, kpi_anomalies: int = 0):
-    """Atualiza resumo diário"""
-    conn = sqlite3.connect(HISTORY_DB_PATH)
-    cursor = conn.cursor()
-    
-    # Check if summary exists for this date
-    cursor.execute("SELECT id FROM daily_summaries WHERE date = ?", (date_str,))
-    existing = cursor.fetchone()
-    
-    if existing:
-        # Update existing
-        cursor.execute("""
-            UPDATE daily_summaries 
-            SET redshift_queries_over_10min = redshift_queries_over_10min + ?,
-                jira_tickets_opened = jira_tickets_opened + ?,
-                powerbi_refresh_delays = powerbi_refresh_delays + ?,
-                kpi_anomalies = kpi_anomalies + ?
-            WHERE date = ?
-        """, (redshift_queries, jira_tickets, powerbi_delays, kpi_anomalies, date_str))
-    else:
-        # Insert new
-        cursor.execute("""
-            INSERT INTO daily_summaries (date, redshift_queries_over_10min, jira_tickets_opened, powerbi_refresh_delays, kpi_anomalies)
-            VALUES (?, ?, ?, ?, ?)
-        """, (date_str, redshift_queries, jira_tickets, powerbi_delays, kpi_anomalies))
-    
-    conn.commit()
-    conn.close()
+    """Atualiza resumo diário (incrementos coalescidos pelo gravador assíncrono)"""
+    submit_event("summary", (date_str, {
+        "redshift_queries_over_10min": redshift_queries,
+        "jira_tickets_opened": jira_tickets,
+        "powerbi_refresh_delays": powerbi_delays,
+        "kpi_anomalies": kpi_anomalies,
+    }))
+
+
+def get_history_writer_stats() -> dict:
+    """Contadores da fila de eventos do histórico (para diagnóstico na UI)"""
+    return get_history_writer().stats()
+
+
+# ======================== POOL DE CONEXÕES ========================
+class PoolTimeoutError(RuntimeError):
+    """Nenhuma conexão livre no pool dentro do tempo limite"""
+
+
+class ConnectionPool:
+    """
+    Pool limitado e thread-safe de conexões psycopg2
+
+    - No máximo max_size conexões abertas; quem pede além disso espera (até checkout_timeout_sec)
+    - Conexões mais velhas que max_lifetime_sec são recicladas
+    - Conexões ociosas há mais de health_check_idle_sec são testadas com SELECT 1 no checkout
+    - Com breaker, cada `with connection()` passa pelo circuito da fonte: fonte fora do ar
+      falha na hora com CircuitOpenError em vez de esperar o connect_timeout
+    """
+
+    def __init__(self, name: str, connect, max_size: int = DB_POOL_MAX_SIZE,
+                 max_lifetime_sec: float = DB_POOL_MAX_LIFETIME_SEC,
+                 checkout_timeout_sec: float = DB_POOL_CHECKOUT_TIMEOUT_SEC,
+                 health_check_idle_sec: float = DB_POOL_HEALTH_CHECK_IDLE_SEC,
+                 breaker: str | None = None):
+        self.name = name
+        self._connect = connect
+        self.breaker = get_breaker(breaker) if breaker else None
+        self.max_size = max(1, int(max_size))
+        self.max_lifetime_sec = max_lifetime_sec
+        self.checkout_timeout_sec = checkout_timeout_sec
+        self.health_check_idle_sec = health_check_idle_sec
+
+        self._cond = threading.Condition()
+        self._idle = []         # [(conn, created_at, last_used_at)]
+        self._meta = {}         # id(conn) -> (created_at, generation)
+        self._size = 0          # conexões abertas (ociosas + em uso)
+        self._generation = 0    # incrementado por close_all para descartar conexões em uso
+        self._stats = {
+            "checkouts": 0, "waits": 0, "wait_sec_total": 0.0, "wait_sec_max": 0.0,
+            "timeouts": 0, "created": 0, "discarded": 0, "health_check_failures": 0,
+            "in_use_peak": 0,
+        }
+
+    # ---------- internos ----------
+    def _is_healthy(self, conn, created_at: float, last_used_at: float) -> bool:
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime_sec:
+            return False
+        if now - last_used_at > self.health_check_idle_sec:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+            except Exception:
+                return False
+        return True
+
+    def _close_quietly(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _drop_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    # ---------- API ----------
+    def acquire(self):
+        """Retira uma conexão saudável do pool (abrindo uma nova se houver vaga)"""
+        t0 = time.monotonic()
+        deadline = t0 + self.checkout_timeout_sec
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at, last_used_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Pool {self.name}: nenhuma conexão livre em {self.checkout_timeout_sec:g}s "
+                        f"({self._size}/{self.max_size} em uso)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_sec = time.monotonic() - t0
+            self._stats["checkouts"] += 1
+            self._stats["waits"] += int(waited)
+            self._stats["wait_sec_total"] += wait_sec
+            self._stats["wait_sec_max"] = max(self._stats["wait_sec_max"], wait_sec)
+
+        # Health check e conexão nova acontecem fora do lock (a vaga já está reservada)
+        if conn is not None and not self._is_healthy(conn, created_at, last_used_at):
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            self._meta.pop(id(conn), None)
+            self._close_quietly(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._drop_slot()
+                raise
+            with self._cond:
+                self._meta[id(conn)] = (time.monotonic(), self._generation)
+                self._stats["created"] += 1
+
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            self._stats["in_use_peak"] = max(self._stats["in_use_peak"], in_use)
+        return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        """Devolve a conexão ao pool (ou descarta, se quebrada/obsoleta)"""
+        created_at, generation = self._meta.get(id(conn), (0.0, -1))
+        if not discard and not conn.closed:
+            try:
+                # Garante que nenhuma transação fique aberta entre checkouts
+                if conn.info.transaction_status != 0:  # TRANSACTION_STATUS_IDLE
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed or generation != self._generation:
+            self._meta.pop(id(conn), None)
+            self._close_quietly(conn)
+            self._drop_slot()
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager: `with pool.connection() as conn:`"""
+        breaker = self.breaker
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            conn = self.acquire()
+        except PoolTimeoutError:
+            if breaker is not None:
+                breaker.release()   # pool cheio não diz nada sobre a fonte
+            raise
+        except BaseException as e:
+            if breaker is not None:
+                breaker.record_error(e)
+            raise
+        try:
+            yield conn
+        except Exception as e:
+            psycopg2, _ = _get_psycopg2()
+            is_db_error = psycopg2 is not None and isinstance(e, psycopg2.Error)
+            broken = conn.closed or (
+                psycopg2 is not None and isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            )
+            self.release(conn, discard=broken)
+            # Só erros do banco dizem algo sobre a fonte; falhas no processamento do resultado, não
+            if breaker is not None and is_db_error:
+                breaker.record_error(e)
+            elif breaker is not None:
+                breaker.release()
+            raise
+        except BaseException:
+            # Gerador fechado antes do fim ou rerun do Streamlit: devolve a conexão sem veredito
+            self.release(conn)
+            if breaker is not None:
+                breaker.release()
+            raise
+        else:
+            self.release(conn)
+            if breaker is not None:
+                breaker.record_success()
+
+    def close_all(self) -> None:
+        """Fecha conexões ociosas; as que estão em uso são descartadas ao voltar"""
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._stats["discarded"] += len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._meta.pop(id(conn), None)
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        """Contadores de uso do pool"""
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "name": self.name,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            })
+        s["wait_sec_avg"] = s["wait_sec_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
 
 
 # ======================== CONEXÕES DB ========================
-@st.cache_resource(show_spinner=False)
-def get_redshift_conn():
-    """Obtém conexão com Redshift com configurações robustas"""
+def _connect(secret_key: str, default_port: int, label: str):
+    """Abre uma conexão psycopg2 com configurações robustas"""
     psycopg2, available = _get_psycopg2()
     if not available:
         raise ImportError("psycopg2 não está disponível. Instale com: pip install psycopg2-binary")
-    
-    s = st.secrets["dw_vissimo"]
-    
+
+    s = st.secrets[secret_key]
+
     try:
         conn = psycopg2.connect(
             host=s["host"],
-            port=s.get("port", 5439),
+            port=s.get("port", default_port),
             dbname=s["dbname"],
             user=s["user"],
             password=s["password"],
@@ -265,173 +378,365 @@ def get_redshift_conn():
             keepalives_count=3
         )
         conn.autocommit = True
-        
+
         # Configurar encoding
         try:
             conn.set_client_encoding("UTF8")
         except Exception:
             pass
-            
-        # Testar a conexão
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1")
-            cur.fetchone()
-            
-        print("✅ Conexão Redshift estabelecida com sucesso")
+
+        print(f"✅ Conexão {label} estabelecida com sucesso")
         return conn
-        
+
     except Exception as e:
-        print(f"❌ Erro ao conectar com Redshift: {str(e)}")
+        print(f"❌ Erro ao conectar com {label}: {str(e)}")
         raise
 
 
 @st.cache_resource(show_spinner=False)
-def get_postgres_conn():
-    """Obtém conexão com Postgres com configurações robustas"""
-    psycopg2, available = _get_psycopg2()
-    if not available:
-        raise ImportError("psycopg2 não está disponível. Instale com: pip install psycopg2-binary")
-    
-    s = st.secrets["postgres"]
-    
+def get_redshift_pool() -> ConnectionPool:
+    """Pool de conexões do Redshift (um por processo)"""
+    return ConnectionPool("redshift", lambda: _connect("dw_vissimo", 5439, "Redshift"), breaker="redshift")
+
+
+@st.cache_resource(show_spinner=False)
+def get_postgres_pool() -> ConnectionPool:
+    """Pool de conexões do Postgres (um por processo)"""
+    return ConnectionPool("postgres", lambda: _connect("postgres", 5432, "PostgreSQL"), breaker="postgres")
+
+
+@st.cache_resource(show_spinner=False)
+def get_redshift_admin_pool() -> ConnectionPool:
+    """
+    Pool dedicado (1 conexão) para CANCEL/pg_terminate_backend do auto-cancelamento
+    Usa o secret dw_vissimo_admin quando existir (usuário com permissão de cancelar
+    queries de outros usuários); senão, o mesmo usuário do monitor.
+    """
     try:
-        conn = psycopg2.connect(
-            host=s["host"],
-            port=s.get("port", 5432),
-            dbname=s["dbname"],
-            user=s["user"],
-            password=s["password"],
-            connect_timeout=10,
-            application_name="MonitorDW",
-            keepalives_idle=600,
-            keepalives_interval=30,
-            keepalives_count=3
+        secret_key = "dw_vissimo_admin" if "dw_vissimo_admin" in st.secrets else "dw_vissimo"
+    except Exception:
+        secret_key = "dw_vissimo"
+    return ConnectionPool("redshift_admin", lambda: _connect(secret_key, 5439, "Redshift (admin)"), max_size=1)
+
+
+def get_redshift_conn():
+    """
+    Retira uma conexão do pool do Redshift
+    Uso: `with get_redshift_conn() as conn:` — a conexão volta ao pool ao sair do bloco
+    """
+    return get_redshift_pool().connection()
+
+
+def get_postgres_conn():
+    """
+    Retira uma conexão do pool do Postgres
+    Uso: `with get_postgres_conn() as conn:` — a conexão volta ao pool ao sair do bloco
+    """
+    return get_postgres_pool().connection()
+
+
+def get_pool_stats() -> dict:
+    """Contadores dos pools de conexão (para diagnóstico na UI)"""
+    return {"redshift": get_redshift_pool().stats(), "postgres": get_postgres_pool().stats()}
+
+
+# ======================== RESULTADOS TIPADOS ========================
+# OIDs (cursor.description[i].type_code) — os mesmos no Redshift
+_OID_NUMERIC = 1700
+_OID_FLOAT = {700, 701, _OID_NUMERIC}   # float4, float8, numeric
+_OID_INT = {20, 21, 23}                 # int8, int2, int4
+_OID_BOOL = 16
+_OID_TIMESTAMP = 1114
+_OID_TIMESTAMPTZ = 1184
+
+_numeric_as_float = None
+
+
+def _register_numeric_as_float(cur) -> None:
+    """numeric chega do driver já como float (sem criar um Decimal por célula); vale só para este cursor"""
+    global _numeric_as_float
+    psycopg2, _ = _get_psycopg2()
+    if _numeric_as_float is None:
+        _numeric_as_float = psycopg2.extensions.new_type(
+            (_OID_NUMERIC,), "MONITOR_NUMERIC_FLOAT", lambda v, c: float(v) if v is not None else None
         )
-        conn.autocommit = True
-        
-        # Configurar encoding
+    psycopg2.extensions.register_type(_numeric_as_float, cur)
+
+
+def _typed_column(values, desc, decimal: str):
+    """Valores de uma coluna -> array com dtype do tipo declarado no cursor"""
+    oid = desc[1]
+    if oid == _OID_NUMERIC and decimal == "decimal128" and desc[4]:
+        import pyarrow as pa
+        return pd.array(values, dtype=pd.ArrowDtype(pa.decimal128(desc[4], desc[5] or 0)))
+    if oid in _OID_FLOAT:
+        return np.array(values, dtype="float64")   # None -> NaN
+    if oid in _OID_INT:
+        return pd.array(values, dtype="Int64") if None in values else np.array(values, dtype="int64")
+    if oid == _OID_BOOL:
+        return pd.array(values, dtype="boolean") if None in values else np.array(values, dtype="bool")
+    if oid == _OID_TIMESTAMPTZ:
+        return pd.to_datetime(pd.Series(values, dtype=object), utc=True).dt.as_unit("ns").array
+    if oid == _OID_TIMESTAMP:
+        return pd.to_datetime(pd.Series(values, dtype=object)).dt.as_unit("ns").array
+    # np.array(values) transformaria listas/tuplas de mesmo tamanho (arrays do banco) numa matriz
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def _typed_frame(rows: list[tuple], description, decimal: str = "float") -> pd.DataFrame:
+    """
+    Monta o DataFrame coluna a coluna pelo tipo de cada coluna no cursor:
+    numeric/float -> float64 (ou decimal128 do Arrow com decimal="decimal128"),
+    inteiros -> int64/Int64, timestamptz -> datetime64[ns, UTC], timestamp ->
+    datetime64[ns]; o resto continua object
+    """
+    names = [d[0] for d in description]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    df = pd.DataFrame({i: _typed_column(list(values), desc, decimal)
+                       for i, (values, desc) in enumerate(zip(columns, description))})
+    df.columns = names   # permite nomes repetidos (SELECT t.*, ...)
+    return df
+
+
+def read_frame(conn, sql: str, params=None, decimal: str = "float") -> pd.DataFrame:
+    """Substituto tipado de pd.read_sql para resultados pequenos (cursor comum)"""
+    with conn.cursor() as cur:
+        if decimal == "float":
+            _register_numeric_as_float(cur)
+        cur.execute(sql, params)
+        return _typed_frame(cur.fetchall(), cur.description, decimal)
+
+
+# ======================== STREAMING DE RESULTADOS ========================
+_cursor_seq = itertools.count(1)
+
+
+def stream_query(pool: ConnectionPool, sql: str, params=None, chunk_rows: int = QUERY_FETCH_ROWS,
+                 max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES, decimal: str = "float"):
+    """
+    Executa um SELECT num cursor nomeado (no servidor) e produz DataFrames de
+    até chunk_rows linhas, lidos com FETCH sob demanda
+
+    Para ao atingir max_rows (o último bloco é cortado) ou quando a memória
+    acumulada dos blocos passa de max_bytes (o bloco que cruza o limite é o
+    último). Nesses casos o último bloco traz attrs["truncated"] = "max_rows"
+    ou "max_bytes". A conexão fica presa ao gerador até ele ser consumido ou
+    fechado. Os blocos já saem tipados (ver _typed_frame).
+    """
+    with pool.connection() as conn:
+        # Cursor nomeado exige transação: o pool trabalha em autocommit
+        conn.autocommit = False
         try:
-            conn.set_client_encoding("UTF8")
-        except Exception:
-            pass
-            
-        # Testar a conexão
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1")
-            cur.fetchone()
-            
-        print("✅ Conexão PostgreSQL estabelecida com sucesso")
-        return conn
-        
-    except Exception as e:
-        print(f"❌ Erro ao conectar com PostgreSQL: {str(e)}")
-        raise
+            with conn.cursor(name=f"monitor_dw_{next(_cursor_seq)}") as cur:
+                if decimal == "float":
+                    _register_numeric_as_float(cur)
+                cur.execute(sql, params)
+                rows_seen = bytes_seen = 0
+                while True:
+                    want = min(chunk_rows, max_rows - rows_seen + 1)   # +1 detecta que passou de max_rows
+                    rows = cur.fetchmany(want)
+                    exhausted = len(rows) < want
+                    truncated = None
+                    if rows_seen + len(rows) > max_rows:
+                        rows, truncated = rows[:max_rows - rows_seen], "max_rows"
+                    # cursor nomeado só tem description após o primeiro FETCH
+                    chunk = _typed_frame(rows, cur.description, decimal)
+                    rows_seen += len(chunk)
+                    bytes_seen += int(chunk.memory_usage(deep=True).sum())
+                    if truncated is None and not exhausted and bytes_seen > max_bytes:
+                        truncated = "max_bytes"
+                    if truncated is not None:
+                        chunk.attrs["truncated"] = truncated
+                        print(f"⚠️ Resultado truncado em {rows_seen} linhas / "
+                              f"{bytes_seen / 1024 / 1024:.1f} MB ({truncated})")
+                    yield chunk
+                    if exhausted or truncated is not None:
+                        return
+        finally:
+            try:
+                if not conn.closed:
+                    conn.rollback()
+                    conn.autocommit = True
+            except Exception as e:
+                # Estado da conexão incerto: fechada aqui, o pool descarta no release
+                # (e a exceção original, se houver, não é mascarada)
+                print(f"⚠️ Falha ao limpar a conexão do cursor no servidor; descartando: {e}")
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def fetch_limited(pool: ConnectionPool, sql: str, params=None, chunk_rows: int = QUERY_FETCH_ROWS,
+                  max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES,
+                  decimal: str = "float") -> pd.DataFrame:
+    """
+    stream_query concatenado num DataFrame; attrs["truncated"] indica se
+    algum limite cortou o resultado (None = completo)
+    """
+    chunks = list(stream_query(pool, sql, params, chunk_rows, max_rows, max_bytes, decimal))
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    df.attrs["truncated"] = chunks[-1].attrs.get("truncated")
+    return df
+
+
+# ======================== CONSULTAS REGISTRADAS ========================
+# Cada SQL dos serviços é registrado uma vez, com nome e tipos dos parâmetros
+# (placeholders %(nome)s). O texto não muda com datas/limites/minutos, então a
+# consulta é preparada (PREPARE) uma vez por conexão e executada com EXECUTE,
+# o cache do Streamlit fica chaveado por (nome, parâmetros) e nenhum valor
+# vindo da UI é concatenado no SQL.
+_QUERIES: dict[str, dict] = {}
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s")
+_prepared = weakref.WeakKeyDictionary()   # conexão -> planos já preparados nela
+_prepared_lock = threading.Lock()
+_unpreparable: set[str] = set()
+
+
+def register_query(name: str, sql: str, params: dict[str, str] | None = None, prepare: bool = True) -> str:
+    """
+    Registra um SQL nomeado; params = {nome: tipo SQL} na ordem do PREPARE
+    prepare=False para parâmetros que o PREPARE não aceita (listas de IN):
+    esses continuam ligados pelo driver, com escape, mas sem plano no servidor
+    """
+    params = params or {}
+    used = set(_PLACEHOLDER.findall(sql))
+    if used != set(params):
+        raise ValueError(f"Consulta {name}: parâmetros {sorted(used)} no SQL, {sorted(params)} declarados")
+    index = {p: i for i, p in enumerate(params, 1)}
+    _QUERIES[name] = {
+        "sql": sql,
+        "params": tuple(params),
+        "types": tuple(params.values()),
+        "server_sql": _PLACEHOLDER.sub(lambda m: f"${index[m.group(1)]}", sql).replace("%%", "%"),
+        "prepare": prepare,
+        "plan": "mdw_" + re.sub(r"\W", "_", name),
+    }
+    return name
+
+
+def _execute_registered(cur, name: str, params: dict) -> None:
+    q = _QUERIES[name]
+    missing = set(q["params"]) - set(params)
+    if missing:
+        raise ValueError(f"Consulta {name}: faltam os parâmetros {sorted(missing)}")
+    if not (QUERY_PREPARE and q["prepare"]) or q["plan"] in _unpreparable:
+        cur.execute(q["sql"], params)
+        return
+
+    conn = cur.connection
+    with _prepared_lock:
+        done = _prepared.setdefault(conn, set())
+    values = [params[p] for p in q["params"]]
+    execute_sql = f"EXECUTE {q['plan']}" + (f" ({', '.join(['%s'] * len(values))})" if values else "")
+    for attempt in range(2):
+        if q["plan"] not in done:
+            types = f" ({', '.join(q['types'])})" if q["types"] else ""
+            try:
+                cur.execute(f"PREPARE {q['plan']}{types} AS {q['server_sql']}")
+            except Exception as e:
+                if getattr(e, "pgcode", None) is None:   # conexão caiu: erro de verdade, não do PREPARE
+                    raise
+                if e.pgcode != "42P05":   # 42P05: já preparado nesta sessão
+                    print(f"⚠️ PREPARE de {name} falhou; seguindo com parâmetros no cliente: {e}")
+                    _unpreparable.add(q["plan"])
+                    cur.execute(q["sql"], params)
+                    return
+            done.add(q["plan"])
+        try:
+            cur.execute(execute_sql, values)
+            return
+        except Exception as e:
+            # 26000: o plano sumiu (DEALLOCATE/reset da sessão) — prepara de novo uma vez
+            if attempt or getattr(e, "pgcode", None) != "26000":
+                raise
+            done.discard(q["plan"])
+
+
+def run_query(name: str, params: dict | None = None, conn=None, decimal: str = "float") -> pd.DataFrame:
+    """Executa uma consulta registrada (na conexão dada ou numa do pool do Redshift), resultado tipado"""
+    if conn is None:
+        with get_redshift_conn() as conn:
+            return run_query(name, params, conn, decimal)
+    with conn.cursor() as cur:
+        if decimal == "float":
+            _register_numeric_as_float(cur)
+        _execute_registered(cur, name, params or {})
+        return _typed_frame(cur.fetchall(), cur.description, decimal)
+
+
+@source_cache("queries")
+def cached_query(name: str, params: dict | None = None) -> pd.DataFrame:
+    """run_query pelo cache da fonte "queries", chaveado por (nome, parâmetros)"""
+    return run_query(name, params)
 
 
 # ======================== EXECUTORES DE QUERY ========================
-@st.cache_data(ttl=5, show_spinner=False)
-def run_redshift(sql: str) -> pd.DataFrame:
-    """Executa query no Redshift com retry automático"""
+@source_cache("redshift")
+def run_redshift(sql: str, params: dict | None = None) -> pd.DataFrame:
+    """
+    Executa SELECT no Redshift (attrs["truncated"] se passar dos limites)
+    Valores variáveis vão em params (%(nome)s): o texto do SQL fica fixo e o cache é por (sql, params)
+    Falha levanta exceção (o cache devolve o último valor bom); com o circuito aberto, na hora
+    """
     psycopg2, available = _get_psycopg2()
     if not available:
         st.warning("⚠️ psycopg2 não disponível. Funcionalidades de Redshift desabilitadas.")
         return pd.DataFrame()
-    
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
+
+    for attempt in range(SOURCE_RETRY_ATTEMPTS):
         try:
-            conn = get_redshift_conn()
-            
-            # Verificar se a conexão está ativa
-            if conn.closed:
-                print(f"⚠️ Conexão Redshift fechada, tentando reconectar... (tentativa {attempt + 1})")
-                # Limpar cache da conexão para forçar nova conexão
-                get_redshift_conn.clear()
-                conn = get_redshift_conn()
-            
-            with conn.cursor() as cur:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                cur.execute(sql)
-                cols = [d[0] for d in cur.description]
-                rows = cur.fetchall()
-            return pd.DataFrame(rows, columns=cols)
-            
+            # Conexões quebradas são descartadas pelo pool; a próxima tentativa abre outra.
+            # Cursor no servidor + limites de linhas/bytes: um SELECT grande não estoura a memória
+            return fetch_limited(get_redshift_pool(), sql, params)
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Erro na consulta Redshift (tentativa {attempt + 1}): {error_msg}")
-            
-            if attempt < max_retries - 1:
-                print(f"🔄 Tentando novamente em {retry_delay} segundos...")
-                import time
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Backoff exponencial
-                
-                # Limpar cache da conexão para forçar nova conexão
-                get_redshift_conn.clear()
-            else:
-                st.error(f"❌ Erro na consulta Redshift após {max_retries} tentativas: {error_msg}")
-                return pd.DataFrame()
-
-
-@st.cache_data(ttl=5, show_spinner=False)
-def run_postgres(sql: str) -> pd.DataFrame:
-    """Executa query no Postgres com retry automático"""
+            print(f"❌ Erro na consulta Redshift (tentativa {attempt + 1}): {e}")
+            if attempt == SOURCE_RETRY_ATTEMPTS - 1 or not is_source_failure(e):
+                raise
+            # Pausa curta e com jitter: a thread do render não fica segundos parada
+            delay = backoff_delay(attempt, SOURCE_RETRY_BASE_SEC, SOURCE_RETRY_MAX_SEC)
+            print(f"🔄 Tentando novamente em {delay:.1f} segundos...")
+            time.sleep(delay)
+
+
+@source_cache("postgres")
+def run_postgres(sql: str, params: dict | None = None) -> pd.DataFrame:
+    """
+    Executa SELECT no Postgres (attrs["truncated"] se passar dos limites)
+    Valores variáveis vão em params (%(nome)s): o texto do SQL fica fixo e o cache é por (sql, params)
+    Falha levanta exceção (o cache devolve o último valor bom); com o circuito aberto, na hora
+    """
     psycopg2, available = _get_psycopg2()
     if not available:
         st.warning("⚠️ psycopg2 não disponível. Funcionalidades de PostgreSQL desabilitadas.")
         return pd.DataFrame()
-    
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
+
+    for attempt in range(SOURCE_RETRY_ATTEMPTS):
         try:
-            conn = get_postgres_conn()
-            
-            # Verificar se a conexão está ativa
-            if conn.closed:
-                print(f"⚠️ Conexão PostgreSQL fechada, tentando reconectar... (tentativa {attempt + 1})")
-                # Limpar cache da conexão para forçar nova conexão
-                get_postgres_conn.clear()
-                conn = get_postgres_conn()
-            
-            with conn.cursor() as cur:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                cur.execute(sql)
-                cols = [d[0] for d in cur.description]
-                rows = cur.fetchall()
-            return pd.DataFrame(rows, columns=cols)
-            
+            # Conexões quebradas são descartadas pelo pool; a próxima tentativa abre outra.
+            # Cursor no servidor + limites de linhas/bytes: um SELECT grande não estoura a memória
+            return fetch_limited(get_postgres_pool(), sql, params)
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Erro na consulta Postgres (tentativa {attempt + 1}): {error_msg}")
-            
-            if attempt < max_retries - 1:
-                print(f"🔄 Tentando novamente em {retry_delay} segundos...")
-                import time
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Backoff exponencial
-                
-                # Limpar cache da conexão para forçar nova conexão
-                get_postgres_conn.clear()
-            else:
-                st.error(f"❌ Erro na consulta Postgres após {max_retries} tentativas: {error_msg}")
-                return pd.DataFrame()
+            print(f"❌ Erro na consulta Postgres (tentativa {attempt + 1}): {e}")
+            if attempt == SOURCE_RETRY_ATTEMPTS - 1 or not is_source_failure(e):
+                raise
+            # Pausa curta e com jitter: a thread do render não fica segundos parada
+            delay = backoff_delay(attempt, SOURCE_RETRY_BASE_SEC, SOURCE_RETRY_MAX_SEC)
+            print(f"🔄 Tentando novamente em {delay:.1f} segundos...")
+            time.sleep(delay)
 
 
 def clear_all_db_connections():
-    """Limpa todas as conexões de banco de dados em cache"""
+    """Fecha todas as conexões dos pools de banco de dados"""
     try:
-        get_redshift_conn.clear()
-        get_postgres_conn.clear()
+        get_redshift_pool().close_all()
+        get_postgres_pool().close_all()
         print("✅ Todas as conexões de banco de dados foram limpas")
         return True
     except Exception as e:
@@ -439,21 +744,40 @@ def clear_all_db_connections():
         return False
 
 
-def log_jira_tickets(ticket_count: int):
-    """Registra chamados abertos do Jira no histórico"""
+_jira_last_total: int | None = None   # último total de chamados abertos registrado no processo
+
+
+def _record_jira_total(ticket_count: int) -> bool:
+    """Grava só a mudança do total: o resumo diário soma os chamados novos (aumento do total)"""
+    global _jira_last_total
+    previous, _jira_last_total = _jira_last_total, ticket_count
+    if ticket_count == previous:
+        return False
+    opened = ticket_count if previous is None else max(0, ticket_count - previous)
     try:
         from datetime import datetime
         from .config import TZ
         today_str = datetime.now(TZ).strftime("%Y-%m-%d")
-        
+
         # Atualizar resumo diário
-        update_daily_summary(today_str, jira_tickets=ticket_count)
-        
+        if opened:
+            update_daily_summary(today_str, jira_tickets=opened)
+
         # Registrar no log de erros (para histórico)
-        log_error("jira_tickets_opened", f"Chamados abertos: {ticket_count}")
-        
-        print(f"✅ {ticket_count} chamados do Jira registrados no histórico")
+        if ticket_count > 0:
+            log_error("jira_tickets_opened", f"Chamados abertos: {ticket_count}")
+
+        print(f"✅ Chamados do Jira: total {ticket_count} ({opened} novos) registrado no histórico")
         return True
     except Exception as e:
         print(f"❌ Erro ao registrar chamados do Jira: {e}")
         return False
+
+
+def log_jira_tickets(ticket_count: int):
+    """
+    Registra chamados abertos do Jira no histórico
+    No máximo uma vez a cada JIRA_TICKETS_LOG_SEC por processo (não por sessão/rerun)
+    e só quando o total muda; retorna None quando pulou
+    """
+    return run_throttled("jira_tickets", JIRA_TICKETS_LOG_SEC, _record_jira_total, int(ticket_count))
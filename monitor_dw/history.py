@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+"""
+Histórico local (SQLite)
+
+Conexões em modo WAL (leitores não bloqueiam o escritor e vice-versa) num
+pequeno pool do processo: cada thread recebe uma na primeira chamada e a
+devolve ao terminar, então os reruns do Streamlit (uma thread nova cada)
+reaproveitam conexões em vez de abrir uma por rerun. O schema e as migrações
+são aplicados uma única vez por processo, e tudo é fechado no atexit. Use
+`with get_history_conn() as conn:` para cada transação — o bloco faz commit
+(ou rollback em erro), mas não fecha a conexão.
+
+Eventos de histórico disparados durante o render (erros, logins, resumo
+diário) passam por uma fila em memória: uma thread em segundo plano agrupa
+os eventos de uma janela curta e grava tudo numa única transação, então um
+disco lento ou lock no SQLite não atrasa a página.
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from .config import (
+    HISTORY_DB_PATH, HISTORY_BUSY_TIMEOUT_SEC, HISTORY_POOL_MAX_IDLE, HISTORY_WRITER_ASYNC,
+    HISTORY_FLUSH_WINDOW_SEC, HISTORY_QUEUE_MAX, HISTORY_BATCH_MAX,
+)
+
+# ======================== SCHEMA ========================
+BASE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS user_logins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ip_address TEXT,
+        user_agent TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS error_counts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        error_type TEXT NOT NULL,
+        error_count INTEGER DEFAULT 1,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        details TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        redshift_queries_over_10min INTEGER DEFAULT 0,
+        jira_tickets_opened INTEGER DEFAULT 0,
+        powerbi_refresh_delays INTEGER DEFAULT 0,
+        kpi_anomalies INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # dedup do log_error (tipo + janela de 30 min) e estatísticas por período
+    "CREATE INDEX IF NOT EXISTS idx_error_counts_type_ts ON error_counts (error_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_error_counts_ts_type ON error_counts (timestamp, error_type)",
+    "CREATE INDEX IF NOT EXISTS idx_user_logins_time ON user_logins (login_time, username)",
+)
+
+DAILY_SUMMARY_COUNTERS = (
+    "redshift_queries_over_10min", "jira_tickets_opened", "powerbi_refresh_delays", "kpi_anomalies",
+)
+
+FORECAST_CURVE_DDL = """
+    CREATE TABLE IF NOT EXISTS forecast_curve (
+        curve_day TEXT NOT NULL,
+        d TEXT NOT NULL,
+        hhmi INTEGER NOT NULL,
+        revenue REAL,
+        n_rows INTEGER NOT NULL,
+        PRIMARY KEY (curve_day, d, hhmi)
+    )
+"""
+
+QUERY_LIFECYCLE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS query_lifecycle (
+        pid INTEGER NOT NULL,
+        starttime TEXT NOT NULL,
+        user_name TEXT,
+        query_text TEXT,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        peak_duration_sec REAL NOT NULL,
+        ended_at TEXT,
+        end_state TEXT NOT NULL DEFAULT 'running',
+        fingerprint TEXT,
+        PRIMARY KEY (pid, starttime)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_query_lifecycle_state ON query_lifecycle (end_state)",
+    "CREATE INDEX IF NOT EXISTS idx_query_lifecycle_start ON query_lifecycle (starttime)",
+    """
+    CREATE TABLE IF NOT EXISTS query_fingerprints (
+        fingerprint TEXT PRIMARY KEY,
+        normalized TEXT NOT NULL,
+        first_seen TEXT NOT NULL
+    )
+    """,
+)
+
+
+AUTO_CANCEL_AUDIT_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS auto_cancel_audit (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        starttime TEXT NOT NULL,
+        user_name TEXT,
+        fingerprint TEXT,
+        duration_sec REAL NOT NULL,
+        limit_sec REAL NOT NULL,
+        rule TEXT NOT NULL,
+        action TEXT NOT NULL,
+        dry_run INTEGER NOT NULL,
+        outcome TEXT NOT NULL,
+        error TEXT,
+        query_text TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_auto_cancel_query ON auto_cancel_audit (pid, starttime)",
+    "CREATE INDEX IF NOT EXISTS idx_auto_cancel_ts ON auto_cancel_audit (ts)",
+)
+
+
+WLM_SAMPLES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS wlm_samples (
+        ts TEXT NOT NULL,
+        service_class INTEGER NOT NULL,
+        queue_name TEXT,
+        queued INTEGER NOT NULL,
+        executing INTEGER NOT NULL,
+        slots INTEGER,
+        max_queue_sec REAL,
+        avg_queue_sec REAL,
+        PRIMARY KEY (ts, service_class)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wlm_cs_usage (
+        ts TEXT PRIMARY KEY,
+        usage_sec_today REAL NOT NULL
+    )
+    """,
+)
+
+
+KPI_SNAPSHOT_COLUMNS = (
+    "today_revenue", "cm1", "cm2", "last_hour_revenue", "month_revenue_flash_sale", "month_cm1", "month_cm2",
+    "today_forecast", "expected_percentage", "expected_revenue", "expected_month_revenue", "diff_min",
+)
+
+KPI_SNAPSHOTS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS kpi_snapshots (
+        ts TEXT PRIMARY KEY,
+        {", ".join(f"{c} REAL" for c in KPI_SNAPSHOT_COLUMNS)},
+        partial_errors INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+def _migrate_daily_summaries(conn) -> None:
+    """Funde datas duplicadas (somando os contadores) e cria a chave única em date"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_daily_summaries_date'"
+    ).fetchone()
+    if exists:
+        return
+    sums = ", ".join(
+        f"{c} = (SELECT SUM(d2.{c}) FROM daily_summaries d2 WHERE d2.date = daily_summaries.date)"
+        for c in DAILY_SUMMARY_COUNTERS
+    )
+    conn.execute(f"""
+        UPDATE daily_summaries SET {sums}
+        WHERE id IN (SELECT MIN(id) FROM daily_summaries GROUP BY date HAVING COUNT(*) > 1)
+    """)
+    conn.execute("DELETE FROM daily_summaries WHERE id NOT IN (SELECT MIN(id) FROM daily_summaries GROUP BY date)")
+    conn.execute("CREATE UNIQUE INDEX ux_daily_summaries_date ON daily_summaries (date)")
+
+
+def _migrate_query_lifecycle(conn) -> None:
+    """Bancos anteriores ao fingerprint não têm a coluna"""
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(query_lifecycle)")}
+    if "fingerprint" not in cols:
+        conn.execute("ALTER TABLE query_lifecycle ADD COLUMN fingerprint TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_query_lifecycle_fp ON query_lifecycle (fingerprint)")
+
+
+def ensure_history_schema(conn) -> None:
+    """Cria tabelas/índices e aplica as migrações (idempotente)"""
+    for ddl in (*BASE_DDL, FORECAST_CURVE_DDL, *QUERY_LIFECYCLE_DDL, *AUTO_CANCEL_AUDIT_DDL, *WLM_SAMPLES_DDL,
+                KPI_SNAPSHOTS_DDL):
+        conn.execute(ddl)
+    _migrate_daily_summaries(conn)
+    _migrate_query_lifecycle(conn)
+
+
+# ======================== CONEXÃO ========================
+_local = threading.local()        # path -> _Lease da thread atual
+_schema_lock = threading.Lock()
+_schema_ready: set[str] = set()
+_pool_lock = threading.Lock()
+_idle: dict[str, list] = {}       # path -> conexões livres
+_all_conns: set = set()           # todas as abertas (fechadas no atexit)
+_pool_closed = False
+_pool_stats = {"opened": 0, "reused": 0, "closed": 0}
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # check_same_thread=False: a conexão passa de uma thread para outra pelo pool (nunca duas ao mesmo tempo)
+    conn = sqlite3.connect(path, timeout=HISTORY_BUSY_TIMEOUT_SEC, check_same_thread=False)
+    # Antes de qualquer tabela: bancos novos já nascem com vacuum incremental (ver retention._maintenance)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")   # seguro em WAL; fsync só no checkpoint
+    return conn
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    with _pool_lock:
+        _all_conns.discard(conn)
+        _pool_stats["closed"] += 1
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _checkout(path: str) -> sqlite3.Connection:
+    with _pool_lock:
+        idle = _idle.get(path)
+        if idle:
+            _pool_stats["reused"] += 1
+            return idle.pop()
+    conn = _open(path)
+    with _pool_lock:
+        _all_conns.add(conn)
+        _pool_stats["opened"] += 1
+    with _schema_lock:
+        if path not in _schema_ready:
+            with conn:
+                ensure_history_schema(conn)
+            _schema_ready.add(path)
+    return conn
+
+
+def _checkin(path: str, conn: sqlite3.Connection) -> None:
+    """Devolve a conexão ao pool (sem transação aberta); acima de HISTORY_POOL_MAX_IDLE, fecha"""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except Exception:
+        _close_quietly(conn)
+        return
+    with _pool_lock:
+        idle = _idle.setdefault(path, [])
+        if not _pool_closed and len(idle) < HISTORY_POOL_MAX_IDLE:
+            idle.append(conn)
+            return
+    _close_quietly(conn)
+
+
+class _Lease:
+    """Conexão emprestada a uma thread: volta ao pool quando a thread termina (fim do threading.local)"""
+
+    __slots__ = ("path", "conn")
+
+    def __init__(self, path: str, conn: sqlite3.Connection):
+        self.path = path
+        self.conn = conn
+
+    def __del__(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                _checkin(self.path, conn)
+            except Exception:
+                pass   # interpretador encerrando
+
+
+def get_history_conn(path: str | None = None) -> sqlite3.Connection:
+    """Conexão da thread atual, tirada do pool na primeira chamada (schema garantido na primeira abertura do processo)"""
+    path = path or HISTORY_DB_PATH
+    leases = _local.__dict__.setdefault("leases", {})
+    lease = leases.get(path)
+    if lease is None:
+        lease = leases[path] = _Lease(path, _checkout(path))
+    return lease.conn
+
+
+def close_history_conn(path: str | None = None) -> None:
+    """Fecha a conexão da thread atual (a próxima chamada pega outra do pool)"""
+    lease = _local.__dict__.get("leases", {}).pop(path or HISTORY_DB_PATH, None)
+    if lease is not None and lease.conn is not None:
+        conn, lease.conn = lease.conn, None
+        _close_quietly(conn)
+
+
+def close_all_history_conns() -> None:
+    """Fecha todas as conexões do pool (atexit); devoluções posteriores fecham em vez de guardar"""
+    global _pool_closed
+    with _pool_lock:
+        _pool_closed = True
+        conns = list(_all_conns)
+        _idle.clear()
+    for conn in conns:
+        _close_quietly(conn)
+
+
+def get_history_conn_stats() -> dict:
+    """Conexões abertas, livres e reaproveitadas do pool do histórico"""
+    with _pool_lock:
+        return {**_pool_stats, "open": len(_all_conns), "idle": sum(len(v) for v in _idle.values())}
+
+
+# Registrado antes do stop() do HistoryWriter: o atexit roda em ordem inversa, então a fila drena antes
+atexit.register(close_all_history_conns)
+
+
+# ======================== EVENTOS (ESCRITA) ========================
+def _write_summary(conn, date_str: str, counters: dict) -> None:
+    """UPSERT na chave única de date, somando os contadores"""
+    conn.execute("""
+        INSERT INTO daily_summaries (date, redshift_queries_over_10min, jira_tickets_opened, powerbi_refresh_delays, kpi_anomalies)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (date) DO UPDATE SET
+            redshift_queries_over_10min = redshift_queries_over_10min + excluded.redshift_queries_over_10min,
+            jira_tickets_opened = jira_tickets_opened + excluded.jira_tickets_opened,
+            powerbi_refresh_delays = powerbi_refresh_delays + excluded.powerbi_refresh_delays,
+            kpi_anomalies = kpi_anomalies + excluded.kpi_anomalies
+    """, (date_str, *(int(counters.get(c, 0)) for c in DAILY_SUMMARY_COUNTERS)))
+
+
+def _write_error(conn, error_type: str, details: str, ts: str) -> bool:
+    """Grava o erro se o mesmo tipo não foi registrado nos 30 min anteriores a ts"""
+    # busca pontual em idx_error_counts_type_ts
+    recent = conn.execute("""
+        SELECT 1 FROM error_counts
+        WHERE error_type = ?
+        AND timestamp >= datetime(?, '-30 minutes')
+        LIMIT 1
+    """, (error_type, ts)).fetchone()
+    if recent is not None:
+        return False
+    conn.execute("INSERT INTO error_counts (error_type, details, timestamp) VALUES (?, ?, ?)", (error_type, details, ts))
+    return True
+
+
+def _write_login(conn, username: str, login_time: str) -> None:
+    conn.execute("INSERT INTO user_logins (username, login_time) VALUES (?, ?)", (username, login_time))
+
+
+def _write_kpi(conn, ts: str, values: dict, partial_errors: int) -> None:
+    """Uma linha por minuto (ts): a última leitura do minuto prevalece"""
+    conn.execute(
+        f"INSERT OR REPLACE INTO kpi_snapshots (ts, {', '.join(KPI_SNAPSHOT_COLUMNS)}, partial_errors) "
+        f"VALUES ({', '.join('?' * (len(KPI_SNAPSHOT_COLUMNS) + 2))})",
+        (ts, *(values.get(c) for c in KPI_SNAPSHOT_COLUMNS), int(partial_errors)),
+    )
+
+
+def _write_batch(conn, events: list[tuple]) -> dict:
+    """
+    Aplica um lote numa transação, coalescendo antes: incrementos do resumo
+    diário somados por data, por tipo de erro só a primeira ocorrência e,
+    por minuto, só o último snapshot de KPIs
+    """
+    summaries = defaultdict(lambda: defaultdict(int))
+    errors = {}
+    logins = []
+    kpis = {}
+    for kind, payload in events:
+        if kind == "summary":
+            date_str, counters = payload
+            for c, v in counters.items():
+                summaries[date_str][c] += v
+        elif kind == "error":
+            errors.setdefault(payload[0], payload)
+        elif kind == "login":
+            logins.append(payload)
+        elif kind == "kpi":
+            kpis[payload[0]] = payload
+
+    logged = []
+    with conn:
+        for date_str, counters in summaries.items():
+            _write_summary(conn, date_str, counters)
+        for error_type, details, ts in errors.values():
+            if _write_error(conn, error_type, details, ts):
+                logged.append((error_type, details))
+        for username, login_time in logins:
+            _write_login(conn, username, login_time)
+        for ts, values, partial_errors in kpis.values():
+            _write_kpi(conn, ts, values, partial_errors)
+    for error_type, details in logged:
+        print(f"✅ Erro logado: {error_type} - {details}")
+    return {"summaries": len(summaries), "errors": len(logged), "logins": len(logins), "kpis": len(kpis)}
+
+
+class HistoryWriter:
+    """
+    Fila de eventos de histórico + thread gravadora
+
+    - put() nunca bloqueia: com a fila cheia o evento é descartado e contado em "dropped"
+    - a thread espera o primeiro evento, junta o que chegar em HISTORY_FLUSH_WINDOW_SEC
+      (até HISTORY_BATCH_MAX) e grava o lote numa transação
+    - stop() (registrado no atexit) drena a fila antes de o processo sair
+    """
+
+    def __init__(self, window_sec: float = HISTORY_FLUSH_WINDOW_SEC, max_queue: int = HISTORY_QUEUE_MAX,
+                 batch_max: int = HISTORY_BATCH_MAX, path: str | None = None):
+        self.window_sec = window_sec
+        self.batch_max = batch_max
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._idle = threading.Condition()
+        self._pending = 0       # enfileirados e ainda não gravados (inclui o lote em gravação)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0,
+            "queue_peak": 0, "flush_ms_last": 0.0, "flush_ms_max": 0.0,
+        }
+
+    # ---------- produtor ----------
+    def put(self, kind: str, payload: tuple) -> bool:
+        self._ensure_started()
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((kind, payload))
+        except queue.Full:
+            with self._idle:
+                self._pending -= 1
+                self._stats["dropped"] += 1
+                dropped = self._stats["dropped"]
+                self._idle.notify_all()
+            if dropped % 1000 == 1:   # avisa no primeiro descarte e depois a cada mil
+                print(f"⚠️ Fila do histórico cheia: {dropped} evento(s) descartado(s)")
+            return False
+        with self._idle:
+            self._stats["enqueued"] += 1
+            self._stats["queue_peak"] = max(self._stats["queue_peak"], self._queue.qsize())
+        return True
+
+    # ---------- consumidor ----------
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list[tuple]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.window_sec
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Sem esperar mais: o que já estiver na fila entra no mesmo lote
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[tuple]) -> None:
+        t0 = time.perf_counter()
+        try:
+            _write_batch(get_history_conn(self.path), batch)
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"❌ Erro ao gravar {len(batch)} eventos no histórico: {e}")
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self._stats["flush_ms_last"] = ms
+            self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], ms)
+            with self._idle:
+                self._pending -= len(batch)
+                self._idle.notify_all()
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+    # ---------- controle ----------
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera a fila esvaziar (True se conseguiu dentro do timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Drena a fila e encerra a thread (chamado no atexit)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {**self._stats, "queue_depth": self._queue.qsize(), "pending": self._pending,
+                "alive": self._thread is not None and self._thread.is_alive()}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer() -> HistoryWriter:
+    """Gravador único do processo (a thread sobe no primeiro evento)"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = HistoryWriter()
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def submit_event(kind: str, payload: tuple) -> None:
+    """Enfileira um evento ("summary" | "error" | "login" | "kpi"); sem HISTORY_WRITER_ASYNC grava na hora"""
+    if HISTORY_WRITER_ASYNC:
+        get_history_writer().put(kind, payload)
+    else:
+        _write_batch(get_history_conn(), [(kind, payload)])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers de execução concorrente compatíveis com o Streamlit
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .config import SINGLE_FLIGHT_WAIT_SEC, SINGLE_FLIGHT_WAIT_DEFAULT_SEC
+
+
+def with_script_ctx(fn):
+    """
+    Embrulha fn para rodar em outra thread com o ScriptRunContext da sessão atual,
+    permitindo que st.cache_data/st.secrets/st.error funcionem no worker
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx, add_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return fn
+    if ctx is None:
+        return fn
+
+    def _wrapped(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return _wrapped
+
+
+def run_parallel(tasks: dict, max_workers: int | None = None, timeout: float | None = None) -> tuple[dict, dict]:
+    """
+    Executa {nome: (fn, args)} em paralelo, com prazo total de timeout segundos
+    Retorna: (resultados por nome, exceções por nome)
+    """
+    results, errors = {}, {}
+    if not tasks:
+        return results, errors
+
+    pool = ThreadPoolExecutor(max_workers=max_workers or len(tasks), thread_name_prefix="monitor-dw")
+    try:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures = {name: pool.submit(with_script_ctx(fn), *args) for name, (fn, args) in tasks.items()}
+        for name, fut in futures.items():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                results[name] = fut.result(timeout=remaining)
+            except Exception as e:
+                errors[name] = e
+    finally:
+        # Não espera tarefas que estouraram o timeout; elas terminam em segundo plano
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results, errors
+
+
+# Último instante (monotônico) em que cada tarefa periódica rodou neste processo
+_throttle_lock = threading.Lock()
+_throttle_last: dict[str, float] = {}
+_throttle_running: set[str] = set()
+
+
+def run_throttled(key: str, interval_sec: float, fn, *args):
+    """
+    Executa fn(*args) no máximo uma vez a cada interval_sec por processo
+    Retorna None quando pulou (cedo demais ou outra thread já está executando)
+    """
+    with _throttle_lock:
+        now = time.monotonic()
+        if key in _throttle_running or now - _throttle_last.get(key, float("-inf")) < interval_sec:
+            return None
+        _throttle_running.add(key)
+        _throttle_last[key] = now
+    try:
+        return fn(*args)
+    finally:
+        with _throttle_lock:
+            _throttle_running.discard(key)
+
+
+# Execuções em andamento no processo: (grupo, chave) -> (Future, thread que executa)
+_flight_lock = threading.Lock()
+_in_flight: dict = {}
+_flight_stats: dict[str, dict] = {}
+
+
+class _Abandoned(Exception):
+    """O líder foi interrompido (BaseException, ex.: rerun do Streamlit) sem resultado"""
+
+
+def single_flight(group: str, key, fn, *args, **kwargs):
+    """
+    Executa fn(*args, **kwargs) uma vez por chave no processo: chamadas concorrentes
+    com a mesma (grupo, chave) esperam o resultado (ou a exceção) da primeira
+    Só Exception é repassada a quem espera; se o líder for interrompido, quem esperava
+    tenta de novo (e um deles vira o líder). A espera tem limite por fonte
+    (SINGLE_FLIGHT_WAIT_SEC) e termina em TimeoutError
+    """
+    flight_key = (group, key)
+    me = threading.get_ident()
+    wait_sec = SINGLE_FLIGHT_WAIT_SEC.get(group, SINGLE_FLIGHT_WAIT_DEFAULT_SEC)
+    while True:
+        with _flight_lock:
+            stats = _flight_stats.setdefault(group, {"leaders": 0, "coalesced": 0})
+            flight = _in_flight.get(flight_key)
+            if flight is None:
+                future = Future()
+                _in_flight[flight_key] = (future, me)
+                stats["leaders"] += 1
+            elif flight[1] != me:
+                stats["coalesced"] += 1
+        if flight is None:
+            break
+        if flight[1] == me:   # reentrada na mesma thread: esperar a si mesma seria deadlock
+            return fn(*args, **kwargs)
+        try:
+            return flight[0].result(timeout=wait_sec)
+        except _Abandoned:
+            continue
+        except FutureTimeoutError:
+            raise TimeoutError(f"{group}: consulta igual em outra sessão passou de {wait_sec:g}s") from None
+
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        with _flight_lock:
+            _in_flight.pop(flight_key, None)
+        future.set_exception(e)
+        raise
+    except BaseException:
+        with _flight_lock:
+            _in_flight.pop(flight_key, None)
+        future.set_exception(_Abandoned())
+        raise
+    with _flight_lock:
+        _in_flight.pop(flight_key, None)
+    future.set_result(result)
+    return result
+
+
+def single_flight_stats() -> dict:
+    """Por grupo: execuções de fato (leaders), chamadas poupadas (coalesced) e em andamento"""
+    with _flight_lock:
+        running: dict[str, int] = {}
+        for group, _ in _in_flight:
+            running[group] = running.get(group, 0) + 1
+        return {g: {**s, "in_flight": running.get(g, 0)} for g, s in _flight_stats.items()}
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Retenção e rollups do histórico local
+
+error_counts e user_logins ficam brutos por HISTORY_RAW_DAYS; antes de sair
+viram contagens por hora (HISTORY_HOURLY_DAYS) e, por fim, por dia (sem
+expirar). Cada rodada avança marcas d'água em retention_state, então só o
+trecho novo é agregado; os deletes são feitos em lotes limitados e cada
+rodada devolve parte das páginas livres (vacuum incremental) e roda ANALYZE.
+
+Cobertura sem dupla contagem: diário para dias < daily_wm, horário para
+[daily_wm, hourly_wm) e bruto a partir de hourly_wm. As consultas abaixo
+escolhem a resolução mais barata que ainda cobre a janela pedida.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from .config import (
+    HISTORY_RAW_DAYS, HISTORY_HOURLY_DAYS, HISTORY_RETENTION_INTERVAL_SEC, HISTORY_DELETE_BATCH,
+    HISTORY_DELETE_MAX_BATCHES, HISTORY_ROLLUP_MAX_DAYS, HISTORY_VACUUM_PAGES,
+)
+from .history import get_history_conn
+from .parallel import run_throttled
+
+ROLLUP_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS retention_state (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS error_counts_hourly (
+        hour TEXT NOT NULL,
+        error_type TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (hour, error_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS error_counts_daily (
+        day TEXT NOT NULL,
+        error_type TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (day, error_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_logins_hourly (
+        hour TEXT NOT NULL,
+        username TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        last_login TEXT NOT NULL,
+        PRIMARY KEY (hour, username)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_logins_daily (
+        day TEXT NOT NULL,
+        username TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        last_login TEXT NOT NULL,
+        PRIMARY KEY (day, username)
+    )
+    """,
+)
+
+_HOUR_FMT = "%Y-%m-%d %H:00:00"
+
+
+# ======================== HELPERS ========================
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _hour_floor(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _sql_ts(dt: datetime) -> str:
+    """Formato do error_counts.timestamp (CURRENT_TIMESTAMP)"""
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _iso_ts(dt: datetime) -> str:
+    """Formato do user_logins.login_time (isoformat) — comparável como texto"""
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _get_state(conn, name: str) -> str | None:
+    row = conn.execute("SELECT value FROM retention_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_state(conn, name: str, value: str) -> None:
+    conn.execute(
+        "INSERT INTO retention_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+        (name, value),
+    )
+
+
+def _watermarks(conn) -> tuple[datetime | None, str | None]:
+    """(hourly_wm, daily_wm): horas < hourly_wm estão em *_hourly; dias < daily_wm em *_daily"""
+    hourly = _get_state(conn, "hourly_wm")
+    return (datetime.strptime(hourly, "%Y-%m-%d %H:%M:%S") if hourly else None), _get_state(conn, "daily_wm")
+
+
+# ======================== ROLLUPS ========================
+def _rollup_hourly(conn, now: datetime) -> int:
+    """Agrega o bruto em horas fechadas a partir da marca d'água (relendo 1h de sobreposição)"""
+    hourly_wm, _ = _watermarks(conn)
+    if hourly_wm is None:
+        first = conn.execute(
+            "SELECT MIN(t) FROM (SELECT MIN(timestamp) AS t FROM error_counts "
+            "UNION ALL SELECT MIN(datetime(login_time)) FROM user_logins)"
+        ).fetchone()[0]
+        hourly_wm = _hour_floor(datetime.strptime(first[:19], "%Y-%m-%d %H:%M:%S")) if first else _hour_floor(now)
+    start = hourly_wm - timedelta(hours=1)
+    end = min(_hour_floor(now), start + timedelta(days=HISTORY_ROLLUP_MAX_DAYS))
+    if end <= start:
+        return 0
+
+    # Recontagem completa de cada hora do intervalo (idempotente): eventos atrasados entram na sobreposição
+    cur = conn.execute(f"""
+        INSERT INTO error_counts_hourly (hour, error_type, n)
+        SELECT strftime('{_HOUR_FMT}', timestamp), error_type, COUNT(*)
+        FROM error_counts
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY 1, 2
+        ON CONFLICT (hour, error_type) DO UPDATE SET n = excluded.n
+    """, (_sql_ts(start), _sql_ts(end)))
+    rows = cur.rowcount
+    cur = conn.execute(f"""
+        INSERT INTO user_logins_hourly (hour, username, n, last_login)
+        SELECT strftime('{_HOUR_FMT}', login_time), username, COUNT(*), MAX(login_time)
+        FROM user_logins
+        WHERE login_time >= ? AND login_time < ?
+        GROUP BY 1, 2
+        ON CONFLICT (hour, username) DO UPDATE SET n = excluded.n, last_login = excluded.last_login
+    """, (_iso_ts(start), _iso_ts(end)))
+    _set_state(conn, "hourly_wm", _sql_ts(end))
+    return rows + cur.rowcount
+
+
+def _rollup_daily(conn) -> int:
+    """Agrega as horas em dias completos (dias antes do dia da marca horária)"""
+    hourly_wm, daily_wm = _watermarks(conn)
+    if hourly_wm is None:
+        return 0
+    end_day = hourly_wm.strftime("%Y-%m-%d")
+    if daily_wm is None:
+        first = conn.execute(
+            "SELECT MIN(h) FROM (SELECT MIN(hour) AS h FROM error_counts_hourly UNION ALL SELECT MIN(hour) FROM user_logins_hourly)"
+        ).fetchone()[0]
+        daily_wm = first[:10] if first else end_day
+    start_day = (datetime.strptime(daily_wm, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    if end_day <= start_day:
+        return 0
+
+    cur = conn.execute("""
+        INSERT INTO error_counts_daily (day, error_type, n)
+        SELECT substr(hour, 1, 10), error_type, SUM(n)
+        FROM error_counts_hourly
+        WHERE hour >= ? AND hour < ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, error_type) DO UPDATE SET n = excluded.n
+    """, (start_day, end_day))
+    rows = cur.rowcount
+    cur = conn.execute("""
+        INSERT INTO user_logins_daily (day, username, n, last_login)
+        SELECT substr(hour, 1, 10), username, SUM(n), MAX(last_login)
+        FROM user_logins_hourly
+        WHERE hour >= ? AND hour < ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, username) DO UPDATE SET n = excluded.n, last_login = excluded.last_login
+    """, (start_day, end_day))
+    _set_state(conn, "daily_wm", end_day)
+    return rows + cur.rowcount
+
+
+# ======================== EXPURGO ========================
+def _delete_batched(conn, table: str, where: str, params: tuple) -> int:
+    """DELETE em lotes de HISTORY_DELETE_BATCH (uma transação curta por lote)"""
+    total = 0
+    for _ in range(HISTORY_DELETE_MAX_BATCHES):
+        with conn:
+            n = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                (*params, HISTORY_DELETE_BATCH),
+            ).rowcount
+        total += n
+        if n < HISTORY_DELETE_BATCH:
+            break
+    return total
+
+
+def _purge(conn, now: datetime) -> dict:
+    hourly_wm, daily_wm = _watermarks(conn)
+    if hourly_wm is None or daily_wm is None:
+        return {}
+    # Só sai do bruto o que já está no horário, e do horário o que já está no diário
+    raw_cutoff = min(now - timedelta(days=HISTORY_RAW_DAYS), hourly_wm - timedelta(hours=1))
+    # (o dia anterior a daily_wm fica no horário: o rollup diário o relê como sobreposição)
+    overlap_day = (datetime.strptime(daily_wm, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    hourly_cutoff = min((now - timedelta(days=HISTORY_HOURLY_DAYS)).strftime("%Y-%m-%d"), overlap_day)
+    detail_cutoff = _sql_ts(now - timedelta(days=HISTORY_HOURLY_DAYS))
+    return {
+        "error_counts": _delete_batched(conn, "error_counts", "timestamp < ?", (_sql_ts(raw_cutoff),)),
+        "user_logins": _delete_batched(conn, "user_logins", "login_time < ?", (_iso_ts(raw_cutoff),)),
+        "error_counts_hourly": _delete_batched(conn, "error_counts_hourly", "hour < ?", (hourly_cutoff,)),
+        "user_logins_hourly": _delete_batched(conn, "user_logins_hourly", "hour < ?", (hourly_cutoff,)),
+        # Tabelas de detalhe sem rollup: mesma janela do horário
+        "query_lifecycle": _delete_batched(
+            conn, "query_lifecycle", "end_state <> 'running' AND starttime < ?", (detail_cutoff,)
+        ),
+        "auto_cancel_audit": _delete_batched(conn, "auto_cancel_audit", "ts < ?", (detail_cutoff,)),
+    }
+
+
+def _maintenance(conn) -> list[str]:
+    """
+    ANALYZE (PRAGMA optimize) e vacuum incremental a cada rodada
+    Um VACUUM completo reconstrói o arquivo segurando o lock de escrita e trava o
+    gravador do histórico; com auto_vacuum = INCREMENTAL cada rodada só devolve até
+    HISTORY_VACUUM_PAGES páginas livres, numa operação curta
+    """
+    done = []
+    conn.execute("PRAGMA optimize")
+    done.append("optimize")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:   # 2 = INCREMENTAL
+        # Banco criado antes do modo incremental: a troca só vale depois de um VACUUM (uma única vez)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        try:
+            conn.execute("VACUUM")
+            done.append("vacuum")
+        except Exception as e:
+            # outra conexão com transação aberta: tenta de novo na próxima rodada
+            print(f"⚠️ Conversão do histórico para vacuum incremental adiada: {e}")
+        return done
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages:
+        # executescript roda o PRAGMA até o fim; com execute o sqlite3 do Python libera uma página só
+        conn.executescript(f"PRAGMA incremental_vacuum({int(HISTORY_VACUUM_PAGES)});")
+        done.append(f"incremental_vacuum:{min(free_pages, HISTORY_VACUUM_PAGES)}")
+    return done
+
+
+# ======================== EXECUÇÃO ========================
+def ensure_rollup_schema(conn) -> None:
+    for ddl in ROLLUP_DDL:
+        conn.execute(ddl)
+
+
+def run_retention() -> dict:
+    """Uma rodada: dedup recente, rollup horário e diário, expurgo em lotes e manutenção"""
+    from .db import cleanup_duplicate_errors
+
+    t0 = time.perf_counter()
+    now = _utc_now()
+    conn = get_history_conn()
+    with conn:
+        ensure_rollup_schema(conn)
+        hourly_wm, _ = _watermarks(conn)
+    # Dedup antes do rollup e só no trecho que ele ainda vai contar (a partir da hora de
+    # sobreposição): linhas já agregadas no horário não mudam, e bruto e horário seguem batendo
+    cleanup_duplicate_errors(since=None if hourly_wm is None else _sql_ts(hourly_wm - timedelta(hours=1)))
+    with conn:
+        hourly_rows = _rollup_hourly(conn, now)
+        daily_rows = _rollup_daily(conn)
+    purged = _purge(conn, now)
+    maintenance = _maintenance(conn)
+    result = {
+        "hourly_rows": hourly_rows, "daily_rows": daily_rows, "purged": purged,
+        "maintenance": maintenance, "elapsed_sec": round(time.perf_counter() - t0, 3),
+    }
+    print(f"✅ Retenção do histórico: {result}")
+    return result
+
+
+def maybe_run_retention() -> None:
+    """Sem coletor: dispara run_retention em segundo plano, no máximo 1x por HISTORY_RETENTION_INTERVAL_SEC"""
+    def _start():
+        threading.Thread(target=_safe_run, name="history-retention", daemon=True).start()
+        return True
+
+    run_throttled("history_retention", HISTORY_RETENTION_INTERVAL_SEC, _start)
+
+
+def _safe_run() -> None:
+    try:
+        run_retention()
+    except Exception as e:
+        print(f"⚠️ Retenção do histórico: {e}")
+
+
+# ======================== CONSULTAS ========================
+def _window(days: int, now: datetime) -> tuple[str, datetime]:
+    """Resolução da janela: raw (≤ HISTORY_RAW_DAYS), hourly (≤ HISTORY_HOURLY_DAYS) ou daily"""
+    since = now - timedelta(days=days)
+    if days <= HISTORY_RAW_DAYS:
+        return "raw", since
+    if days <= HISTORY_HOURLY_DAYS:
+        return "hourly", _hour_floor(since)
+    return "daily", since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sources(conn, days: int) -> tuple[str, datetime, datetime | None, str | None]:
+    with conn:
+        ensure_rollup_schema(conn)
+        hourly_wm, daily_wm = _watermarks(conn)
+    resolution, since = _window(days, _utc_now())
+    if hourly_wm is None or resolution == "raw":
+        return "raw", since, None, None
+    if daily_wm is None or resolution == "hourly":
+        return "hourly", since, hourly_wm, None
+    return "daily", since, hourly_wm, daily_wm
+
+
+def get_error_counts(days: int = 7) -> dict:
+    """Erros por tipo na janela, lidos na resolução adequada"""
+    conn = get_history_conn()
+    resolution, since, hourly_wm, daily_wm = _sources(conn, days)
+    if resolution == "raw":
+        sql, params = "SELECT error_type, COUNT(*) AS n FROM error_counts WHERE timestamp >= ? GROUP BY 1", (_sql_ts(since),)
+    else:
+        raw_from = max(since, hourly_wm)
+        parts = [
+            "SELECT error_type, COUNT(*) AS n FROM error_counts WHERE timestamp >= ? GROUP BY 1",
+            "SELECT error_type, SUM(n) FROM error_counts_hourly WHERE hour >= ? AND hour < ? GROUP BY 1",
+        ]
+        hourly_from = _sql_ts(since) if daily_wm is None else max(_sql_ts(since), daily_wm)
+        params = [_sql_ts(raw_from), hourly_from, _sql_ts(hourly_wm)]
+        if daily_wm is not None:
+            parts.append("SELECT error_type, SUM(n) FROM error_counts_daily WHERE day >= ? AND day < ? GROUP BY 1")
+            params += [since.strftime("%Y-%m-%d"), daily_wm]
+        sql = f"SELECT error_type, SUM(n) FROM ({' UNION ALL '.join(parts)}) GROUP BY 1"
+    return {k: int(v) for k, v in conn.execute(sql, params).fetchall()}
+
+
+def get_login_stats(days: int = 7) -> list[tuple]:
+    """Logins por usuário na janela: (username, logins, último login), na resolução adequada"""
+    conn = get_history_conn()
+    resolution, since, hourly_wm, daily_wm = _sources(conn, days)
+    if resolution == "raw":
+        sql = "SELECT username, COUNT(*) AS n, MAX(login_time) AS last FROM user_logins WHERE login_time >= ? GROUP BY 1"
+        params = [_iso_ts(since)]
+    else:
+        raw_from = max(since, hourly_wm)
+        parts = [
+            "SELECT username, COUNT(*) AS n, MAX(login_time) AS last FROM user_logins WHERE login_time >= ? GROUP BY 1",
+            "SELECT username, SUM(n), MAX(last_login) FROM user_logins_hourly WHERE hour >= ? AND hour < ? GROUP BY 1",
+        ]
+        hourly_from = _sql_ts(since) if daily_wm is None else max(_sql_ts(since), daily_wm)
+        params = [_iso_ts(raw_from), hourly_from, _sql_ts(hourly_wm)]
+        if daily_wm is not None:
+            parts.append("SELECT username, SUM(n), MAX(last_login) FROM user_logins_daily WHERE day >= ? AND day < ? GROUP BY 1")
+            params += [since.strftime("%Y-%m-%d"), daily_wm]
+        sql = f"SELECT username, SUM(n), MAX(last) FROM ({' UNION ALL '.join(parts)}) GROUP BY 1"
+    return conn.execute(f"SELECT * FROM ({sql}) ORDER BY 2 DESC", params).fetchall()
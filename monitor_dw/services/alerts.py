@@ -7,6 +7,7 @@ import json
 import time
 import requests
 import streamlit as st
+from ..breaker import CircuitOpenError, backoff_delay, get_breaker
 from ..config import TZ
 from datetime import datetime
 
@@ -33,20 +34,39 @@ def slack_post(text: str = "", blocks: list | None = None, webhook_url: str | No
     if blocks:
         payload["blocks"] = blocks
 
-    backoff = 1.0
+    breaker = get_breaker("slack")
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        return False, str(e)
+    ok, message, source_down = _slack_send(url, payload, timeout)
+    if ok:
+        breaker.record_success()
+    elif source_down:
+        breaker.record_failure(message)
+    else:
+        breaker.record_reachable()
+    return ok, message
+
+
+def _slack_send(url: str, payload: dict, timeout: int) -> tuple[bool, str, bool]:
+    """
+    POST no webhook com retry para 429/5xx
+    Retorna: (success, message, source_down) — source_down conta para o circuit breaker
+    """
     last_err = "desconhecido"
-    for _ in range(4):
+    for attempt in range(4):
         try:
             resp = requests.post(url, headers={"Content-type": "application/json"}, data=json.dumps(payload), timeout=timeout)
             if resp.status_code in (200, 204):
-                return True, "ok"
+                return True, "ok", False
             if resp.status_code == 404:
                 # Webhook inválido/revogado ou endpoint não encontrado
                 body = resp.text[:200]
                 if "no_service" in body.lower():
-                    return False, f"🚨 Webhook Slack foi REVOGADO ou não existe mais (404 no_service). Você precisa criar um novo webhook no Slack. Resposta: {body}"
+                    return False, f"🚨 Webhook Slack foi REVOGADO ou não existe mais (404 no_service). Você precisa criar um novo webhook no Slack. Resposta: {body}", False
                 else:
-                    return False, f"Endpoint não encontrado (404). URL pode estar incorreta. Resposta: {body}"
+                    return False, f"Endpoint não encontrado (404). URL pode estar incorreta. Resposta: {body}", False
             if resp.status_code == 429:
                 retry_after = int(resp.headers.get("Retry-After", "1"))
                 time.sleep(retry_after + 1)
@@ -54,17 +74,17 @@ def slack_post(text: str = "", blocks: list | None = None, webhook_url: str | No
                 continue
             if 500 <= resp.status_code < 600:
                 last_err = f"{resp.status_code} server error. body={resp.text[:200]}"
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 8)
+                if attempt < 3:
+                    time.sleep(backoff_delay(attempt, 1.0, 8))
                 continue
-            return False, f"{resp.status_code} client error. body={resp.text[:200]}"
+            return False, f"{resp.status_code} client error. body={resp.text[:200]}", False
         except requests.exceptions.Timeout:
-            return False, f"Timeout ao conectar com Slack (>{timeout}s)"
+            return False, f"Timeout ao conectar com Slack (>{timeout}s)", True
         except requests.exceptions.ConnectionError:
-            return False, "Erro de conexão com Slack. Verifique sua internet."
+            return False, "Erro de conexão com Slack. Verifique sua internet.", True
         except Exception as e:
-            return False, f"Erro inesperado: {str(e)}"
-    return False, last_err
+            return False, f"Erro inesperado: {str(e)}", True
+    return False, last_err, last_err.startswith("5")
 
 
 def _fmt_sql_list(df_list, max_items: int = 5) -> str:
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Auto-cancelamento de queries longas do Redshift
+
+Regras de duração máxima por usuário e por fingerprint (padrão de SQL), com
+listas de exceção, ficam em AUTO_CANCEL_POLICY_PATH (JSON). A cada rodada do
+coletor o stv_recents é avaliado; as queries acima do limite recebem CANCEL
+(ou pg_terminate_backend) por um pool dedicado, e toda decisão — inclusive em
+dry-run — vai para a tabela auto_cancel_audit do histórico local.
+
+Exemplo de política:
+    {
+      "default_max_min": 180,
+      "action": "cancel",
+      "users": {"bi_user": 60, "etl_batch": {"max_min": 240, "action": "terminate"}},
+      "fingerprints": {"3bc8572f": 30},
+      "allow_users": ["rdsdb"],
+      "allow_fingerprints": []
+    }
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from ..config import (
+    TZ, AUTO_CANCEL_ENABLED, AUTO_CANCEL_DRY_RUN, AUTO_CANCEL_POLICY_PATH,
+    AUTO_CANCEL_MAX_ATTEMPTS,
+)
+from ..db import get_redshift_admin_pool, run_query
+from ..history import get_history_conn
+from .fingerprint import fingerprint
+from .query_tracker import _Q_RUNNING
+
+ACTIONS = ("cancel", "terminate")
+DEFAULT_POLICY = {
+    "default_max_min": None,   # sem limite global: só as regras explícitas cancelam
+    "action": "cancel",
+    "users": {},
+    "fingerprints": {},
+    "allow_users": ["rdsdb"],
+    "allow_fingerprints": [],
+}
+
+
+# ======================== POLÍTICA ========================
+def load_policy(path: str = AUTO_CANCEL_POLICY_PATH) -> dict:
+    """Lê a política do JSON (arquivo ausente = política padrão, que não cancela nada)"""
+    policy = dict(DEFAULT_POLICY)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            policy.update(json.load(f))
+    if policy.get("action") not in ACTIONS:
+        raise ValueError(f"Ação inválida na política de auto-cancelamento: {policy.get('action')!r}")
+    return policy
+
+
+def _rule_limit(rule, default_action: str) -> tuple[float | None, str]:
+    """Regra numérica (minutos) ou {"max_min": ..., "action": ...} -> (limite em s, ação)"""
+    if isinstance(rule, dict):
+        max_min, action = rule.get("max_min"), rule.get("action", default_action)
+    else:
+        max_min, action = rule, default_action
+    if action not in ACTIONS:
+        raise ValueError(f"Ação inválida na política de auto-cancelamento: {action!r}")
+    return (float(max_min) * 60 if max_min is not None else None), action
+
+
+def _match_fingerprint(fp: str, keys) -> str | None:
+    """Aceita o fingerprint completo ou o prefixo exibido na UI (8 caracteres)"""
+    for k in keys:
+        if k and fp.startswith(str(k).lower()):
+            return k
+    return None
+
+
+def evaluate_policy(running: pd.DataFrame, policy: dict) -> list[dict]:
+    """
+    Decide quais queries violam a política (sem efeitos colaterais)
+    Precedência: exceções > regra do fingerprint > regra do usuário > default_max_min
+    """
+    default_action = policy.get("action", "cancel")
+    allow_users = {str(u).strip() for u in policy.get("allow_users") or []}
+    violations = []
+    for r in running.itertuples(index=False):
+        user = str(r.user_name or "").strip()
+        fp = fingerprint(r.query)
+        if user in allow_users or _match_fingerprint(fp, policy.get("allow_fingerprints") or []):
+            continue
+
+        fp_key = _match_fingerprint(fp, (policy.get("fingerprints") or {}).keys())
+        if fp_key is not None:
+            limit_sec, action = _rule_limit(policy["fingerprints"][fp_key], default_action)
+            rule = f"fingerprint:{fp_key}"
+        elif user in (policy.get("users") or {}):
+            limit_sec, action = _rule_limit(policy["users"][user], default_action)
+            rule = f"user:{user}"
+        else:
+            limit_sec, action = _rule_limit(policy.get("default_max_min"), default_action)
+            rule = "default"
+
+        if limit_sec is None or float(r.duration_sec) <= limit_sec:
+            continue
+        violations.append({
+            "pid": int(r.pid),
+            "starttime": pd.Timestamp(r.starttime).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "user_name": user,
+            "fingerprint": fp,
+            "duration_sec": float(r.duration_sec),
+            "limit_sec": limit_sec,
+            "rule": rule,
+            "action": action,
+            "query_text": (r.query or "")[:2000],
+        })
+    return violations
+
+
+def _min_limit_sec(policy: dict) -> float | None:
+    """Menor limite configurado (filtra o stv_recents já na consulta)"""
+    default_action = policy.get("action", "cancel")
+    rules = [policy.get("default_max_min"), *(policy.get("users") or {}).values(),
+             *(policy.get("fingerprints") or {}).values()]
+    limits = [lim for lim, _ in (_rule_limit(r, default_action) for r in rules) if lim is not None]
+    return min(limits) if limits else None
+
+
+# ======================== REDSHIFT ========================
+def _query_running(min_duration_sec: float) -> pd.DataFrame:
+    """Queries rodando há mais de min_duration_sec (mesma consulta registrada do rastreador)"""
+    return run_query(_Q_RUNNING, {"min_duration_us": int(min_duration_sec * 1000000)})
+
+
+def _cancel(v: dict) -> str:
+    """
+    Confere se (pid, starttime) ainda é a mesma query rodando — o pid pode ter
+    sido reaproveitado desde a leitura — e então cancela/termina
+    """
+    with get_redshift_admin_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT COUNT(*) FROM stv_recents
+                WHERE pid = %s AND status = 'Running'
+                  AND ABS(DATEDIFF(ms, starttime, %s::timestamp)) <= 1000
+                """,
+                (v["pid"], v["starttime"]),
+            )
+            if not cur.fetchone()[0]:
+                return "gone"
+            if v["action"] == "terminate":
+                cur.execute("SELECT pg_terminate_backend(%s)", (v["pid"],))
+                return "terminated"
+            cur.execute(f"CANCEL {int(v['pid'])}")
+            return "cancelled"
+        finally:
+            cur.close()
+
+
+# ======================== AUDITORIA ========================
+def _already_handled(conn, violations: list[dict], dry_run: bool) -> set[tuple[int, str]]:
+    """
+    Queries já tratadas (ou que esgotaram as tentativas) não são reprocessadas;
+    um registro de dry-run não impede o cancelamento quando o modo ativo é ligado
+    """
+    if not violations:
+        return set()
+    done = set()
+    for pid, start, ok, errors in conn.execute(
+        f"""
+        SELECT pid, starttime,
+               SUM(CASE WHEN outcome != 'error' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN outcome = 'error' THEN 1 ELSE 0 END)
+        FROM auto_cancel_audit
+        WHERE dry_run = ? AND pid IN ({", ".join("?" * len(violations))})
+        GROUP BY pid, starttime
+        """,
+        [int(dry_run), *(v["pid"] for v in violations)],
+    ):
+        if ok or errors >= AUTO_CANCEL_MAX_ATTEMPTS:
+            done.add((pid, start))
+    return done
+
+
+def _audit(conn, v: dict, dry_run: bool, outcome: str, error: str | None = None) -> None:
+    conn.execute(
+        """
+        INSERT INTO auto_cancel_audit
+            (ts, pid, starttime, user_name, fingerprint, duration_sec, limit_sec, rule, action,
+             dry_run, outcome, error, query_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), v["pid"], v["starttime"], v["user_name"],
+         v["fingerprint"], v["duration_sec"], v["limit_sec"], v["rule"], v["action"], int(dry_run),
+         outcome, error, v["query_text"]),
+    )
+
+
+# ======================== EXECUÇÃO ========================
+def enforce_policy(dry_run: bool | None = None, policy: dict | None = None) -> dict:
+    """Uma rodada do motor: avalia o stv_recents e cancela (ou só audita, em dry-run)"""
+    if not AUTO_CANCEL_ENABLED:
+        return {"enabled": False}
+    dry_run = AUTO_CANCEL_DRY_RUN if dry_run is None else dry_run
+    policy = policy or load_policy()
+    min_limit = _min_limit_sec(policy)
+    if min_limit is None:
+        return {"enabled": True, "dry_run": dry_run, "violations": 0, "actions": 0}
+
+    violations = evaluate_policy(_query_running(min_limit), policy)
+    with get_history_conn() as conn:
+        handled = _already_handled(conn, violations, dry_run)
+        actions = 0
+        for v in violations:
+            if (v["pid"], v["starttime"]) in handled:
+                continue
+            if dry_run:
+                _audit(conn, v, True, "dry_run")
+                print(f"⚠️ Auto-cancel (dry-run): {v['action']} pid {v['pid']} ({v['user_name']}, "
+                      f"{v['duration_sec'] / 60:.1f} min > {v['limit_sec'] / 60:.0f} min, {v['rule']})")
+                continue
+            try:
+                outcome = _cancel(v)
+                _audit(conn, v, False, outcome)
+                actions += outcome != "gone"
+                print(f"✅ Auto-cancel: {outcome} pid {v['pid']} ({v['user_name']}, {v['rule']})")
+            except Exception as e:
+                _audit(conn, v, False, "error", str(e)[:500])
+                print(f"❌ Auto-cancel: falha em pid {v['pid']}: {e}")
+            conn.commit()
+    return {"enabled": True, "dry_run": dry_run, "violations": len(violations), "actions": actions}
+
+
+# ======================== CONSULTAS ========================
+def get_audit_log(days: int = 7, limit: int = 100) -> pd.DataFrame:
+    """Últimas decisões do auto-cancelamento (horário local)"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    df = pd.read_sql_query(
+        "SELECT * FROM auto_cancel_audit WHERE ts >= ? ORDER BY ts DESC LIMIT ?", get_history_conn(),
+        params=(since, int(limit)),
+    )
+    return pd.DataFrame({
+        "Quando": pd.to_datetime(df["ts"], utc=True).dt.tz_convert(TZ).dt.strftime("%d/%m %H:%M:%S"),
+        "PID": df["pid"],
+        "Usuário": df["user_name"],
+        "Duração (min)": (df["duration_sec"] / 60).round(1),
+        "Limite (min)": (df["limit_sec"] / 60).round(1),
+        "Regra": df["rule"],
+        "Ação": df["action"],
+        "Resultado": df["outcome"],
+        "Erro": df["error"],
+        "Query": df["query_text"].str.slice(0, 200),
+    })
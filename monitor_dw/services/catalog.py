@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Cache do catálogo do Redshift (schemas, tabelas e colunas)
+
+Uma carga em lote de pg_namespace + svv_columns alimenta a aba de
+Monitoramentos; cliques em selectbox não vão mais ao leader node. O cache
+é recarregado em segundo plano quando passa de CATALOG_TTL_SEC e pode ser
+invalidado por schema.
+"""
+
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from ..config import CATALOG_TTL_SEC
+from ..db import get_redshift_pool, register_query, run_query
+
+EXCLUDED_SCHEMAS = ("information_schema", "pg_catalog", "pg_internal")
+_EXCLUDED_SQL = ", ".join(f"'{s}'" for s in EXCLUDED_SCHEMAS)
+
+_Q_SCHEMAS = register_query("catalog.schemas", f"""
+    SELECT nspname AS schema
+    FROM pg_namespace
+    WHERE nspname NOT IN ({_EXCLUDED_SQL})
+    ORDER BY 1
+    """)
+
+_COLUMNS_SQL = f"""
+    SELECT
+      table_schema AS schema,
+      table_name AS "table",
+      column_name AS "column",
+      data_type AS type
+    FROM svv_columns
+    WHERE table_schema NOT IN ({_EXCLUDED_SQL})
+    """
+_Q_COLUMNS_ALL = register_query("catalog.svv_columns", _COLUMNS_SQL)
+_Q_COLUMNS_SCHEMA = register_query(
+    "catalog.svv_columns_schema", _COLUMNS_SQL + "  AND table_schema = %(schema)s\n", {"schema": "varchar"},
+)
+
+
+class CatalogCache:
+    """
+    Schemas → tabelas → colunas em memória, com recarga em segundo plano
+    Todo acesso ao estado passa pelo _lock; as estruturas publicadas não são
+    alteradas depois (cada carga troca a referência), então quem leu continua
+    com uma visão consistente sem segurar o lock
+    """
+
+    def __init__(self, ttl_sec: int = CATALOG_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()   # serializa a carga síncrona inicial
+        self._refreshing = False
+        self._schemas: list[str] | None = None
+        self._columns: dict[str, pd.DataFrame] = {}   # schema -> colunas de todas as tabelas
+        self._stale_schemas: set[str] = set()
+        self._schema_list_stale = False
+        self._generation = 0   # muda a cada carga completa/invalidação total: cargas parciais antigas são descartadas
+        self.loaded_at = 0.0
+        self.stats = {"full_loads": 0, "schema_loads": 0, "hits": 0, "errors": 0}
+
+    # ---------- carga ----------
+    def _fetch(self, pool, schema: str | None = None, with_columns: bool = True) -> tuple[list[str], dict]:
+        with pool.connection() as conn:
+            schemas = [str(x) for x in run_query(_Q_SCHEMAS, conn=conn)["schema"].tolist()]
+            if not with_columns:
+                return schemas, {}
+            if schema is None:
+                df = run_query(_Q_COLUMNS_ALL, conn=conn)
+            else:
+                df = run_query(_Q_COLUMNS_SCHEMA, {"schema": schema}, conn=conn)
+        df = df.sort_values(["schema", "table", "column"])
+        columns = {str(s): g.drop(columns="schema").reset_index(drop=True) for s, g in df.groupby("schema")}
+        if schema is not None:
+            columns.setdefault(schema, df.drop(columns="schema").iloc[0:0])
+        return schemas, columns
+
+    def _load_all(self, pool) -> None:
+        t0 = time.perf_counter()
+        schemas, columns = self._fetch(pool)
+        with self._lock:
+            self._schemas, self._columns = schemas, columns
+            self._stale_schemas.clear()
+            self._schema_list_stale = False
+            self._generation += 1
+            self.loaded_at = time.monotonic()
+            self.stats["full_loads"] += 1
+        print(f"✅ Catálogo do Redshift carregado: {len(schemas)} schemas em {time.perf_counter() - t0:.1f}s")
+
+    def _background_reload(self, pool) -> None:
+        try:
+            self._load_all(pool)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            print(f"⚠️ Falha ao recarregar catálogo do Redshift: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_loaded(self) -> None:
+        """Carga síncrona na primeira vez; depois, recarga em segundo plano quando expira"""
+        pool = get_redshift_pool()
+        with self._lock:
+            loaded = self._schemas is not None
+        if not loaded:
+            with self._load_lock:
+                with self._lock:
+                    loaded = self._schemas is not None
+                if not loaded:
+                    self._load_all(pool)
+            return
+        with self._lock:
+            expired = time.monotonic() - self.loaded_at > self.ttl_sec
+            if not expired or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_reload, args=(pool,),
+                         name="catalog-refresh", daemon=True).start()
+
+    def _ensure_fresh(self, schema: str | None = None) -> None:
+        """Depois de invalidate(schema): relê a lista de schemas e as colunas do schema invalidado"""
+        with self._lock:
+            reload_columns = schema is not None and schema in self._stale_schemas
+            if not (reload_columns or self._schema_list_stale):
+                return
+            generation = self._generation
+        schemas, columns = self._fetch(get_redshift_pool(), schema if reload_columns else None, reload_columns)
+        with self._lock:
+            if generation != self._generation:
+                return   # invalidação total ou carga completa no meio: esta leitura parcial ficou velha
+            self._schemas = schemas
+            self._schema_list_stale = False
+            if reload_columns:
+                self._columns = {**self._columns, schema: columns[schema]}
+                self._stale_schemas.discard(schema)
+                self.stats["schema_loads"] += 1
+
+    def _snapshot(self, schema: str | None = None) -> tuple[list[str], dict[str, pd.DataFrame]]:
+        """Garante catálogo carregado (e o schema atualizado) e devolve as referências atuais"""
+        while True:
+            self._ensure_loaded()
+            self._ensure_fresh(schema)
+            with self._lock:
+                if self._schemas is not None:   # None: invalidado por completo no meio, carrega de novo
+                    self.stats["hits"] += 1
+                    return self._schemas, self._columns
+
+    # ---------- API ----------
+    def schemas(self) -> list[str]:
+        schemas, _ = self._snapshot()
+        return list(schemas)
+
+    def tables(self, schema: str) -> list[str]:
+        _, columns = self._snapshot(schema)
+        df = columns.get(schema)
+        return [] if df is None else [str(x) for x in df["table"].drop_duplicates().tolist()]
+
+    def columns(self, schema: str, table: str) -> pd.DataFrame:
+        _, columns = self._snapshot(schema)
+        df = columns.get(schema)
+        if df is None:
+            return pd.DataFrame(columns=["column", "type"])
+        return df.loc[df["table"] == table, ["column", "type"]].reset_index(drop=True)
+
+    def invalidate(self, schema: str | None = None) -> None:
+        """
+        Sem schema: descarta tudo (próximo acesso recarrega); com schema: só as colunas
+        dele, e a lista de schemas (o schema pode ter sido criado ou removido)
+        """
+        with self._lock:
+            if schema is None:
+                self._schemas = None
+                self._columns = {}
+                self._stale_schemas.clear()
+                self._schema_list_stale = False
+                self._generation += 1
+            else:
+                self._stale_schemas.add(schema)
+                self._schema_list_stale = True
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self._schemas is not None,
+                "age_sec": time.monotonic() - self.loaded_at if self._schemas is not None else None,
+                "schemas": len(self._schemas or []),
+                "tables": sum(df["table"].nunique() for df in self._columns.values()),
+                **self.stats,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog() -> CatalogCache:
+    """Instância única do catálogo por processo"""
+    return CatalogCache()
+
+
+def invalidate_catalog(schema: str | None = None) -> None:
+    """Invalida o catálogo (todo ou de um schema)"""
+    get_catalog().invalidate(schema)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprint de SQL: a mesma consulta com datas/ids diferentes vira um único padrão
+"""
+
+import hashlib
+import re
+
+_COMMENT_LINE = re.compile(r"--[^\n]*")
+_COMMENT_BLOCK = re.compile(r"/\*.*?\*/", re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.I)
+_IN_LIST = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_VALUES_LIST = re.compile(r"\bvalues\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*", re.I)
+_SPACES = re.compile(r"\s+")
+_PUNCT = re.compile(r"\s*([=<>!,])\s*")   # "d = ?" e "d=?" viram o mesmo texto
+_PAREN_OPEN = re.compile(r"\(\s+")
+_PAREN_CLOSE = re.compile(r"\s+\)")
+
+
+def normalize_sql(sql: str | None) -> str:
+    """
+    Remove comentários e literais, colapsa listas IN/VALUES e espaços
+    Ex.: "SELECT * FROM t WHERE d = '2024-01-01' AND id IN (1, 2, 3)"
+      -> "select * from t where d=? and id in (?)"
+    """
+    if not sql:
+        return ""
+    s = _COMMENT_BLOCK.sub(" ", sql)
+    s = _COMMENT_LINE.sub(" ", s)
+    s = _STRING.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _SPACES.sub(" ", s).strip().lower()
+    s = _PUNCT.sub(r"\1", s)
+    s = _PAREN_CLOSE.sub(")", _PAREN_OPEN.sub("(", s))
+    s = _IN_LIST.sub("in (?)", s)
+    s = _VALUES_LIST.sub("values (?)", s)
+    return s.rstrip(";").strip()
+
+
+def fingerprint(sql: str | None) -> str:
+    """Hash curto (16 hex) do SQL normalizado"""
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
@@ -5,47 +5,47 @@ Cliente para consultas do Jira
 
 import requests
 import streamlit as st
+from ..breaker import get_breaker
+from ..cache import source_cache
 from ..config import TZ
 from datetime import datetime
 
 
-@st.cache_data(ttl=60, show_spinner=False)
-def jira_approx_count(jql: str) -> int:
-    """Obtém contagem aproximada de issues do Jira"""
+def _jira_post(path: str, payload: dict) -> dict:
+    """POST na API do Jira atrás do circuit breaker (timeout, falha de rede e 5xx contam como falha)"""
     s = st.secrets["jira"]
     base = s["base_url"].rstrip("/")
-    url = f"{base}/rest/api/3/search/approximate-count"
-    resp = requests.post(
-        url,
-        headers={"Accept": "application/json", "Content-Type": "application/json"},
-        json={"jql": jql},
-        auth=(s["email"], s["api_token"]),
-        timeout=12,
-    )
-    resp.raise_for_status()
-    return int(resp.json().get("count", 0))
+
+    def _post() -> dict:
+        resp = requests.post(
+            f"{base}{path}",
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            json=payload,
+            auth=(s["email"], s["api_token"]),
+            timeout=12,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    return get_breaker("jira").call(_post)
+
+
+@source_cache("jira")
+def jira_approx_count(jql: str) -> int:
+    """Obtém contagem aproximada de issues do Jira"""
+    data = _jira_post("/rest/api/3/search/approximate-count", {"jql": jql})
+    return int(data.get("count", 0))
 
 
-@st.cache_data(ttl=60, show_spinner=False)
+@source_cache("jira")
 def jira_fetch_issues(jql: str, max_results: int = 20) -> list[dict]:
     """Busca issues do Jira"""
-    s = st.secrets["jira"]
-    base = s["base_url"].rstrip("/")
-    url = f"{base}/rest/api/3/search/jql"
     payload = {
         "jql": jql + " ORDER BY updated DESC",
         "maxResults": max_results,
         "fields": ["summary", "status", "assignee", "updated"]
     }
-    resp = requests.post(
-        url,
-        headers={"Accept": "application/json", "Content-Type": "application/json"},
-        json=payload,
-        auth=(s["email"], s["api_token"]),
-        timeout=12,
-    )
-    resp.raise_for_status()
-    return resp.json().get("issues", [])
+    return _jira_post("/rest/api/3/search/jql", payload).get("issues", [])
 
 
 def get_open_tickets() -> tuple[int, list[dict]]:
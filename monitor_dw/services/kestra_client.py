@@ -5,6 +5,9 @@ Cliente para integração com Kestra API
 
 import requests
 import streamlit as st
+from ..breaker import get_breaker
+from ..cache import source_cache
+from ..config import KESTRA_MAX_FLOWS, KESTRA_RECENT_EXECUTIONS
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import base64
@@ -22,7 +25,8 @@ def get_kestra_auth_header() -> Dict[str, str]:
             "User-Agent": "MonitorDW/1.0"
         }
     except Exception as e:
-        st.error(f"Erro ao configurar autenticação Kestra: {e}")
+        # Sem st.error: também roda nas recargas do cache, fora da sessão (a UI avisa se faltar config)
+        print(f"⚠️ Erro ao configurar autenticação Kestra: {e}")
         return {}
 
 
@@ -42,210 +46,146 @@ def get_kestra_tenant() -> str:
         return "default"
 
 
-@st.cache_data(ttl=30, show_spinner=False)
-def get_kestra_flows() -> List[Dict]:
-    """Obtém lista de flows do Kestra"""
+def _kestra_request(method: str, url: str, **kwargs) -> requests.Response:
+    """Requisição ao Kestra atrás do circuit breaker: falhas de rede e 5xx contam como falha da fonte"""
+    def _send() -> requests.Response:
+        response = requests.request(method, url, **kwargs)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    return get_breaker("kestra").call(_send)
+
+
+class KestraResponseError(RuntimeError):
+    """O Kestra respondeu, mas sem dado utilizável (HTTP de erro ou corpo que não é JSON)"""
+
+
+def _kestra_get_json(url: str, headers: Dict[str, str]):
+    """
+    GET no Kestra devolvendo o JSON da resposta
+    Falhas da fonte (rede, timeout, 5xx, circuito aberto) sobem como estão; resposta sem
+    dado utilizável vira KestraResponseError. Nada é engolido: dentro do source_cache a
+    exceção faz o cache servir o último valor bom em vez de gravar uma lista vazia
+    """
+    response = _kestra_request("get", url, headers=headers, timeout=10)
+    if response.status_code != 200:
+        raise KestraResponseError(f"Erro HTTP {response.status_code}: {response.text[:200]}")
+    content_type = response.headers.get('content-type', '').lower()
+    if 'application/json' not in content_type:
+        raise KestraResponseError(f"Resposta não é JSON: {response.text[:200]}")
     try:
-        base_url = get_kestra_base_url()
-        tenant = get_kestra_tenant()
-        headers = get_kestra_auth_header()
-        
-        if not headers:
-            return []
-        
-        # URL baseada na documentação oficial: /api/v1/{tenant}/flows
-        url = f"{base_url}/api/v1/{tenant}/flows"
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                # Verificar se a resposta é JSON
-                content_type = response.headers.get('content-type', '').lower()
-                if 'application/json' in content_type:
-                    try:
-                        data = response.json()
-                        # Diferentes estruturas de resposta
-                        if isinstance(data, list):
-                            return data
-                        elif isinstance(data, dict):
-                            return data.get("results", data.get("flows", []))
-                        return []
-                    except json.JSONDecodeError:
-                        st.error(f"Erro ao decodificar JSON da resposta")
-                        return []
-                else:
-                    st.error(f"Resposta não é JSON: {response.text[:200]}")
-                    return []
-            else:
-                st.error(f"Erro na requisição: {response.status_code} - {response.text[:200]}")
-                return []
-                
-        except Exception as e:
-            st.error(f"Erro na requisição para Kestra: {e}")
-            return []
-            
-    except Exception as e:
-        st.error(f"Erro na requisição para Kestra: {e}")
+        return response.json()
+    except ValueError:
+        raise KestraResponseError(f"Erro ao decodificar JSON: {response.text[:200]}") from None
+
+
+@source_cache("kestra_flows")
+def get_kestra_flows() -> List[Dict]:
+    """Obtém lista de flows do Kestra (erros sobem: quem mostra é a UI, com render_source_badge)"""
+    base_url = get_kestra_base_url()
+    tenant = get_kestra_tenant()
+    headers = get_kestra_auth_header()
+    
+    if not headers:
         return []
+    
+    # URL baseada na documentação oficial: /api/v1/{tenant}/flows
+    data = _kestra_get_json(f"{base_url}/api/v1/{tenant}/flows", headers)
+    # Diferentes estruturas de resposta
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict):
+        return data.get("results", data.get("flows", []))
+    return []
 
 
-@st.cache_data(ttl=10, show_spinner=False)
+@source_cache("kestra")
 def get_kestra_executions(flow_id: str, limit: int = 10) -> List[Dict]:
-    """Obtém execuções de um flow específico"""
-    try:
-        base_url = get_kestra_base_url()
-        tenant = get_kestra_tenant()
-        headers = get_kestra_auth_header()
-        
-        if not headers:
-            return []
-        
-        # URL baseada na documentação oficial: /api/v1/{tenant}/executions/flows/{namespace}/{flowId}
-        url = f"{base_url}/api/v1/{tenant}/executions/flows/main/{flow_id}"
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                if 'application/json' in content_type:
-                    try:
-                        data = response.json()
-                        if isinstance(data, list):
-                            return data
-                        elif isinstance(data, dict):
-                            return data.get("results", data.get("executions", []))
-                        return []
-                    except json.JSONDecodeError:
-                        st.error(f"Erro ao decodificar JSON da resposta")
-                        return []
-                else:
-                    st.error(f"Resposta não é JSON: {response.text[:200]}")
-                    return []
-            else:
-                st.error(f"Erro na requisição: {response.status_code} - {response.text[:200]}")
-                return []
-                
-        except Exception as e:
-            st.error(f"Erro na requisição para Kestra: {e}")
-            return []
-            
-    except Exception as e:
-        st.error(f"Erro na requisição para Kestra: {e}")
+    """Obtém execuções de um flow específico (erros sobem para quem chama)"""
+    base_url = get_kestra_base_url()
+    tenant = get_kestra_tenant()
+    headers = get_kestra_auth_header()
+    
+    if not headers:
         return []
+    
+    # URL baseada na documentação oficial: /api/v1/{tenant}/executions/flows/{namespace}/{flowId}
+    data = _kestra_get_json(f"{base_url}/api/v1/{tenant}/executions/flows/main/{flow_id}", headers)
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict):
+        return data.get("results", data.get("executions", []))
+    return []
 
 
-@st.cache_data(ttl=5, show_spinner=False)
+@source_cache("kestra_status")
 def get_kestra_execution_status(execution_id: str) -> Optional[Dict]:
-    """Obtém status detalhado de uma execução específica"""
-    try:
-        base_url = get_kestra_base_url()
-        tenant = get_kestra_tenant()
-        headers = get_kestra_auth_header()
-        
-        if not headers:
-            return None
-        
-        # URL baseada na documentação oficial: /api/v1/{tenant}/executions/{executionId}
-        url = f"{base_url}/api/v1/{tenant}/executions/{execution_id}"
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Erro ao obter status da execução {execution_id}: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        st.error(f"Erro na requisição para Kestra: {e}")
+    """Obtém status detalhado de uma execução específica (erros sobem para quem chama)"""
+    base_url = get_kestra_base_url()
+    tenant = get_kestra_tenant()
+    headers = get_kestra_auth_header()
+    
+    if not headers:
         return None
+    
+    # URL baseada na documentação oficial: /api/v1/{tenant}/executions/{executionId}
+    return _kestra_get_json(f"{base_url}/api/v1/{tenant}/executions/{execution_id}", headers)
 
 
 def get_flow_status_from_docs(flow_id: str, namespace: str = "main") -> Dict:
-    """Obtém status do flow usando endpoint da documentação oficial"""
+    """
+    Obtém status do flow usando endpoint da documentação oficial
+    Resposta inválida do Kestra vira {"status": "ERROR"}; falhas da fonte
+    (rede, 5xx, circuito aberto) sobem para a UI mostrar o estado da fonte
+    """
+    base_url = get_kestra_base_url()
+    tenant = get_kestra_tenant()
+    headers = get_kestra_auth_header()
+    
+    if not headers:
+        return {"status": "ERROR", "message": "Headers não configurados"}
+    
+    # URL baseada na documentação: GET /api/v1/{tenant}/executions/flows/{namespace}/{flowId}
+    url = f"{base_url}/api/v1/{tenant}/executions/flows/{namespace}/{flow_id}"
     try:
-        base_url = get_kestra_base_url()
-        tenant = get_kestra_tenant()
-        headers = get_kestra_auth_header()
-        
-        if not headers:
-            return {"status": "ERROR", "message": "Headers não configurados"}
-        
-        # URL baseada na documentação: GET /api/v1/{tenant}/executions/flows/{namespace}/{flowId}
-        url = f"{base_url}/api/v1/{tenant}/executions/flows/{namespace}/{flow_id}"
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                if 'application/json' in content_type:
-                    try:
-                        data = response.json()
-                        
-                        # Processar resposta para extrair status
-                        if isinstance(data, list) and data:
-                            # Pegar a execução mais recente
-                            latest_execution = data[0]
-                            return {
-                                "status": "SUCCESS",
-                                "flow_id": flow_id,
-                                "namespace": namespace,
-                                "latest_execution": latest_execution,
-                                "execution_count": len(data),
-                                "last_run": latest_execution.get("createdDate"),
-                                "state": latest_execution.get("state", "UNKNOWN")
-                            }
-                        elif isinstance(data, dict):
-                            return {
-                                "status": "SUCCESS",
-                                "flow_id": flow_id,
-                                "namespace": namespace,
-                                "data": data,
-                                "message": "Dados recebidos com sucesso"
-                            }
-                        else:
-                            return {
-                                "status": "NO_EXECUTIONS",
-                                "flow_id": flow_id,
-                                "namespace": namespace,
-                                "message": "Nenhuma execução encontrada"
-                            }
-                            
-                    except json.JSONDecodeError:
-                        return {
-                            "status": "ERROR",
-                            "message": f"Erro ao decodificar JSON: {response.text[:200]}"
-                        }
-                else:
-                    return {
-                        "status": "ERROR",
-                        "message": f"Resposta não é JSON: {response.text[:200]}"
-                    }
-            else:
-                return {
-                    "status": "ERROR",
-                    "message": f"Erro HTTP {response.status_code}: {response.text[:200]}"
-                }
-                
-        except Exception as e:
-            return {
-                "status": "ERROR",
-                "message": f"Erro na requisição: {str(e)}"
-            }
-            
-    except Exception as e:
+        data = _kestra_get_json(url, headers)
+    except KestraResponseError as e:
+        return {"status": "ERROR", "message": str(e)}
+    
+    # Processar resposta para extrair status
+    if isinstance(data, list) and data:
+        # Pegar a execução mais recente
+        latest_execution = data[0]
         return {
-            "status": "ERROR",
-            "message": f"Erro geral: {str(e)}"
+            "status": "SUCCESS",
+            "flow_id": flow_id,
+            "namespace": namespace,
+            "latest_execution": latest_execution,
+            "execution_count": len(data),
+            "last_run": latest_execution.get("createdDate"),
+            "state": latest_execution.get("state", "UNKNOWN")
+        }
+    elif isinstance(data, dict):
+        return {
+            "status": "SUCCESS",
+            "flow_id": flow_id,
+            "namespace": namespace,
+            "data": data,
+            "message": "Dados recebidos com sucesso"
         }
+    return {
+        "status": "NO_EXECUTIONS",
+        "flow_id": flow_id,
+        "namespace": namespace,
+        "message": "Nenhuma execução encontrada"
+    }
 
 
 def get_flow_last_execution_status(flow_id: str) -> Dict:
-    """Obtém o status da última execução de um flow"""
+    """Obtém o status da última execução de um flow (falhas da fonte sobem para quem chama)"""
     try:
-        executions = get_kestra_executions(flow_id, limit=1)
+        executions = get_kestra_executions(flow_id)   # mesma entrada de cache das execuções recentes
         
         if not executions:
             return {
@@ -304,7 +244,7 @@ def get_flow_last_execution_status(flow_id: str) -> Dict:
             "flow_id": flow_id
         }
         
-    except Exception as e:
+    except KestraResponseError as e:
         return {
             "status": "ERROR",
             "message": f"Erro ao obter status: {str(e)}",
@@ -323,6 +263,47 @@ def get_multiple_flows_status(flow_ids: List[str]) -> Dict[str, Dict]:
     return results
 
 
+def _execution_summary(execution: Dict) -> Dict:
+    """Campos de uma execução usados pelo card (o JSON completo traz todas as task runs)"""
+    state = execution.get("state") or {}
+    return {
+        "id": execution.get("id"),
+        "state": state.get("current", "UNKNOWN"),
+        "start": state.get("startDate"),
+        "end": state.get("endDate"),
+    }
+
+
+def get_kestra_overview(flow_ids: Optional[List[str]] = None, max_flows: int = KESTRA_MAX_FLOWS,
+                        recent: int = KESTRA_RECENT_EXECUTIONS) -> Dict:
+    """
+    Dados do card do Kestra em uma passada (coletor ou snapshot do rerun): lista de flows,
+    status da última execução e execuções recentes de cada flow monitorado
+    Falha da fonte na lista de flows sobe; num flow, vira status ERROR só daquele flow
+    """
+    flows = get_kestra_flows()
+    flow_ids = list(flow_ids or [f.get("id") for f in flows[:max_flows] if f.get("id")])
+    status, executions = {}, {}
+    for flow_id in flow_ids:
+        try:
+            recent_executions = get_kestra_executions(flow_id)
+            status[flow_id] = get_flow_last_execution_status(flow_id)
+        except Exception as e:
+            recent_executions = []
+            status[flow_id] = {
+                "status": "ERROR",
+                "message": f"Erro ao obter status: {str(e)}",
+                "last_run": None,
+                "duration": None
+            }
+        executions[flow_id] = [_execution_summary(ex) for ex in recent_executions[:recent]]
+    return {
+        "flows": [{"id": f.get("id"), "namespace": f.get("namespace")} for f in flows],
+        "status": status,
+        "executions": executions,
+    }
+
+
 def trigger_kestra_flow(flow_id: str, inputs: Dict = None) -> Dict:
     """Dispara uma execução de um flow no Kestra"""
     try:
@@ -342,7 +323,7 @@ def trigger_kestra_flow(flow_id: str, inputs: Dict = None) -> Dict:
         if inputs:
             payload["inputs"] = inputs
         
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        response = _kestra_request("post", url, headers=headers, json=payload, timeout=10)
         
         if response.status_code in [200, 201]:
             return {
@@ -3,22 +3,25 @@
 Serviço de KPIs da Evino
 """
 
+import threading
+import time
+import numpy as np
 import pandas as pd
 import streamlit as st
-from ..db import get_redshift_conn
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from ..cache import source_cache
+from ..db import get_redshift_conn, register_query, run_query
+from ..history import KPI_SNAPSHOT_COLUMNS, get_history_conn, submit_event
+from ..parallel import with_script_ctx
 from ..config import (
-    TZ, FIRST_ORDER_MAGENTO, _as_date_str_local, _as_minute_str_utc, 
-    _to_tz_aware_utc, _fmt_sampa, _kfmt, _pct, get_now_kestra_style
+    TZ, FIRST_ORDER_MAGENTO, KPI_PARALLEL, KPI_QUERY_TIMEOUT_SEC, KPI_QUERY_MODE,
+    KPI_INCREMENTAL_OVERLAP_MIN, KPI_INCREMENTAL_FULL_REFRESH_SEC, _as_date_str_local,
+    _as_minute_str_utc, _to_tz_aware_utc, _fmt_sampa, _kfmt, _pct, get_now_kestra_style
 )
 from datetime import datetime, timedelta
 
 
-@st.cache_data(ttl=60, show_spinner=False)
-def kpi_get_today_revenue(now_dt: datetime) -> dict:
-    """Obtém receita do dia atual"""
-    today_local = _as_date_str_local(now_dt)
-    last_hour_utc = _as_minute_str_utc(now_dt - timedelta(hours=1))
-    sql = f"""
+_Q_TODAY_REVENUE = register_query("kpis.today_revenue", """
     SELECT
       SUM(CASE
             WHEN fo.payment_method = 'evino_adyen_boleto' THEN (fo.price_to_pay+fo.item_shipping_amount)*0.65
@@ -45,7 +48,7 @@ def kpi_get_today_revenue(now_dt: datetime) -> dict:
             WHEN fo.payment_method = 'evino_adyen_pix'    THEN (fo.price_to_pay+fo.item_shipping_amount)*0.75
             ELSE (fo.price_to_pay+fo.item_shipping_amount)
           END), 0) AS cm2,
-      SUM(CASE WHEN fo.created_at_datetime > '{last_hour_utc}' THEN
+      SUM(CASE WHEN fo.created_at_datetime > %(last_hour)s THEN
             CASE
               WHEN fo.payment_method = 'evino_adyen_boleto' THEN (fo.price_to_pay+fo.item_shipping_amount)*0.65
               WHEN fo.payment_method = 'evino_adyen_pix'    THEN (fo.price_to_pay+fo.item_shipping_amount)*0.75
@@ -54,13 +57,20 @@ def kpi_get_today_revenue(now_dt: datetime) -> dict:
           END) AS last_hour_revenue,
       MAX(created_at_datetime) AS last_order_created_at
     FROM dora_red_aggregations.ev_fact_order_item fo
-    WHERE DATE(fo.created_at_datetime) = '{today_local}'
+    WHERE DATE(fo.created_at_datetime) = %(today)s
       AND COALESCE(UPPER(fo.voucher_code), '') NOT ILIKE 'TV%%'
       AND fo.is_solid = 1
       AND fo.platform <> 'vivino'
-    """
+    """, {"today": "date", "last_hour": "timestamp"})
+
+
+@source_cache("kpis")
+def kpi_get_today_revenue(now_dt: datetime) -> dict:
+    """Obtém receita do dia atual"""
+    today_local = _as_date_str_local(now_dt)
+    last_hour_utc = _as_minute_str_utc(now_dt - timedelta(hours=1))
     with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn).fillna(0)
+        df = run_query(_Q_TODAY_REVENUE, {"today": today_local, "last_hour": last_hour_utc}, conn).fillna(0)
 
     if "last_order_created_at" in df.columns:
         df["last_order_created_at"] = pd.to_datetime(df["last_order_created_at"], utc=True)
@@ -76,15 +86,143 @@ def kpi_get_today_revenue(now_dt: datetime) -> dict:
     }
 
 
-@st.cache_data(ttl=60, show_spinner=False)
-def kpi_get_top_seller(now_dt: datetime, last_order_created_at: pd.Timestamp | None) -> dict:
-    """Obtém top seller da última hora"""
-    if last_order_created_at is None:
-        return {"top_seller": "---", "bottles": 0}
+# ======================== RECEITA DO DIA INCREMENTAL ========================
+class _RevenueAccumulator:
+    """
+    Somas da receita do dia por minuto, mantidas entre reruns
+    Cada bucket cobre (minuto, minuto + 1min], de modo que o filtro
+    "created_at_datetime > 'HH:MM'" da última hora corresponde exatamente
+    aos buckets >= HH:MM.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.day = None
+        self.buckets = {}        # minuto -> (receita, cm2, último pedido)
+        self.last_full_sync = 0.0
+        self.stats = {"full_syncs": 0, "incremental_syncs": 0, "rows_last_sync": 0}
 
+    def watermark(self) -> pd.Timestamp | None:
+        """Início da janela a reler: último bucket menos a sobreposição"""
+        if not self.buckets:
+            return None
+        return max(self.buckets) - pd.Timedelta(minutes=KPI_INCREMENTAL_OVERLAP_MIN)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_revenue_accumulator() -> _RevenueAccumulator:
+    return _RevenueAccumulator()
+
+
+_REVENUE_BUCKETS_SQL = """
+    SELECT
+      DATE_TRUNC('minute', created_at_datetime - INTERVAL '1 microsecond') AS minute,
+      SUM(gross * pay_factor) AS revenue,
+      SUM(cm2_realized * pay_factor) AS cm2,
+      MAX(created_at_datetime) AS last_order_created_at
+    FROM (
+      SELECT
+        fo.created_at_datetime,
+        fo.cm2_realized,
+        fo.price_to_pay + fo.item_shipping_amount AS gross,
+        CASE fo.payment_method
+          WHEN 'evino_adyen_boleto' THEN 0.65
+          WHEN 'evino_adyen_pix'    THEN 0.75
+          ELSE 1
+        END AS pay_factor
+      FROM dora_red_aggregations.ev_fact_order_item fo
+      WHERE DATE(fo.created_at_datetime) = %(today)s
+        AND COALESCE(UPPER(fo.voucher_code), '') NOT ILIKE 'TV%%'
+        AND fo.is_solid = 1
+        AND fo.platform <> 'vivino'
+{since_filter}    ) fo
+    GROUP BY 1
+    """
+
+# Duas consultas fixas (com e sem watermark) em vez de um filtro montado por string
+_Q_REVENUE_BUCKETS = register_query(
+    "kpis.revenue_buckets", _REVENUE_BUCKETS_SQL.format(since_filter=""), {"today": "date"},
+)
+_Q_REVENUE_BUCKETS_SINCE = register_query(
+    "kpis.revenue_buckets_since",
+    _REVENUE_BUCKETS_SQL.format(since_filter="        AND fo.created_at_datetime > %(since)s\n"),
+    {"today": "date", "since": "timestamp"},
+)
+
+
+def _query_revenue_buckets(today_local: str, since: pd.Timestamp | None) -> pd.DataFrame:
+    """Receita/cm2 do dia por minuto, apenas para pedidos depois de `since`"""
+    with get_redshift_conn() as conn:
+        if since is None:
+            return run_query(_Q_REVENUE_BUCKETS, {"today": today_local}, conn)
+        return run_query(_Q_REVENUE_BUCKETS_SINCE, {"today": today_local, "since": f"{since:%Y-%m-%d %H:%M}"}, conn)
+
+
+@source_cache("kpis")
+def kpi_get_today_revenue_incremental(now_dt: datetime) -> dict:
+    """
+    Mesmo resultado de kpi_get_today_revenue, mas lendo do Redshift só os
+    pedidos posteriores ao watermark (menos KPI_INCREMENTAL_OVERLAP_MIN minutos).
+    O dia inteiro é relido na virada do dia e a cada KPI_INCREMENTAL_FULL_REFRESH_SEC.
+    A consulta roda fora do lock; o merge descarta leituras que ficaram velhas no meio
+    """
     today_local = _as_date_str_local(now_dt)
-    last_hour_utc = (last_order_created_at - pd.Timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
-    sql = f"""
+    acc = _get_revenue_accumulator()
+
+    with acc.lock:
+        full = (
+            acc.day != today_local
+            or time.monotonic() - acc.last_full_sync > KPI_INCREMENTAL_FULL_REFRESH_SEC
+        )
+        since = None if full else acc.watermark()
+        day, last_full_sync = acc.day, acc.last_full_sync
+
+    # Somas NULL (ex.: cm2_realized nulo) chegam como NaN no frame tipado
+    df = _query_revenue_buckets(today_local, since).fillna({"revenue": 0, "cm2": 0})
+    fresh = {
+        pd.Timestamp(row.minute): (float(row.revenue), float(row.cm2), row.last_order_created_at)
+        for row in df.itertuples(index=False)
+    }
+
+    with acc.lock:
+        if full:
+            # Outra sessão já fez uma releitura completa mais nova: não a sobrescreve
+            if acc.last_full_sync == last_full_sync:
+                acc.day, acc.buckets = today_local, fresh
+                acc.last_full_sync = time.monotonic()
+                acc.stats["full_syncs"] += 1
+                acc.stats["rows_last_sync"] = len(df)
+        elif acc.day == day and acc.last_full_sync == last_full_sync:
+            # Buckets da janela de sobreposição são substituídos pela leitura nova
+            if since is not None:
+                acc.buckets = {m: v for m, v in acc.buckets.items() if m < since}
+            acc.buckets.update(fresh)
+            acc.stats["incremental_syncs"] += 1
+            acc.stats["rows_last_sync"] = len(df)
+        if acc.day == today_local:
+            buckets = dict(acc.buckets)
+        elif full:
+            buckets = fresh   # a leitura completa cobre o dia todo
+        else:
+            # Virada do dia no meio da leitura: o cache da fonte serve o último valor bom
+            raise RuntimeError(f"acumulador da receita passou para {acc.day} durante a leitura de {today_local}")
+
+    last_hour = pd.Timestamp(_as_minute_str_utc(now_dt - timedelta(hours=1)))
+    revenue = sum(v[0] for v in buckets.values())
+    cm2_sum = sum(v[1] for v in buckets.values())
+    last_hour_revenue = sum(v[0] for m, v in buckets.items() if m >= last_hour)
+    last_orders = [v[2] for v in buckets.values() if v[2] is not None and not pd.isna(v[2])]
+
+    return {
+        "today_revenue": revenue,
+        "cm1": cm2_sum / revenue if revenue else 0.0,
+        "cm2": cm2_sum / revenue if revenue else 0.0,
+        "last_hour_revenue": last_hour_revenue,
+        "last_order_created_at": _to_tz_aware_utc(max(last_orders)) if last_orders else None,
+    }
+
+
+_Q_TOP_SELLER = register_query("kpis.top_seller", """
     SELECT
       dp.name AS top_seller,
       SUM(qty_ordered) AS bottles
@@ -92,14 +230,24 @@ def kpi_get_top_seller(now_dt: datetime, last_order_created_at: pd.Timestamp | N
     JOIN dora_red_aggregations.ev_dim_product dp ON foi.sku = dp.sku
     WHERE foi.is_solid = 1
       AND foi.is_wine = 1
-      AND DATE(foi.created_at_datetime) = '{today_local}'
-      AND foi.created_at_datetime > '{last_hour_utc}'
+      AND DATE(foi.created_at_datetime) = %(today)s
+      AND foi.created_at_datetime > %(last_hour)s
     GROUP BY 1
     ORDER BY 2 DESC
     LIMIT 1
-    """
+    """, {"today": "date", "last_hour": "timestamp"})
+
+
+@source_cache("kpis")
+def kpi_get_top_seller(now_dt: datetime, last_order_created_at: pd.Timestamp | None) -> dict:
+    """Obtém top seller da última hora"""
+    if last_order_created_at is None:
+        return {"top_seller": "---", "bottles": 0}
+
+    today_local = _as_date_str_local(now_dt)
+    last_hour_utc = (last_order_created_at - pd.Timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
     with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn).fillna(0)
+        df = run_query(_Q_TOP_SELLER, {"today": today_local, "last_hour": last_hour_utc}, conn).fillna(0)
 
     if len(df) == 0:
         return {"top_seller": "---", "bottles": 0}
@@ -107,27 +255,35 @@ def kpi_get_top_seller(now_dt: datetime, last_order_created_at: pd.Timestamp | N
     return {"top_seller": str(df.at[0, "top_seller"]), "bottles": int(df.at[0, "bottles"]) }
 
 
-@st.cache_data(ttl=60, show_spinner=False)
-def kpi_get_month_flash(now_dt: datetime) -> dict:
-    """Obtém receita flash do mês"""
+def _month_range_local(now_dt: datetime) -> tuple[str, str]:
+    """Primeiro dia do mês (ou do primeiro pedido Magento) e dia atual, no fuso local"""
     first_day_local = now_dt.astimezone(TZ).strftime("%Y-%m-01")
     today_local = _as_date_str_local(now_dt)
     if today_local[:7] == FIRST_ORDER_MAGENTO[:7]:
         first_day_local = FIRST_ORDER_MAGENTO
+    return first_day_local, today_local
+
 
-    sql = f"""
+_Q_MONTH_FLASH = register_query("kpis.month_flash", """
     SELECT
       SUM(fo.price_to_pay+fo.item_shipping_amount) AS revenue_flash_sale,
       SUM(cm1_realized) / NULLIF(SUM(fo.price_to_pay+fo.item_shipping_amount), 0) AS cm1,
       SUM(cm2_realized) / NULLIF(SUM(fo.price_to_pay+fo.item_shipping_amount), 0) AS cm2
     FROM dora_red_aggregations.ev_fact_order_item fo
-    WHERE DATE(created_at_datetime) BETWEEN '{first_day_local}' AND '{today_local}'
+    WHERE DATE(created_at_datetime) BETWEEN %(first_day)s AND %(today)s
       AND COALESCE(UPPER(fo.voucher_code), '') NOT ILIKE 'TV%%'
       AND fo.platform <> 'vivino'
       AND is_solid = 1
-    """
+    """, {"first_day": "date", "today": "date"})
+
+
+@source_cache("kpis")
+def kpi_get_month_flash(now_dt: datetime) -> dict:
+    """Obtém receita flash do mês"""
+    first_day_local, today_local = _month_range_local(now_dt)
+
     with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn).fillna(0)
+        df = run_query(_Q_MONTH_FLASH, {"first_day": first_day_local, "today": today_local}, conn).fillna(0)
 
     return {
         "month_revenue_flash_sale": float(df.at[0, "revenue_flash_sale"] or 0),
@@ -136,46 +292,260 @@ def kpi_get_month_flash(now_dt: datetime) -> dict:
     }
 
 
-@st.cache_data(ttl=60, show_spinner=False)
+_Q_FUSED = register_query("kpis.fused", """
+    WITH base AS (
+      SELECT
+        fo.sku,
+        fo.is_wine,
+        fo.qty_ordered,
+        fo.created_at_datetime,
+        fo.price_to_pay + fo.item_shipping_amount AS gross,
+        fo.cm1_realized,
+        fo.cm2_realized,
+        CASE fo.payment_method
+          WHEN 'evino_adyen_boleto' THEN 0.65
+          WHEN 'evino_adyen_pix'    THEN 0.75
+          ELSE 1
+        END AS pay_factor,
+        DATE(fo.created_at_datetime) = %(today)s AS is_today,
+        COALESCE(UPPER(fo.voucher_code), '') NOT ILIKE 'TV%%' AND fo.platform <> 'vivino' AS is_kpi
+      FROM dora_red_aggregations.ev_fact_order_item fo
+      WHERE DATE(fo.created_at_datetime) BETWEEN %(first_day)s AND %(today)s
+        AND fo.is_solid = 1
+    ),
+    marked AS (
+      SELECT
+        b.*,
+        MAX(CASE WHEN is_today AND is_kpi THEN created_at_datetime END) OVER () AS last_order_created_at
+      FROM base b
+    ),
+    per_sku AS (
+      SELECT
+        sku,
+        MAX(last_order_created_at) AS last_order_created_at,
+        SUM(CASE WHEN is_today AND is_kpi THEN gross * pay_factor END) AS today_revenue,
+        SUM(CASE WHEN is_today AND is_kpi THEN cm2_realized * pay_factor END) AS today_cm2,
+        SUM(CASE WHEN is_today AND is_kpi AND created_at_datetime > %(last_hour)s
+                 THEN gross * pay_factor END) AS last_hour_revenue,
+        SUM(CASE WHEN is_kpi THEN gross END) AS month_revenue,
+        SUM(CASE WHEN is_kpi THEN cm1_realized END) AS month_cm1,
+        SUM(CASE WHEN is_kpi THEN cm2_realized END) AS month_cm2,
+        SUM(CASE WHEN is_today AND is_wine = 1
+                  AND created_at_datetime > DATE_TRUNC('minute', last_order_created_at - INTERVAL '1 hour')
+                 THEN qty_ordered END) AS top_bottles
+      FROM marked
+      GROUP BY sku
+    ),
+    totals AS (
+      SELECT
+        SUM(today_revenue) AS revenue,
+        SUM(today_cm2) / NULLIF(SUM(today_revenue), 0) AS cm1,
+        SUM(today_cm2) / NULLIF(SUM(today_revenue), 0) AS cm2,
+        SUM(last_hour_revenue) AS last_hour_revenue,
+        MAX(last_order_created_at) AS last_order_created_at,
+        SUM(month_revenue) AS revenue_flash_sale,
+        SUM(month_cm1) / NULLIF(SUM(month_revenue), 0) AS month_cm1,
+        SUM(month_cm2) / NULLIF(SUM(month_revenue), 0) AS month_cm2
+      FROM per_sku
+    ),
+    top_seller AS (
+      SELECT
+        dp.name AS top_seller,
+        SUM(ps.top_bottles) AS bottles,
+        ROW_NUMBER() OVER (ORDER BY SUM(ps.top_bottles) DESC) AS rn
+      FROM per_sku ps
+      JOIN dora_red_aggregations.ev_dim_product dp ON ps.sku = dp.sku
+      WHERE ps.top_bottles IS NOT NULL
+      GROUP BY dp.name
+    )
+    SELECT t.*, ts.top_seller, ts.bottles
+    FROM totals t
+    LEFT JOIN top_seller ts ON ts.rn = 1
+    """, {"first_day": "date", "today": "date", "last_hour": "timestamp"})
+
+
+@source_cache("kpis")
+def kpi_get_fused(now_dt: datetime) -> dict:
+    """
+    Receita do dia, receita flash do mês e top seller em uma única leitura
+    de ev_fact_order_item (mesmos dicts de kpi_get_today_revenue,
+    kpi_get_month_flash e kpi_get_top_seller)
+    """
+    first_day_local, today_local = _month_range_local(now_dt)
+    last_hour_utc = _as_minute_str_utc(now_dt - timedelta(hours=1))
+    with get_redshift_conn() as conn:
+        df = run_query(_Q_FUSED, {"first_day": first_day_local, "today": today_local, "last_hour": last_hour_utc}, conn).fillna(0)
+
+    # "totals" é um agregado sem GROUP BY: sempre exatamente uma linha
+    last_order = _to_tz_aware_utc(df.at[0, "last_order_created_at"]) if df.at[0, "last_order_created_at"] else None
+    has_top = last_order is not None and bool(df.at[0, "top_seller"])
+
+    return {
+        "today": {
+            "today_revenue": float(df.at[0, "revenue"] or 0),
+            "cm1": float(df.at[0, "cm1"] or 0),
+            "cm2": float(df.at[0, "cm2"] or 0),
+            "last_hour_revenue": float(df.at[0, "last_hour_revenue"] or 0),
+            "last_order_created_at": last_order,
+        },
+        "month": {
+            "month_revenue_flash_sale": float(df.at[0, "revenue_flash_sale"] or 0),
+            "month_cm1": float(df.at[0, "month_cm1"] or 0),
+            "month_cm2": float(df.at[0, "month_cm2"] or 0),
+        },
+        "top": {
+            "top_seller": str(df.at[0, "top_seller"]) if has_top else "---",
+            "bottles": int(df.at[0, "bottles"]) if has_top else 0,
+        },
+    }
+
+
+# ======================== CURVA INTRADIÁRIA DO FORECAST ========================
+class _ForecastCurve:
+    """
+    Receita acumulada por minuto do dia (UTC) nos mesmos dias da semana das
+    últimas 6 semanas. expected_percentage é a média, entre esses dias, da
+    fração da receita total já realizada até o minuto informado.
+    """
+
+    def __init__(self, curve_day: str, buckets: pd.DataFrame):
+        self.curve_day = curve_day
+        self.dates = sorted(buckets["d"].unique()) if len(buckets) else []
+        rev = np.zeros((len(self.dates), 1440))
+        rows = np.zeros((len(self.dates), 1440))
+        if self.dates:
+            i = buckets["d"].map({d: k for k, d in enumerate(self.dates)}).to_numpy()
+            m = (buckets["hhmi"] // 100 * 60 + buckets["hhmi"] % 100).to_numpy()
+            rev[i, m] = buckets["revenue"].fillna(0).to_numpy()
+            rows[i, m] = buckets["n_rows"].to_numpy()
+        self.cum_revenue = rev.cumsum(axis=1)
+        self.cum_rows = rows.cumsum(axis=1)
+        self.total = self.cum_revenue[:, -1]
+
+    def expected_percentage(self, hhmm: str) -> float:
+        """Equivale a AVG(parcial/NULLIF(total, 0)) ignorando dias sem pedidos até hhmm"""
+        if not self.dates:
+            return 0.0
+        m = int(hhmm[:2]) * 60 + int(hhmm[2:])
+        valid = (self.cum_rows[:, m] > 0) & (self.total != 0)
+        if not valid.any():
+            return 0.0
+        return float(np.mean(self.cum_revenue[valid, m] / self.total[valid]))
+
+
+def _forecast_comp_dates(now_dt: datetime) -> list[str]:
+    """Mesmo dia da semana nas semanas -1 a -6 (a partir do primeiro pedido Magento)"""
+    first_order = datetime.strptime(FIRST_ORDER_MAGENTO, "%Y-%m-%d").date()
+    days = [now_dt.date() - timedelta(days=7 * k) for k in range(1, 7)]
+    return [d.strftime("%Y-%m-%d") for d in days if d >= first_order]
+
+
+def _load_curve_buckets(curve_day: str) -> pd.DataFrame | None:
+    """Lê a curva do dia do histórico local (None se ainda não foi calculada)"""
+    try:
+        df = pd.read_sql_query(
+            "SELECT d, hhmi, revenue, n_rows FROM forecast_curve WHERE curve_day = ?",
+            get_history_conn(), params=(curve_day,),
+        )
+        return df if len(df) else None
+    except Exception as e:
+        print(f"⚠️ Erro ao ler curva do forecast: {e}")
+        return None
+
+
+def _save_curve_buckets(curve_day: str, buckets: pd.DataFrame) -> None:
+    """Grava a curva do dia e descarta as de dias anteriores"""
+    try:
+        with get_history_conn() as conn:
+            conn.execute("DELETE FROM forecast_curve WHERE curve_day <> ?", (curve_day,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO forecast_curve (curve_day, d, hhmi, revenue, n_rows) VALUES (?, ?, ?, ?, ?)",
+                [(curve_day, r.d, int(r.hhmi), None if pd.isna(r.revenue) else float(r.revenue), int(r.n_rows))
+                 for r in buckets.itertuples(index=False)],
+            )
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar curva do forecast: {e}")
+
+
+_Q_CURVE_BUCKETS = register_query("kpis.curve_buckets", """
+    SELECT
+      TO_CHAR(DATE(created_at_datetime), 'YYYY-MM-DD') AS d,
+      CAST(TO_CHAR(created_at_datetime, 'HH24MI') AS INTEGER) AS hhmi,
+      SUM(fo.price_to_pay+fo.item_shipping_amount) AS revenue,
+      COUNT(fo.price_to_pay+fo.item_shipping_amount) AS n_rows
+    FROM dora_red_aggregations.ev_fact_order_item fo
+    WHERE DATE(created_at_datetime) IN %(dates)s
+      AND is_solid = 1
+    GROUP BY 1, 2
+    """, {"dates": "date[]"}, prepare=False)
+
+
+def _query_curve_buckets(comp_dates: list[str]) -> pd.DataFrame:
+    """Receita por data e minuto (HH24MI) dos dias de comparação — a consulta pesada, 1x por dia"""
+    if not comp_dates:
+        return pd.DataFrame(columns=["d", "hhmi", "revenue", "n_rows"])
+    with get_redshift_conn() as conn:
+        return run_query(_Q_CURVE_BUCKETS, {"dates": tuple(comp_dates)}, conn)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_curve_holder() -> dict:
+    return {"lock": threading.Lock(), "curve": None}
+
+
+def get_forecast_curve(now_dt: datetime) -> _ForecastCurve:
+    """Curva do dia: memória → SQLite → Redshift (uma vez por dia)"""
+    curve_day = _as_date_str_local(now_dt)
+    holder = _get_curve_holder()
+    with holder["lock"]:
+        curve = holder["curve"]
+        if curve is None or curve.curve_day != curve_day:
+            buckets = _load_curve_buckets(curve_day)
+            if buckets is None:
+                t0 = time.perf_counter()
+                buckets = _query_curve_buckets(_forecast_comp_dates(now_dt))
+                _save_curve_buckets(curve_day, buckets)
+                print(f"✅ Curva do forecast de {curve_day} calculada em {time.perf_counter() - t0:.1f}s")
+            curve = holder["curve"] = _ForecastCurve(curve_day, buckets)
+    return curve
+
+
+_Q_FORECAST = register_query("kpis.forecast", """
+    SELECT rev_lastclick_plan AS today_forecast
+    FROM dora_red_aggregations.vw_ev_mkt_forecast f
+    WHERE f.date = %(today)s
+    """, {"today": "date"})
+
+
+@source_cache("kpis")
 def kpi_get_forecast(now_dt: datetime, last_order_created_at: pd.Timestamp | None) -> dict:
-    """Obtém forecast do dia"""
+    """Obtém forecast do dia (percentual esperado vem da curva pré-calculada)"""
     if last_order_created_at is None:
         return {"expected_percentage": 0.0, "today_forecast": 0.0}
 
     today_local = _as_date_str_local(now_dt)
-    first_day_comp = (now_dt.date() - timedelta(days=42)).strftime("%Y-%m-%d")
-    last_day_comp  = (now_dt.date() - timedelta(days=7)).strftime("%Y-%m-%d")
     current_time_hhmm = last_order_created_at.strftime("%H%M")
+    expected_percentage = get_forecast_curve(now_dt).expected_percentage(current_time_hhmm)
 
-    sql = f"""
-    WITH hist AS (
-      SELECT
-        TO_CHAR(DATE(created_at_datetime), 'YYYY-MM-DD') AS d,
-        SUM(CASE WHEN TO_CHAR(created_at_datetime, 'HH24MI') <= '{current_time_hhmm}'
-                 THEN (fo.price_to_pay+fo.item_shipping_amount) END) AS partial_revenue,
-        SUM( (fo.price_to_pay+fo.item_shipping_amount) ) AS total_revenue
-      FROM dora_red_aggregations.ev_fact_order_item fo
-      WHERE DATE(created_at_datetime) BETWEEN '{FIRST_ORDER_MAGENTO}' AND '{last_day_comp}'
-        AND DATE(created_at_datetime) >= '{first_day_comp}'
-        AND is_solid = 1
-        AND DATE_PART(dayofweek, DATE(fo.created_at_datetime)) = EXTRACT(DOW FROM DATE('{today_local}'))
-      GROUP BY 1
-    )
-    SELECT
-      AVG(partial_revenue/NULLIF(total_revenue,0)) AS expected_percentage,
-      (SELECT rev_lastclick_plan FROM dora_red_aggregations.vw_ev_mkt_forecast f WHERE f.date = '{today_local}') AS today_forecast
-    FROM hist
-    """
     with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn).fillna(0)
+        df = run_query(_Q_FORECAST, {"today": today_local}, conn).fillna(0)
 
     return {
-        "expected_percentage": float(df.at[0, "expected_percentage"] or 0),
-        "today_forecast": float(df.at[0, "today_forecast"] or 0),
+        "expected_percentage": expected_percentage,
+        "today_forecast": float(df.at[0, "today_forecast"] or 0) if len(df) else 0.0,
     }
 
 
-@st.cache_data(ttl=60, show_spinner=False)
+_Q_MONTH_FORECAST = register_query("kpis.month_forecast", """
+    SELECT
+      SUM(CASE WHEN DATE(date) BETWEEN %(first_day)s AND %(yesterday)s THEN rev_lastclick_plan END) AS forecast_until_yesterday,
+      SUM(rev_lastclick_plan) AS month_forecast
+    FROM dora_red_aggregations.vw_ev_mkt_forecast
+    WHERE DATE(date) BETWEEN %(first_day)s AND %(last_day)s
+    """, {"first_day": "date", "yesterday": "date", "last_day": "date"})
+
+
+@source_cache("kpis")
 def kpi_get_month_forecast(now_dt: datetime) -> dict:
     """Obtém forecast do mês"""
     yesterday_local = (now_dt - timedelta(days=1)).astimezone(TZ).strftime("%Y-%m-%d")
@@ -183,15 +553,8 @@ def kpi_get_month_forecast(now_dt: datetime) -> dict:
     aux_day = datetime(now_dt.year, now_dt.month, 28).date() + timedelta(days=4)
     last_day_local = (aux_day - timedelta(days=aux_day.day)).strftime("%Y-%m-%d")
 
-    sql = f"""
-    SELECT
-      SUM(CASE WHEN DATE(date) BETWEEN '{first_day_local}' AND '{yesterday_local}' THEN rev_lastclick_plan END) AS forecast_until_yesterday,
-      SUM(rev_lastclick_plan) AS month_forecast
-    FROM dora_red_aggregations.vw_ev_mkt_forecast
-    WHERE DATE(date) BETWEEN '{first_day_local}' AND '{last_day_local}'
-    """
     with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn).fillna(0)
+        df = run_query(_Q_MONTH_FORECAST, {"first_day": first_day_local, "yesterday": yesterday_local, "last_day": last_day_local}, conn).fillna(0)
 
     return {
         "forecast_until_yesterday": float(df.at[0, "forecast_until_yesterday"] or 0),
@@ -199,41 +562,136 @@ def kpi_get_month_forecast(now_dt: datetime) -> dict:
     }
 
 
-def get_all_kpis() -> dict:
-    """Obtém todos os KPIs de uma vez"""
-    try:
-        now = get_now_kestra_style()
-        
-        # Obter dados com tratamento de erro individual
-        try:
-            today = kpi_get_today_revenue(now)
-        except Exception as e:
-            st.error(f"Erro ao obter receita do dia: {e}")
-            today = {}
-        
-        try:
-            month = kpi_get_month_flash(now)
-        except Exception as e:
-            st.error(f"Erro ao obter dados mensais: {e}")
-            month = {}
-        
-        try:
-            top = kpi_get_top_seller(now, today.get("last_order_created_at"))
-        except Exception as e:
-            st.error(f"Erro ao obter top seller: {e}")
-            top = {}
-        
+# Rótulos usados nas mensagens de erro de cada KPI
+KPI_LABELS = {
+    "today": "receita do dia",
+    "month": "dados mensais",
+    "top": "top seller",
+    "fc_day": "forecast do dia",
+    "fc_mon": "forecast mensal",
+    "fused": "KPIs do dia/mês/top seller",
+}
+
+
+def _last_order(results: dict):
+    return results.get("today", {}).get("last_order_created_at")
+
+
+def _unpack_fused(results: dict) -> None:
+    """Espalha o resultado de kpi_get_fused nas chaves today/month/top"""
+    fused = results.pop("fused", None)
+    if fused:
+        results.update(fused)
+
+
+def _today_revenue_fn(mode: str):
+    return kpi_get_today_revenue_incremental if mode == "incremental" else kpi_get_today_revenue
+
+
+def _run_kpis_sequential(now: datetime, mode: str = KPI_QUERY_MODE) -> tuple[dict, dict]:
+    """Executa as consultas uma após a outra"""
+    results, errors = {}, {}
+    if mode == "fused":
+        steps = [("fused", lambda: kpi_get_fused(now))]
+    else:
+        today_fn = _today_revenue_fn(mode)
+        steps = [
+            ("today", lambda: today_fn(now)),
+            ("month", lambda: kpi_get_month_flash(now)),
+            ("top", lambda: kpi_get_top_seller(now, _last_order(results))),
+        ]
+    steps += [
+        ("fc_day", lambda: kpi_get_forecast(now, _last_order(results))),
+        ("fc_mon", lambda: kpi_get_month_forecast(now)),
+    ]
+    for name, fn in steps:
         try:
-            fc_day = kpi_get_forecast(now, today.get("last_order_created_at"))
+            results[name] = fn()
         except Exception as e:
-            st.error(f"Erro ao obter forecast do dia: {e}")
-            fc_day = {}
-        
+            errors[name] = e
+        _unpack_fused(results)
+    return results, errors
+
+
+def _run_kpis_parallel(now: datetime, timeout_sec: float = KPI_QUERY_TIMEOUT_SEC,
+                       mode: str = KPI_QUERY_MODE) -> tuple[dict, dict]:
+    """
+    Executa as consultas em paralelo sobre o pool de conexões
+    today/month/fc_mon (ou fused/fc_mon) começam juntas; top e fc_day começam
+    assim que last_order_created_at é conhecido. Cada consulta tem seu próprio
+    timeout e as que falham/estouram o tempo ficam de fora (resultado parcial).
+    """
+    results, errors, futures, started = {}, {}, {}, {}
+    executor = ThreadPoolExecutor(max_workers=len(KPI_LABELS), thread_name_prefix="kpis")
+
+    def _submit(name, fn, *args):
+        started[name] = time.monotonic()
+        futures[name] = executor.submit(with_script_ctx(fn), *args)
+
+    def _wait(name):
+        remaining = max(0.0, started[name] + timeout_sec - time.monotonic())
         try:
-            fc_mon = kpi_get_month_forecast(now)
+            results[name] = futures[name].result(timeout=remaining)
+        except FuturesTimeoutError:
+            errors[name] = TimeoutError(f"consulta excedeu {timeout_sec:g}s")
         except Exception as e:
-            st.error(f"Erro ao obter forecast mensal: {e}")
-            fc_mon = {}
+            errors[name] = e
+
+    try:
+        _submit("fc_mon", kpi_get_month_forecast, now)
+        if mode == "fused":
+            _submit("fused", kpi_get_fused, now)
+            _wait("fused")
+            _unpack_fused(results)
+            pending = ["fc_mon", "fc_day"]
+        else:
+            _submit("today", _today_revenue_fn(mode), now)
+            _submit("month", kpi_get_month_flash, now)
+            _wait("today")
+            _submit("top", kpi_get_top_seller, now, _last_order(results))
+            pending = ["month", "fc_mon", "top", "fc_day"]
+        _submit("fc_day", kpi_get_forecast, now, _last_order(results))
+
+        for name in pending:
+            _wait(name)
+    finally:
+        # Consultas que estouraram o timeout terminam em segundo plano e devolvem a conexão ao pool
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results, errors
+
+
+def get_all_kpis(parallel: bool | None = None, mode: str | None = None) -> dict:
+    """
+    Obtém todos os KPIs de uma vez
+    Em paralelo por padrão (ver KPI_PARALLEL); mode="fused" lê dia/mês/top seller
+    em uma única consulta e mode="incremental" acumula a receita do dia por
+    watermark (ver KPI_QUERY_MODE)
+    """
+    try:
+        now = get_now_kestra_style()
+        if parallel is None:
+            parallel = KPI_PARALLEL
+        mode = mode or KPI_QUERY_MODE
+
+        # As consultas só usam o minuto: com `now` truncado, reruns no mesmo minuto
+        # reaproveitam o cache de cada KPI (e os mesmos parâmetros no Redshift)
+        query_now = now.replace(second=0, microsecond=0)
+        t0 = time.perf_counter()
+        if parallel:
+            results, errors = _run_kpis_parallel(query_now, mode=mode)
+        else:
+            results, errors = _run_kpis_sequential(query_now, mode=mode)
+        elapsed = time.perf_counter() - t0
+
+        # Erros individuais não derrubam os demais KPIs
+        for name, e in errors.items():
+            st.error(f"Erro ao obter {KPI_LABELS[name]}: {e}")
+
+        today = results.get("today", {})
+        month = results.get("month", {})
+        top = results.get("top", {})
+        fc_day = results.get("fc_day", {})
+        fc_mon = results.get("fc_mon", {})
         
         # Calcular valores derivados com tratamento de erro
         try:
@@ -269,8 +727,36 @@ def get_all_kpis() -> dict:
             "expected_month_revenue": expected_month_revenue,
             "hora_pedido": hora_pedido,
             "diff_min": diff_min,
-            "now": now
+            "now": now,
+            "elapsed_sec": round(elapsed, 3),
+            "partial_errors": {name: str(e) for name, e in errors.items()},
         }
     except Exception as e:
         st.error(f"Erro geral ao obter KPIs: {e}")
         return {}
+
+
+# ======================== SNAPSHOTS PARA O ARQUIVO ========================
+_last_snapshot_ts = {"ts": None}
+
+
+def record_kpi_snapshot(kpis: dict) -> None:
+    """
+    Guarda os números principais de get_all_kpis em kpi_snapshots (uma linha
+    por minuto, horário UTC) para o arquivo Parquet; reruns no mesmo minuto
+    não geram novos eventos
+    """
+    if not kpis or kpis.get("now") is None:
+        return
+    ts = pd.Timestamp(kpis["now"]).tz_convert("UTC").strftime("%Y-%m-%d %H:%M:00")
+    if _last_snapshot_ts["ts"] == ts:
+        return
+    _last_snapshot_ts["ts"] = ts
+    flat = {
+        **kpis.get("today", {}), **kpis.get("month", {}), **kpis.get("fc_day", {}),
+        "expected_revenue": kpis.get("expected_revenue"),
+        "expected_month_revenue": kpis.get("expected_month_revenue"),
+        "diff_min": kpis.get("diff_min"),
+    }
+    values = {c: (float(flat[c]) if flat.get(c) is not None else None) for c in KPI_SNAPSHOT_COLUMNS}
+    submit_event("kpi", (ts, values, len(kpis.get("partial_errors") or {})))
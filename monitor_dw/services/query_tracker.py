@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Rastreador de queries longas do Redshift
+
+Compara leituras sucessivas do stv_recents por (pid, starttime) e grava o
+ciclo de vida de cada query (início, pico de duração, fim/cancelamento) na
+tabela query_lifecycle do histórico local. O stl_query só é consultado para
+as queries que sumiram desde a última leitura. Cada query recebe o fingerprint
+do SQL normalizado, o que permite agrupar execuções repetidas do mesmo padrão.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from ..config import (
+    TZ, REDSHIFT_THRESHOLD_MIN, TRACKER_MIN_DURATION_SEC, TRACKER_POLL_SEC,
+)
+from ..db import register_query, run_query, update_daily_summary
+from ..history import get_history_conn
+from ..parallel import run_throttled
+from .fingerprint import fingerprint, normalize_sql
+
+LONG_QUERY_SEC = REDSHIFT_THRESHOLD_MIN * 60   # conta em daily_summaries.redshift_queries_over_10min
+FINGERPRINT_BACKFILL_BATCH = 500               # linhas antigas (sem fingerprint) processadas por rodada
+
+
+# ======================== LEITURAS DO REDSHIFT ========================
+_Q_RUNNING = register_query("tracker.running", """
+    SELECT
+      pid,
+      TRIM(user_name) AS user_name,
+      starttime,
+      duration / 1000000.0 AS duration_sec,
+      TRIM(query) AS query
+    FROM stv_recents
+    WHERE status = 'Running'
+      AND duration > %(min_duration_us)s
+    """, {"min_duration_us": "bigint"})
+_Q_ENDED = register_query("tracker.ended", """
+    SELECT pid, starttime, endtime, aborted
+    FROM stl_query
+    WHERE pid IN %(pids)s
+      AND starttime >= %(since)s
+    """, {"pids": "int[]", "since": "timestamp"}, prepare=False)
+
+
+def _poll_running() -> pd.DataFrame:
+    """Queries rodando há mais de TRACKER_MIN_DURATION_SEC"""
+    return run_query(_Q_RUNNING, {"min_duration_us": int(TRACKER_MIN_DURATION_SEC * 1000000)})
+
+
+def _lookup_ended(gone: list[tuple[int, str]]) -> dict:
+    """Fim e status (aborted) no stl_query das queries que sumiram do stv_recents"""
+    since = min(pd.Timestamp(start) for _, start in gone) - pd.Timedelta(seconds=1)
+    df = run_query(_Q_ENDED, {
+        "pids": tuple(sorted({int(pid) for pid, _ in gone})),
+        "since": since.to_pydatetime(),
+    })
+
+    # O starttime do stv_recents e o do stl_query podem diferir em frações de segundo
+    found = {}
+    for pid, start in gone:
+        cand = df[df["pid"] == pid]
+        if cand.empty:
+            continue
+        delta = (pd.to_datetime(cand["starttime"]) - pd.Timestamp(start)).abs()
+        best = delta.idxmin()
+        if delta[best] <= pd.Timedelta(seconds=1):
+            found[(pid, start)] = (pd.Timestamp(cand.at[best, "endtime"]), bool(cand.at[best, "aborted"]))
+    return found
+
+
+# ======================== DIFF E GRAVAÇÃO ========================
+def _iso(ts) -> str:
+    return pd.Timestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _register_fingerprint(conn, query_text: str | None, seen_at: str) -> str:
+    """Calcula o fingerprint e guarda o SQL normalizado na primeira vez que o padrão aparece"""
+    fp = fingerprint(query_text)
+    conn.execute(
+        "INSERT OR IGNORE INTO query_fingerprints (fingerprint, normalized, first_seen) VALUES (?, ?, ?)",
+        (fp, normalize_sql(query_text)[:2000], seen_at),
+    )
+    return fp
+
+
+def backfill_fingerprints(conn, batch: int = FINGERPRINT_BACKFILL_BATCH) -> int:
+    """Preenche o fingerprint de linhas gravadas antes da coluna existir (um lote por chamada)"""
+    rows = conn.execute(
+        "SELECT pid, starttime, query_text, first_seen FROM query_lifecycle WHERE fingerprint IS NULL LIMIT ?",
+        (batch,),
+    ).fetchall()
+    for pid, start, text, first_seen in rows:
+        fp = _register_fingerprint(conn, text, first_seen)
+        conn.execute("UPDATE query_lifecycle SET fingerprint = ? WHERE pid = ? AND starttime = ?", (fp, pid, start))
+    return len(rows)
+
+
+def poll_tracker() -> dict:
+    """
+    Uma rodada do rastreador: registra novas queries, atualiza o pico das que
+    continuam rodando e fecha as que terminaram (finished/cancelled/ended)
+    """
+    now = datetime.now(timezone.utc)
+    running = _poll_running()
+    running_keys = {(int(pid), _iso(start)) for pid, start in zip(running["pid"], running["starttime"])}
+
+    conn = get_history_conn()
+    open_rows = {
+        (pid, start): peak
+        for pid, start, peak in conn.execute(
+            "SELECT pid, starttime, peak_duration_sec FROM query_lifecycle WHERE end_state = 'running'"
+        )
+    }
+
+    # Consulta ao Redshift antes de abrir a transação: com ela aberta, o SQLite
+    # ficaria travado para escrita (HistoryWriter) durante a ida ao stl_query
+    gone = [key for key in open_rows if key not in running_keys]
+    ended = {}
+    if gone:
+        try:
+            ended = _lookup_ended(gone)
+        except Exception as e:
+            print(f"⚠️ Rastreador: falha ao consultar stl_query: {e}")
+
+    with conn:
+        started, new_long = 0, 0
+        for r in running.itertuples(index=False):
+            key = (int(r.pid), _iso(r.starttime))
+            duration = float(r.duration_sec)
+            prev_peak = open_rows.get(key)
+            if prev_peak is None:
+                text = (r.query or "")[:2000]
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO query_lifecycle
+                        (pid, starttime, user_name, query_text, first_seen, last_seen, peak_duration_sec, fingerprint)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (key[0], key[1], r.user_name, text, _iso(now), _iso(now), duration,
+                     _register_fingerprint(conn, text, _iso(now))),
+                )
+                started += 1
+                prev_peak = 0.0
+            else:
+                conn.execute(
+                    """
+                    UPDATE query_lifecycle
+                    SET last_seen = ?, peak_duration_sec = MAX(peak_duration_sec, ?)
+                    WHERE pid = ? AND starttime = ?
+                    """,
+                    (_iso(now), duration, key[0], key[1]),
+                )
+            if prev_peak < LONG_QUERY_SEC <= duration:
+                new_long += 1
+
+        for key in gone:
+            if key in ended:
+                endtime, aborted = ended[key]
+                runtime = (endtime - pd.Timestamp(key[1])).total_seconds()
+                conn.execute(
+                    """
+                    UPDATE query_lifecycle
+                    SET ended_at = ?, end_state = ?, peak_duration_sec = MAX(peak_duration_sec, ?)
+                    WHERE pid = ? AND starttime = ?
+                    """,
+                    (_iso(endtime), "cancelled" if aborted else "finished", runtime, key[0], key[1]),
+                )
+            else:
+                # Sem registro no stl_query: fecha com o último instante em que foi vista
+                conn.execute(
+                    "UPDATE query_lifecycle SET ended_at = last_seen, end_state = 'ended' WHERE pid = ? AND starttime = ?",
+                    key,
+                )
+        backfilled = backfill_fingerprints(conn)
+
+    # Cada query longa conta uma única vez no resumo do dia
+    if new_long:
+        update_daily_summary(datetime.now(TZ).strftime("%Y-%m-%d"), redshift_queries=new_long)
+
+    return {"running": len(running), "started": started, "ended": len(gone), "new_long": new_long,
+            "backfilled": backfilled}
+
+
+def maybe_poll_tracker() -> dict | None:
+    """Roda poll_tracker no máximo a cada TRACKER_POLL_SEC por processo (sem coletor)"""
+    return run_throttled("query_tracker", TRACKER_POLL_SEC, poll_tracker)
+
+
+# ======================== CONSULTAS ========================
+def _read_lifecycle(where: str, params: tuple) -> pd.DataFrame:
+    return pd.read_sql_query(f"SELECT * FROM query_lifecycle WHERE {where}", get_history_conn(), params=params)
+
+
+def _day_start_utc(days: int = 1) -> str:
+    """Início (UTC) do dia local de hoje, ou de days-1 dias atrás"""
+    start_local = datetime.now(TZ).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    return _iso(start_local.astimezone(timezone.utc))
+
+
+def get_longest_queries_today(limit: int = 10) -> pd.DataFrame:
+    """Queries mais longas iniciadas hoje (horário local), com o estado final"""
+    df = _read_lifecycle("starttime >= ?", (_day_start_utc(),))
+    df = df.sort_values("peak_duration_sec", ascending=False).head(limit)
+    return pd.DataFrame({
+        "Usuário": df["user_name"],
+        "Início": pd.to_datetime(df["starttime"], utc=True).dt.tz_convert(TZ).dt.strftime("%H:%M:%S"),
+        "Duração (min)": (df["peak_duration_sec"] / 60).round(1),
+        "Estado": df["end_state"],
+        "PID": df["pid"],
+        "Query": df["query_text"].str.slice(0, 200),
+    }).reset_index(drop=True)
+
+
+def get_runtime_p95_by_user(days: int = 1) -> pd.DataFrame:
+    """Percentil 95 (e máximo) da duração das queries rastreadas, por usuário"""
+    df = _read_lifecycle("starttime >= ?", (_day_start_utc(days),))
+    if df.empty:
+        return pd.DataFrame(columns=["Usuário", "Queries", "p95 (min)", "Máx (min)", "Canceladas"])
+    g = df.groupby("user_name")
+    out = pd.DataFrame({
+        "Queries": g.size(),
+        "p95 (min)": (g["peak_duration_sec"].quantile(0.95) / 60).round(1),
+        "Máx (min)": (g["peak_duration_sec"].max() / 60).round(1),
+        "Canceladas": g["end_state"].apply(lambda s: int((s == "cancelled").sum())),
+    })
+    return out.sort_values("p95 (min)", ascending=False).rename_axis("Usuário").reset_index()
+
+
+def get_fingerprint_stats(days: int = 1, min_duration_sec: float = 0, limit: int = 20) -> pd.DataFrame:
+    """
+    Queries rastreadas agrupadas por fingerprint: execuções, duração total/máxima
+    e usuários. Linhas ainda sem fingerprint são ignoradas até o backfill alcançá-las.
+    """
+    sql = """
+    SELECT
+      l.fingerprint,
+      COUNT(*) AS runs,
+      SUM(l.peak_duration_sec) AS total_sec,
+      MAX(l.peak_duration_sec) AS max_sec,
+      SUM(CASE WHEN l.end_state = 'cancelled' THEN 1 ELSE 0 END) AS cancelled,
+      GROUP_CONCAT(DISTINCT l.user_name) AS users,
+      MAX(l.starttime) AS last_start,
+      f.normalized
+    FROM query_lifecycle l
+    LEFT JOIN query_fingerprints f ON f.fingerprint = l.fingerprint
+    WHERE l.starttime >= ? AND l.peak_duration_sec >= ? AND l.fingerprint IS NOT NULL
+    GROUP BY l.fingerprint
+    ORDER BY total_sec DESC
+    LIMIT ?
+    """
+    df = pd.read_sql_query(sql, get_history_conn(), params=(_day_start_utc(days), float(min_duration_sec), int(limit)))
+    return pd.DataFrame({
+        "Padrão": df["fingerprint"].str.slice(0, 8),
+        "Execuções": df["runs"],
+        "Total (min)": (df["total_sec"] / 60).round(1),
+        "Máx (min)": (df["max_sec"] / 60).round(1),
+        "Canceladas": df["cancelled"],
+        "Usuários": df["users"],
+        "Última": pd.to_datetime(df["last_start"], utc=True).dt.tz_convert(TZ).dt.strftime("%d/%m %H:%M"),
+        "SQL normalizado": df["normalized"].str.slice(0, 200),
+    })
@@ -3,147 +3,471 @@
 Serviço de monitoramento do Redshift
 """
 
+import threading
+import time
 import pandas as pd
 import streamlit as st
-from ..db import run_redshift, get_redshift_conn
-from ..config import TZ
+from ..db import (
+    run_redshift, get_redshift_conn, get_redshift_pool, fetch_limited, register_query, run_query,
+    read_frame,
+)
+from ..cache import source_cache
+from .catalog import _Q_SCHEMAS, get_catalog
+from ..config import (
+    TZ, MONITOR_BATCH_CHUNK, MONITOR_METRICS_MODE, MONITOR_SAMPLED_EXACT_SEC,
+    PREVIEW_MAX_BYTES,
+)
+from ..parallel import run_parallel
 from datetime import datetime
 
 
+QUERY_LIST_COLUMNS = ["duration_minutes", "kill_query", "pid", "user_name", "starttime", "query"]
+
+# Texto fixo (limite e top N em parâmetros): mesma chave de cache e mesmo plano para qualquer limite
+_PROBE_SQL = """
+    WITH running AS (
+      SELECT
+        r.pid,
+        r.user_name,
+        r.starttime,
+        r.duration,
+        r.query,
+        COUNT(*) OVER () AS running_over,
+        ROW_NUMBER() OVER (ORDER BY r.duration DESC) AS rn,
+        ROW_NUMBER() OVER (PARTITION BY r.user_name ORDER BY r.duration DESC) AS user_rn,
+        COUNT(*) OVER (PARTITION BY r.user_name) AS user_queries,
+        SUM(r.duration) OVER (PARTITION BY r.user_name) AS user_total_duration
+      FROM stv_recents r
+      WHERE r.status = 'Running'
+        AND r.duration > %(min_duration_us)s
+    )
+    SELECT
+      (duration / 60000000.0) AS duration_minutes,
+      'CANCEL ' || pid::varchar || ';' AS kill_query,
+      pid,
+      user_name,
+      starttime,
+      query,
+      running_over,
+      rn,
+      user_rn,
+      user_queries,
+      (user_total_duration / 60000000.0) AS user_total_minutes
+    FROM running
+    WHERE rn <= %(limit)s OR user_rn = 1
+    ORDER BY rn
+    """
+
+
+@source_cache("redshift_probe")
+def probe_long_queries(threshold_min: int, limit: int = 20) -> dict:
+    """
+    Uma única leitura do stv_recents para as queries acima do limite
+    Retorna: running_over (contagem), queries (top N por duração) e
+    by_user (quantidade, maior e soma das durações por usuário)
+    """
+    df = run_redshift(_PROBE_SQL, {"min_duration_us": int(threshold_min) * 60000000, "limit": int(limit)})
+    if df.empty:
+        return {
+            "running_over": 0,
+            "queries": pd.DataFrame(columns=QUERY_LIST_COLUMNS),
+            "by_user": pd.DataFrame(columns=["user_name", "queries", "max_minutes", "total_minutes"]),
+        }
+
+    by_user = (
+        df[df["user_rn"] == 1]
+        .rename(columns={"user_queries": "queries", "duration_minutes": "max_minutes", "user_total_minutes": "total_minutes"})
+        [["user_name", "queries", "max_minutes", "total_minutes"]]
+        .sort_values("max_minutes", ascending=False)
+        .reset_index(drop=True)
+    )
+    return {
+        "running_over": int(df["running_over"].iloc[0]),
+        "queries": df[df["rn"] <= int(limit)][QUERY_LIST_COLUMNS].reset_index(drop=True),
+        "by_user": by_user,
+    }
+
+
 def get_queries_over_threshold(threshold_min: int) -> int:
     """Obtém contagem de queries acima do threshold"""
     try:
-        sql_count = f"""
-            SELECT COUNT(*) AS running_over
-            FROM stv_recents
-            WHERE status = 'Running'
-              AND duration > {int(threshold_min) * 60000000}
-        """
-        df_count = run_redshift(sql_count)
-        return int(df_count.iloc[0]["running_over"]) if not df_count.empty else 0
+        return probe_long_queries(threshold_min)["running_over"]
     except Exception:
         return 0
 
 
 def get_queries_list(threshold_min: int, limit: int = 20) -> pd.DataFrame:
     """Obtém lista de queries acima do threshold"""
-    sql_list = f"""
-        SELECT
-            (r.duration / 60000000.0) AS duration_minutes,
-            'CANCEL ' || r.pid::varchar || ';' AS kill_query,
-            r.pid,
-            r.user_name,
-            r.starttime,
-            r.query
-        FROM stv_recents r
-        WHERE r.status = 'Running'
-          AND r.duration > {int(threshold_min) * 60000000}
-        ORDER BY r.duration DESC
-        LIMIT {limit}
-    """
-    return run_redshift(sql_list)
-
-
-def get_schemas() -> list[str]:
-    """Lista schemas disponíveis no Redshift"""
-    sql = """
-    SELECT nspname AS schema
-    FROM pg_namespace
-    WHERE nspname NOT IN ('information_schema', 'pg_catalog', 'pg_internal')
-    ORDER BY 1
-    """
-    with get_redshift_conn() as conn:
-        df = pd.read_sql(sql, conn)
-    return [str(x) for x in df["schema"].tolist()]
+    return probe_long_queries(threshold_min, limit)["queries"]
 
 
-def get_tables(schema: str) -> list[str]:
-    """Lista tabelas de um schema"""
-    # Try multiple approaches to list tables
-    queries = [
-        # Approach 1: pg_table_def
-        f"""
+_Q_TABLES = (
+    register_query("catalog.tables_table_def", """
         SELECT DISTINCT tablename AS table
         FROM pg_table_def
-        WHERE schemaname = '{schema}'
+        WHERE schemaname = %(schema)s
         ORDER BY 1
-        """,
-        # Approach 2: information_schema
-        f"""
+        """, {"schema": "varchar"}),
+    register_query("catalog.tables_information_schema", """
         SELECT table_name AS table
         FROM information_schema.tables
-        WHERE table_schema = '{schema}'
+        WHERE table_schema = %(schema)s
         ORDER BY 1
-        """,
-        # Approach 3: pg_tables
-        f"""
+        """, {"schema": "varchar"}),
+    register_query("catalog.tables_pg_tables", """
         SELECT tablename AS table
         FROM pg_tables
-        WHERE schemaname = '{schema}'
+        WHERE schemaname = %(schema)s
         ORDER BY 1
-        """
-    ]
-    
-    for i, sql in enumerate(queries):
+        """, {"schema": "varchar"}),
+)
+_Q_COLUMNS = register_query("catalog.columns", """
+    SELECT "column", type
+    FROM pg_table_def
+    WHERE schemaname = %(schema)s AND tablename = %(table)s
+    ORDER BY 1
+    """, {"schema": "varchar", "table": "varchar"})
+
+
+def get_schemas() -> list[str]:
+    """Lista schemas disponíveis no Redshift (via cache do catálogo)"""
+    try:
+        return get_catalog().schemas()
+    except Exception as e:
+        print(f"⚠️ Catálogo indisponível, consultando schemas direto: {e}")
+        return _query_schemas()
+
+
+def get_tables(schema: str) -> list[str]:
+    """Lista tabelas de um schema (via cache do catálogo)"""
+    try:
+        tables = get_catalog().tables(schema)
+        if tables:
+            return tables
+    except Exception as e:
+        print(f"⚠️ Catálogo indisponível, consultando tabelas direto: {e}")
+    return _query_tables(schema)
+
+
+def get_columns(schema: str, table: str) -> pd.DataFrame:
+    """Lista colunas de uma tabela (via cache do catálogo)"""
+    try:
+        df = get_catalog().columns(schema, table)
+        if not df.empty:
+            return df
+    except Exception as e:
+        print(f"⚠️ Catálogo indisponível, consultando colunas direto: {e}")
+    return _query_columns(schema, table)
+
+
+def _query_schemas() -> list[str]:
+    """Lista schemas direto do pg_namespace"""
+    df = run_query(_Q_SCHEMAS)
+    return [str(x) for x in df["schema"].tolist()]
+
+
+def _query_tables(schema: str) -> list[str]:
+    """Lista tabelas de um schema direto dos catálogos do Redshift"""
+    # pg_table_def só enxerga schemas do search_path: tenta as outras visões em seguida
+    for name in _Q_TABLES:
         try:
-            with get_redshift_conn() as conn:
-                df = pd.read_sql(sql, conn)
-            tables = [str(x) for x in df["table"].tolist()]
-            if tables:  # If we found tables, return them
+            tables = [str(x) for x in run_query(name, {"schema": schema})["table"].tolist()]
+            if tables:
                 return tables
-        except Exception as e:
-            continue  # Try next approach
-    
-    return []  # No tables found with any approach
+        except Exception:
+            continue
+    return []
 
 
-def get_columns(schema: str, table: str) -> pd.DataFrame:
-    """Lista colunas de uma tabela"""
-    sql = f"""
-    SELECT "column", type
-    FROM pg_table_def
-    WHERE schemaname = '{schema}' AND tablename = '{table}'
-    ORDER BY 1
+def _query_columns(schema: str, table: str) -> pd.DataFrame:
+    """Lista colunas de uma tabela direto do pg_table_def"""
+    return run_query(_Q_COLUMNS, {"schema": schema, "table": table})
+
+
+# ======================== MÉTRICAS DE TABELAS (MONITORES) ========================
+# Modos de métrica por monitor:
+#   exact     -> COUNT(*) e MAX(ts_col) completos (varre a tabela)
+#   estimated -> linhas de svv_table_info; MAX(ts_col) limitado pelo último máximo visto
+#   sampled   -> COUNT(*) exato a cada MONITOR_SAMPLED_EXACT_SEC, corrigido pela
+#                variação da estimativa entre uma contagem e outra
+METRICS_MODES = {
+    "exact": "Exata (COUNT)",
+    "estimated": "Estimada (catálogo)",
+    "sampled": "Amostrada (COUNT periódico)",
+}
+
+
+def quote_ident(name: str) -> str:
+    """Identificador SQL entre aspas duplas (escapa aspas internas)"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _error_message(e: Exception) -> str:
+    """Mensagem curta do erro (o pandas embrulha o erro do driver junto com o SQL)"""
+    return str(e.__cause__ or e).strip()[:200]
+
+
+@st.cache_resource(show_spinner=False)
+def _get_metrics_state() -> dict:
+    """
+    Estado entre execuções, por (schema, table, ts_col):
+    max_ts (último máximo visto), ts_temporal (coluna date/timestamp no catálogo),
+    exact_rows/exact_at/est_at_exact (modo sampled)
+    """
+    return {"lock": threading.Lock(), "tables": {}}
+
+
+def _normalize_monitor(m: tuple) -> tuple:
+    """(id, schema, table, ts_col[, mode]) -> (id, schema, table, ts_col, mode)"""
+    mode = m[4] if len(m) > 4 and m[4] in METRICS_MODES else MONITOR_METRICS_MODE
+    return (m[0], m[1], m[2], m[3] or None, mode)
+
+
+def _is_temporal_column(schema: str, table: str, column: str) -> bool:
+    """A coluna é date/timestamp no catálogo? (só nesses tipos o MAX pode ser limitado por um timestamp)"""
+    cols = get_columns(schema, table)
+    types = cols.loc[cols["column"] == column, "type"]
+    return not types.empty and str(types.iloc[0]).lower().startswith(("timestamp", "date"))
+
+
+def _plan_monitor(mon: tuple, state: dict, now_mono: float) -> dict:
+    """Decide o que consultar na tabela: COUNT(*)? MAX(ts_col) a partir de qual limite?"""
+    _, schema, table, ts_col, mode = mon
+    st_tbl = state.get((schema, table, ts_col), {})
+    need_count = mode == "exact" or (
+        mode == "sampled"
+        and now_mono - st_tbl.get("exact_at", float("-inf")) > MONITOR_SAMPLED_EXACT_SEC
+    )
+    # Zone maps: com "ts_col >= último máximo" o Redshift só lê os blocos mais novos
+    # (só em colunas date/timestamp: varchar/inteiro/epoch falhariam no cast ou na comparação)
+    use_floor = ts_col and mode != "exact" and not need_count and st_tbl.get("ts_temporal")
+    ts_floor = st_tbl.get("max_ts") if use_floor else None
+    return {"count": need_count, "ts_floor": ts_floor, "scan": need_count or bool(ts_col)}
+
+
+def _monitor_select(mon: tuple, plan: dict, n: int) -> tuple[str, dict]:
+    """
+    SELECT de um monitor (ramo n do UNION ALL); max_ts volta como texto para os ramos serem compatíveis
+    monitor_id e o limite do MAX entram como parâmetros (ligados pelo driver, com escape)
+    Retorna (sql, {parâmetro: valor})
+    """
+    mon_id, schema, table, ts_col, _ = mon
+    ident = lambda name: quote_ident(name).replace("%", "%%")   # % literal no SQL com parâmetros
+    count = "COUNT(*)" if plan["count"] else "CAST(NULL AS BIGINT)"
+    max_ts = f"CAST(MAX({ident(ts_col)}) AS VARCHAR(64))" if ts_col else "CAST(NULL AS VARCHAR(64))"
+    values = {f"mon_{n}": str(mon_id)}
+    where = ""
+    if plan["ts_floor"] is not None:
+        where = f" WHERE {ident(ts_col)} >= CAST(%(floor_{n})s AS TIMESTAMP)"
+        values[f"floor_{n}"] = plan["ts_floor"].strftime("%Y-%m-%d %H:%M:%S")
+    sql = (
+        f"SELECT CAST(%(mon_{n})s AS VARCHAR(256)) AS monitor_id, {count} AS row_count, {max_ts} AS max_ts "
+        f"FROM {ident(schema)}.{ident(table)}{where}"
+    )
+    return sql, values
+
+
+def _metrics_query(items: list[tuple]) -> tuple[str, dict]:
+    """
+    UNION ALL do lote e seus parâmetros
+    Fica fora do registro de consultas: o texto muda com tabelas, monitores e planos, e
+    registrá-lo (com PREPARE em cada conexão) faria registro e planos no servidor crescerem sem limite
+    """
+    parts, values = [], {}
+    for n, (mon, plan) in enumerate(items):
+        sql, v = _monitor_select(mon, plan, n)
+        parts.append(sql)
+        values.update(v)
+    return "\nUNION ALL\n".join(parts), values
+
+
+def _run_metrics_chunk(items: list[tuple]) -> list[dict]:
+    """
+    Executa um lote de (monitor, plano) com UNION ALL; se falhar (tabela removida,
+    permissão...), cai para um monitor por vez
     """
-    with get_redshift_conn() as conn:
-        return pd.read_sql(sql, conn)
-
-
-def get_table_metrics(schema: str, table: str, ts_col: str | None) -> dict:
-    """Obtém métricas de uma tabela"""
-    parts = []
-    parts.append(f"SELECT COUNT(*) AS row_count FROM {schema}.{table}")
-    parts.append(f"SELECT SUM(rows) AS est_rows FROM svv_table_info WHERE schema = '{schema}' AND table = '{table}'")
-    if ts_col:
-        parts.append(f"SELECT MAX({ts_col}) AS max_ts FROM {schema}.{table}")
-    
-    metrics = {"row_count": None, "est_rows": None, "max_ts": None}
-    
     with get_redshift_conn() as conn:
         try:
-            df1 = pd.read_sql(parts[0], conn)
-            metrics["row_count"] = int(df1.iloc[0, 0]) if not df1.empty else None
+            return read_frame(conn, *_metrics_query(items)).to_dict("records")
         except Exception:
-            pass
-        try:
-            df2 = pd.read_sql(parts[1], conn)
-            v = df2.iloc[0, 0] if not df2.empty else None
-            metrics["est_rows"] = int(v) if v is not None else None
-        except Exception:
-            pass
-        if ts_col:
+            conn.rollback()
+            if len(items) == 1:
+                raise
+        rows = []
+        for mon, plan in items:
             try:
-                df3 = pd.read_sql(parts[2], conn)
-                metrics["max_ts"] = pd.to_datetime(df3.iloc[0, 0], utc=True, errors="coerce") if not df3.empty else None
-            except Exception:
-                pass
-    
+                rows.extend(read_frame(conn, *_metrics_query([(mon, plan)])).to_dict("records"))
+            except Exception as e:
+                conn.rollback()
+                rows.append({"monitor_id": mon[0], "error": _error_message(e)})
+        return rows
+
+
+# Listas de IN têm tamanho variável: ligadas pelo driver (com escape), sem PREPARE
+_Q_TABLE_ESTIMATES = register_query("monitors.table_estimates", """
+    SELECT "schema", "table", table_id, tbl_rows AS est_rows,
+           COALESCE(estimated_visible_rows, tbl_rows) AS visible_rows
+    FROM svv_table_info
+    WHERE "schema" IN %(schemas)s
+    """, {"schemas": "varchar[]"}, prepare=False)
+_Q_LAST_INSERTS = register_query("monitors.last_inserts", """
+    SELECT i.tbl AS table_id, MAX(q.endtime) AS last_insert_at
+    FROM stl_insert i
+    JOIN stl_query q ON q.query = i.query
+    WHERE i.tbl IN %(table_ids)s
+    GROUP BY i.tbl
+    """, {"table_ids": "int[]"}, prepare=False)
+
+
+def _table_estimates(schemas: set[str]) -> pd.DataFrame:
+    """Linhas estimadas de todas as tabelas dos schemas, em uma consulta ao svv_table_info"""
+    return run_query(_Q_TABLE_ESTIMATES, {"schemas": tuple(sorted(schemas))})
+
+
+def _last_inserts(table_ids: list[int]) -> pd.DataFrame:
+    """Fim do último INSERT/COPY em cada tabela (stl_insert guarda poucos dias)"""
+    return run_query(_Q_LAST_INSERTS, {"table_ids": tuple(int(t) for t in table_ids)})
+
+
+def _collect_monitors_metrics(monitors: tuple[tuple, ...], chunk_size: int) -> pd.DataFrame:
+    columns = ["mode", "row_count", "est_rows", "max_ts", "last_insert_at", "error"]
+    if not monitors:
+        return pd.DataFrame(columns=columns).rename_axis("monitor_id")
+
+    monitors = [_normalize_monitor(m) for m in monitors]
+    state = _get_metrics_state()
+    with state["lock"]:
+        unknown = {
+            (m[1], m[2], m[3]) for m in monitors
+            if m[3] and m[4] != "exact" and "ts_temporal" not in state["tables"].get((m[1], m[2], m[3]), {})
+        }
+    # Tipo da coluna de tempo: uma vez por (tabela, coluna), fora do lock (catálogo em memória)
+    temporal = {}
+    for schema, table, ts_col in unknown:
+        try:
+            temporal[(schema, table, ts_col)] = _is_temporal_column(schema, table, ts_col)
+        except Exception as e:
+            print(f"⚠️ Tipo de {schema}.{table}.{ts_col} indisponível; MAX sem limite: {_error_message(e)}")
+    now_mono = time.monotonic()
+    with state["lock"]:
+        for key, is_temporal in temporal.items():
+            state["tables"].setdefault(key, {})["ts_temporal"] = is_temporal
+        plans = {m[0]: _plan_monitor(m, state["tables"], now_mono) for m in monitors}
+
+    # 1) Catálogo: estimativas de linhas (uma consulta para todas as tabelas)
+    try:
+        est = _table_estimates({m[1] for m in monitors})
+    except Exception as e:
+        print(f"⚠️ svv_table_info indisponível: {_error_message(e)}")
+        est = pd.DataFrame(columns=["schema", "table", "table_id", "est_rows", "visible_rows"])
+    est_map = {(str(r.schema), str(r.table)): r for r in est.itertuples(index=False)}
+
+    # 2) Tabelas (só o que o modo pede) + último INSERT, em paralelo
+    scan = [(m, plans[m[0]]) for m in monitors if plans[m[0]]["scan"]]
+    chunks = [scan[i:i + chunk_size] for i in range(0, len(scan), chunk_size)]
+    tasks = {f"chunk_{i}": (_run_metrics_chunk, (chunk,)) for i, chunk in enumerate(chunks)}
+    # Só as tabelas dos monitores deste lote (o svv_table_info trouxe o schema inteiro)
+    table_ids = sorted({
+        int(est_map[(m[1], m[2])].table_id) for m in monitors if (m[1], m[2]) in est_map
+    })
+    if table_ids:
+        tasks["inserts"] = (_last_inserts, (table_ids,))
+    results, errors = run_parallel(tasks)
+
+    scanned = {}
+    for i, chunk in enumerate(chunks):
+        name = f"chunk_{i}"
+        if name in results:
+            scanned.update({r["monitor_id"]: r for r in results[name]})
+        else:
+            scanned.update({m[0]: {"error": _error_message(errors[name])} for m, _ in chunk})
+    inserts = results.get("inserts")
+    insert_map = {} if inserts is None else dict(zip(inserts["table_id"], inserts["last_insert_at"]))
+
+    # 3) Combina por modo e atualiza o estado
+    rows = []
+    with state["lock"]:
+        for mon in monitors:
+            mon_id, schema, table, ts_col, mode = mon
+            plan, res = plans[mon_id], scanned.get(mon_id, {})
+            key = (schema, table, ts_col)
+            st_tbl = state["tables"].setdefault(key, {})
+            info = est_map.get((schema, table))
+            visible = int(info.visible_rows) if info is not None and pd.notna(info.visible_rows) else None
+
+            row_count = res.get("row_count")
+            row_count = int(row_count) if row_count is not None and pd.notna(row_count) else None
+            if mode == "estimated":
+                row_count = visible
+            elif mode == "sampled":
+                if plan["count"] and row_count is not None:
+                    st_tbl.update(exact_rows=row_count, exact_at=now_mono, est_at_exact=visible)
+                elif "exact_rows" in st_tbl:
+                    delta = (visible - st_tbl["est_at_exact"]) if None not in (visible, st_tbl["est_at_exact"]) else 0
+                    row_count = st_tbl["exact_rows"] + delta
+                else:
+                    row_count = visible
+
+            max_ts = pd.to_datetime(res.get("max_ts"), utc=True, errors="coerce") if ts_col else None
+            if max_ts is None or pd.isna(max_ts):
+                if plan["ts_floor"] is not None:
+                    # Nada acima do último máximo (linhas apagadas?): mantém o valor; com erro, o limite
+                    # pode ser a causa. Nos dois casos a próxima coleta refaz o MAX completo
+                    previous = st_tbl.pop("max_ts", None)
+                    max_ts = None if "error" in res else previous
+                else:
+                    max_ts = None
+            else:
+                st_tbl["max_ts"] = max_ts
+
+            rows.append({
+                "monitor_id": mon_id,
+                "mode": mode,
+                "row_count": row_count,
+                "est_rows": int(info.est_rows) if info is not None and pd.notna(info.est_rows) else None,
+                "max_ts": max_ts,
+                "last_insert_at": pd.to_datetime(insert_map.get(int(info.table_id)), utc=True)
+                                  if info is not None and int(info.table_id) in insert_map else None,
+                "error": res.get("error"),
+            })
+
+    df = pd.DataFrame(rows).set_index("monitor_id").reindex(columns=columns)
+    df["max_ts"] = pd.to_datetime(df["max_ts"], utc=True)
+    df["last_insert_at"] = pd.to_datetime(df["last_insert_at"], utc=True)
+    return df
+
+
+def get_table_metrics(schema: str, table: str, ts_col: str | None, mode: str = "exact") -> dict:
+    """Obtém métricas de uma tabela no modo pedido (ver METRICS_MODES)"""
+    df = _collect_monitors_metrics(((f"{schema}.{table}", schema, table, ts_col, mode),), MONITOR_BATCH_CHUNK)
+    row = df.iloc[0]
+    if isinstance(row["error"], str):
+        print(f"⚠️ Métricas de {schema}.{table}: {row['error']}")
+    metrics = {}
+    for col in ("row_count", "est_rows", "max_ts", "last_insert_at"):
+        metrics[col] = row[col] if pd.notna(row[col]) else None
     return metrics
 
 
+@source_cache("monitors")
+def get_monitors_metrics(monitors: tuple[tuple, ...], chunk_size: int = MONITOR_BATCH_CHUNK) -> pd.DataFrame:
+    """
+    Métricas de todos os monitores salvos em poucas idas ao Redshift
+    monitors: tuplas (id, schema, table, ts_col, mode)
+    Retorna DataFrame indexado por monitor_id com mode, row_count, est_rows,
+    max_ts, last_insert_at e error
+    """
+    return _collect_monitors_metrics(monitors, chunk_size)
+
+
 def get_table_preview(schema: str, table: str, ts_col: str | None, limit: int = 20) -> pd.DataFrame:
-    """Obtém preview de uma tabela"""
-    order = f"ORDER BY {ts_col} DESC" if ts_col else ""
-    sql = f"SELECT * FROM {schema}.{table} {order} LIMIT {limit}"
-    with get_redshift_conn() as conn:
-        return pd.read_sql(sql, conn)
+    """
+    Obtém preview de uma tabela
+    Cursor no servidor com orçamento de PREVIEW_MAX_BYTES: colunas muito largas
+    cortam a prévia (attrs["truncated"]) em vez de encher a memória
+    """
+    # Identificadores vêm da UI: sempre entre aspas; o LIMIT vai como parâmetro
+    order = f"ORDER BY {quote_ident(ts_col)} DESC" if ts_col else ""
+    sql = f"SELECT * FROM {quote_ident(schema)}.{quote_ident(table)} {order}".replace("%", "%%") + " LIMIT %(limit)s"
+    return fetch_limited(get_redshift_pool(), sql, {"limit": int(limit)}, chunk_rows=min(limit, 100),
+                         max_rows=limit, max_bytes=PREVIEW_MAX_BYTES)
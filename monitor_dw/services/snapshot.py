@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot único por rerun: todas as fontes consultadas uma vez, em paralelo
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+from ..config import TZ
+from ..parallel import run_parallel
+
+
+@dataclass
+class MonitorSnapshot:
+    """Dados de todas as fontes usados pelas abas e pelos alertas de um rerun"""
+    redshift_threshold: int
+    running_over: int = 0
+    queries: pd.DataFrame | None = None
+    queries_by_user: pd.DataFrame | None = None
+    last_refresh_utc: pd.Timestamp | None = None
+    age_min: int | None = None
+    jira_total: int = 0
+    jira_issues: list = field(default_factory=list)
+    kpis: dict = field(default_factory=dict)
+    kestra: dict = field(default_factory=dict)    # flows, status e execuções recentes por flow
+    built_at: datetime = field(default_factory=lambda: datetime.now(TZ))
+    origin: dict = field(default_factory=dict)    # fonte -> "coletor" | "direto"
+    timings: dict = field(default_factory=dict)   # fonte -> segundos
+    errors: dict = field(default_factory=dict)    # fonte -> mensagem
+
+
+# ======================== FETCHERS ========================
+def _fetch_redshift(threshold_min: int) -> dict:
+    from .redshift_monitor import probe_long_queries
+    probe = probe_long_queries(int(threshold_min), 20)
+    running_over = probe["running_over"]
+    return {
+        "threshold_min": int(threshold_min),
+        "running_over": running_over,
+        "queries": probe["queries"] if running_over > 0 else None,
+        "by_user": probe["by_user"] if running_over > 0 else None,
+    }
+
+
+def _fetch_powerbi(threshold_min: int) -> dict:
+    from .powerbi import get_last_refresh
+    last_refresh_utc, _ = get_last_refresh()
+    return {"last_refresh_utc": last_refresh_utc}
+
+
+def _fetch_jira(threshold_min: int) -> dict:
+    from .jira_client import get_open_tickets
+    total, issues = get_open_tickets()
+    return {"total": total, "issues": issues}
+
+
+def _fetch_kpis(threshold_min: int) -> dict:
+    from .kpis import get_all_kpis, record_kpi_snapshot
+    kpis = get_all_kpis()
+    record_kpi_snapshot(kpis)
+    return kpis
+
+
+def _fetch_kestra(threshold_min: int) -> dict:
+    from ..config import KESTRA_FLOW_IDS
+    from .kestra_client import get_kestra_overview
+    return get_kestra_overview(KESTRA_FLOW_IDS)
+
+
+FETCHERS = {
+    "redshift": _fetch_redshift,
+    "powerbi": _fetch_powerbi,
+    "jira": _fetch_jira,
+    "kpis": _fetch_kpis,
+    "kestra": _fetch_kestra,
+}
+
+
+def _timed(fn):
+    def _run(*args):
+        t0 = time.perf_counter()
+        return fn(*args), time.perf_counter() - t0
+    return _run
+
+
+# ======================== BUILD ========================
+def build_snapshot(redshift_threshold: int, collected: dict | None = None,
+                   sources: tuple[str, ...] = ("redshift", "powerbi", "jira", "kpis")) -> MonitorSnapshot:
+    """
+    Monta o snapshot do rerun
+    Usa os dados do coletor quando disponíveis; as demais fontes são consultadas em paralelo
+    """
+    from ..collector import snapshot_source
+
+    snap = MonitorSnapshot(redshift_threshold=int(redshift_threshold))
+    data, tasks = {}, {}
+
+    for name in sources:
+        col = snapshot_source(collected, name)
+        if name == "redshift" and col and col.get("threshold_min") != snap.redshift_threshold:
+            col = None  # limite diferente do padrão do coletor: consulta direta
+        if col is not None:
+            data[name] = col
+            snap.origin[name] = "coletor"
+        else:
+            tasks[name] = (_timed(FETCHERS[name]), (snap.redshift_threshold,))
+            snap.origin[name] = "direto"
+
+    results, errors = run_parallel(tasks)
+    for name, (value, elapsed) in results.items():
+        data[name] = value
+        snap.timings[name] = round(elapsed, 3)
+    for name, e in errors.items():
+        snap.errors[name] = str(e)
+        print(f"❌ Snapshot: falha ao consultar '{name}': {e}")
+
+    if "redshift" in data:
+        snap.running_over = int(data["redshift"]["running_over"] or 0)
+        snap.queries = data["redshift"]["queries"]
+        snap.queries_by_user = data["redshift"].get("by_user")
+    if "powerbi" in data:
+        snap.last_refresh_utc = data["powerbi"]["last_refresh_utc"]
+        if snap.last_refresh_utc is not None:
+            snap.age_min = int((pd.Timestamp.now(tz="UTC") - snap.last_refresh_utc).total_seconds() // 60)
+    if "jira" in data:
+        snap.jira_total = int(data["jira"]["total"] or 0)
+        snap.jira_issues = data["jira"]["issues"] or []
+    if "kpis" in data:
+        snap.kpis = data["kpis"] or {}
+    if "kestra" in data:
+        snap.kestra = data["kestra"] or {}
+
+    return snap
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Telemetria do WLM do Redshift
+
+Amostra fila, slots e tempo em fila de cada service class (stv_wlm_*) e o uso
+de concurrency scaling do dia, gravando séries compactas no histórico local
+para a aba do Redshift.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from ..config import TZ, WLM_SAMPLE_SEC, WLM_RETENTION_DAYS
+from ..db import register_query, run_query
+from ..history import get_history_conn
+from ..parallel import run_throttled
+
+# service classes 1-5 são internas (sistema/superuser); filas de usuário: 6+ (manual) e 100+ (auto WLM)
+USER_SERVICE_CLASS_MIN = 6
+
+
+# ======================== LEITURAS DO REDSHIFT ========================
+_Q_WLM_STATE = register_query("wlm.state", """
+    WITH q AS (
+      SELECT
+        service_class,
+        MAX(CASE WHEN TRIM(state) LIKE 'Queued%%' THEN queue_time END) / 1000000.0 AS max_queue_sec,
+        AVG(CASE WHEN TRIM(state) LIKE 'Queued%%' THEN queue_time END) / 1000000.0 AS avg_queue_sec
+      FROM stv_wlm_query_state
+      GROUP BY service_class
+    )
+    SELECT
+      s.service_class,
+      TRIM(c.name) AS queue_name,
+      s.num_queued_queries AS queued,
+      s.num_executing_queries AS executing,
+      c.num_query_tasks AS slots,
+      COALESCE(q.max_queue_sec, 0) AS max_queue_sec,
+      COALESCE(q.avg_queue_sec, 0) AS avg_queue_sec
+    FROM stv_wlm_service_class_state s
+    LEFT JOIN stv_wlm_service_class_config c ON c.service_class = s.service_class
+    LEFT JOIN q ON q.service_class = s.service_class
+    WHERE s.service_class >= %(min_service_class)s
+    ORDER BY s.service_class
+    """, {"min_service_class": "int"})
+_Q_CS_USAGE_TODAY = register_query("wlm.cs_usage_today", """
+    SELECT COALESCE(SUM(usage_in_seconds), 0) AS usage_sec
+    FROM svcs_concurrency_scaling_usage
+    WHERE end_time >= TRUNC(GETDATE())
+    """)
+
+
+def _query_wlm_state() -> pd.DataFrame:
+    """Fila e execução atuais de cada service class de usuário"""
+    return run_query(_Q_WLM_STATE, {"min_service_class": USER_SERVICE_CLASS_MIN})
+
+
+def _query_cs_usage_today() -> float:
+    """Segundos de concurrency scaling consumidos desde a meia-noite (UTC)"""
+    df = run_query(_Q_CS_USAGE_TODAY)
+    return float(df.iloc[0, 0] or 0) if not df.empty else 0.0
+
+
+# ======================== AMOSTRAGEM ========================
+def _iso(ts: datetime) -> str:
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sample_wlm() -> dict:
+    """Grava uma amostra do WLM (e do concurrency scaling) e descarta as antigas"""
+    now = datetime.now(timezone.utc)
+    state = _query_wlm_state()
+    try:
+        cs_usage = _query_cs_usage_today()
+    except Exception as e:
+        # svcs_concurrency_scaling_usage exige permissão de superuser/sys:monitor
+        print(f"⚠️ WLM: uso de concurrency scaling indisponível: {e}")
+        cs_usage = None
+
+    with get_history_conn() as conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO wlm_samples
+                (ts, service_class, queue_name, queued, executing, slots, max_queue_sec, avg_queue_sec)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (_iso(now), int(r.service_class), r.queue_name, int(r.queued or 0), int(r.executing or 0),
+                 int(r.slots) if pd.notna(r.slots) else None, float(r.max_queue_sec), float(r.avg_queue_sec))
+                for r in state.itertuples(index=False)
+            ],
+        )
+        if cs_usage is not None:
+            conn.execute("INSERT OR REPLACE INTO wlm_cs_usage (ts, usage_sec_today) VALUES (?, ?)", (_iso(now), cs_usage))
+
+        cutoff = _iso(now - timedelta(days=WLM_RETENTION_DAYS))
+        conn.execute("DELETE FROM wlm_samples WHERE ts < ?", (cutoff,))
+        conn.execute("DELETE FROM wlm_cs_usage WHERE ts < ?", (cutoff,))
+
+    return {
+        "queues": len(state),
+        "queued": int(state["queued"].sum()) if not state.empty else 0,
+        "executing": int(state["executing"].sum()) if not state.empty else 0,
+        "cs_usage_sec_today": cs_usage,
+    }
+
+
+def maybe_sample_wlm() -> dict | None:
+    """Roda sample_wlm no máximo a cada WLM_SAMPLE_SEC por processo (sem coletor)"""
+    return run_throttled("wlm_monitor", WLM_SAMPLE_SEC, sample_wlm)
+
+
+# ======================== CONSULTAS ========================
+def _read_since(table: str, hours: int) -> pd.DataFrame:
+    since = _iso(datetime.now(timezone.utc) - timedelta(hours=hours))
+    df = pd.read_sql_query(f"SELECT * FROM {table} WHERE ts >= ? ORDER BY ts", get_history_conn(), params=(since,))
+    df["ts"] = pd.to_datetime(df["ts"], utc=True).dt.tz_convert(TZ)
+    return df
+
+
+def get_wlm_history(hours: int = 6) -> pd.DataFrame:
+    """Série das amostras das últimas N horas (ts em horário local)"""
+    df = _read_since("wlm_samples", hours)
+    names = df["queue_name"].fillna("").str.strip()
+    df["queue"] = names.where(names != "", "classe " + df["service_class"].astype(str))
+    return df
+
+
+def get_wlm_current(df: pd.DataFrame) -> pd.DataFrame:
+    """Última amostra de uma série de get_wlm_history, uma linha por fila"""
+    last = df[df["ts"] == df["ts"].max()]
+    return pd.DataFrame({
+        "Fila": last["queue"],
+        "Na fila": last["queued"],
+        "Executando": last["executing"],
+        "Slots": last["slots"],
+        "Maior espera (s)": last["max_queue_sec"].round(1),
+    }).reset_index(drop=True)
+
+
+def get_cs_usage_today() -> float | None:
+    """Último valor amostrado de concurrency scaling no dia (segundos)"""
+    df = _read_since("wlm_cs_usage", 1)
+    return float(df["usage_sec_today"].iloc[-1]) if not df.empty else None
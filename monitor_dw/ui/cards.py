@@ -9,6 +9,33 @@ from ..config import TZ, _kfmt, _pct, _fmt_sampa
 from datetime import datetime
 
 
+def render_source_badge(*sources: str):
+    """
+    Selo de dados possivelmente desatualizados: para cada fonte com circuito aberto,
+    em teste ou com falhas recentes, mostra de quando é o último valor bom exibido
+    """
+    from ..breaker import SOURCE_LABELS, get_breaker
+    for source in sources:
+        info = get_breaker(source).info()
+        if info["state"] == "closed" and not info["failures"]:
+            continue
+        label = SOURCE_LABELS.get(source, source)
+        if info["state"] == "open":
+            status = f"🔴 {label} fora do ar (circuito aberto, nova tentativa em {info['retry_in']:.0f}s)"
+        elif info["state"] == "half_open":
+            status = f"🟡 {label} em teste após falhas"
+        else:
+            status = f"🟡 {label} instável ({info['failures']} falha(s) seguida(s))"
+        if info["last_success"] is None:
+            since = "nenhum valor obtido desde o início do app"
+        else:
+            age_min = (datetime.now(TZ) - info["last_success"]).total_seconds() / 60
+            since = f"último valor bom de {_fmt_sampa(info['last_success'], '%H:%M:%S')} (há {age_min:.0f} min)"
+        st.warning(f"{status} — dados exibidos podem estar desatualizados: {since}")
+        if info["last_error"]:
+            st.caption(f"Último erro: {info['last_error']}")
+
+
 def render_overview_card(running_over: int, last_refresh_utc, powerbi_bad: bool, 
                         total_abertos: int, today_revenue: float, today_forecast: float, 
                         redshift_threshold: int, mons_count: int, stale_count: int = 0):
@@ -39,7 +66,8 @@ def render_overview_card(running_over: int, last_refresh_utc, powerbi_bad: bool,
     st.markdown('</div>', unsafe_allow_html=True)
 
 
-def render_redshift_card(running_over: int, redshift_threshold: int, df_list: pd.DataFrame = None):
+def render_redshift_card(running_over: int, redshift_threshold: int, df_list: pd.DataFrame = None,
+                         df_users: pd.DataFrame = None):
     """Renderiza card do Redshift"""
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("<h3>Redshift — Queries Engasgadas</h3>", unsafe_allow_html=True)
@@ -87,6 +115,15 @@ def render_redshift_card(running_over: int, redshift_threshold: int, df_list: pd
         with st.expander("Ver queries (Top)", expanded=True):
             st.dataframe(df_list, use_container_width=True, height=360, hide_index=True)
 
+    if running_over > 0 and df_users is not None and not df_users.empty:
+        with st.expander("Por usuário", expanded=False):
+            st.dataframe(
+                df_users.rename(columns={
+                    "user_name": "Usuário", "queries": "Queries", "max_minutes": "Maior (min)", "total_minutes": "Soma (min)",
+                }),
+                use_container_width=True, hide_index=True,
+            )
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 
@@ -107,9 +144,21 @@ def render_powerbi_card(refresh_info: dict, refresh_alert_min: int):
             st.rerun()
     with col3:
         if st.button("📊 Status", help="Mostra informações de cache e conexão"):
-            st.info(f"Cache TTL: 5s | Conexões ativas: Postgres")
+            from ..cache import cache_stats
+            from ..db import get_postgres_pool
+            ps = get_postgres_pool().stats()
+            cs = cache_stats()["postgres"]
+            st.info(
+                f"Cache TTL: {cs['ttl_sec']}s (+{cs['stale_sec']}s vencido) • {cs['hits']} hits, "
+                f"{cs['stale_hits']} vencidos, {cs['misses']} misses, {cs['refreshes']} recargas, "
+                f"{cs['coalesced']} consultas poupadas | "
+                f"Pool Postgres: {ps['in_use']} em uso, {ps['idle']} ociosas "
+                f"(máx. {ps['max_size']}) • {ps['checkouts']} checkouts, espera máx. {ps['wait_sec_max']:.2f}s"
+            )
     with col4:
         if st.button("🧹 Limpar Cache", help="Limpa todo o cache do Streamlit"):
+            from ..cache import clear_cache
+            clear_cache()
             st.cache_data.clear()
             st.cache_resource.clear()
             st.success("✅ Todo cache limpo!")
@@ -391,8 +440,11 @@ def render_kpis_card(kpis_data: dict):
     st.markdown('</div>', unsafe_allow_html=True)
 
 
-def render_kestra_card(flow_ids: list = None):
-    """Renderiza card de status dos flows do Kestra"""
+def render_kestra_card(kestra: dict | None = None, error: str | None = None):
+    """
+    Renderiza card de status dos flows do Kestra a partir do snapshot (get_kestra_overview):
+    o rerun não consulta o Kestra, só o teste de flow e o disparo manual
+    """
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("🔄 Status dos Flows Kestra")
     
@@ -427,9 +479,7 @@ def render_kestra_card(flow_ids: list = None):
         return
     
     # Importar funções do Kestra
-    from monitor_dw.services.kestra_client import (
-        get_kestra_flows, get_flow_status_from_docs, trigger_kestra_flow
-    )
+    from monitor_dw.services.kestra_client import get_flow_status_from_docs, trigger_kestra_flow
     
     # Testar conexão com endpoint da documentação oficial
     st.info("🔧 **Testando integração com Kestra usando documentação oficial**")
@@ -454,7 +504,12 @@ def render_kestra_card(flow_ids: list = None):
         
         if st.button("🔍 Testar Flow", type="primary"):
             with st.spinner("Testando conexão com Kestra..."):
-                flow_status = get_flow_status_from_docs(flow_id, namespace)
+                try:
+                    flow_status = get_flow_status_from_docs(flow_id, namespace)
+                except Exception as e:
+                    # Falha da fonte (rede, 5xx, circuito aberto): estado do Kestra no selo
+                    flow_status = {"status": "ERROR", "message": str(e)}
+                    render_source_badge("kestra")
                 
                 if flow_status.get("status") == "SUCCESS":
                     st.success("✅ **Conexão bem-sucedida!**")
@@ -507,46 +562,29 @@ def render_kestra_card(flow_ids: list = None):
         - `GET /api/v1/{tenant}/executions/{executionId}` - Detalhes de uma execução
         """)
     
-    st.markdown('</div>', unsafe_allow_html=True)
-    return
+    # Seção de monitoramento: dados do snapshot (coletor ou consulta única do rerun)
+    st.markdown("### 📊 Monitoramento de Flows")
     
-    # Seção de configuração
-    with st.expander("⚙️ Configuração", expanded=False):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("🔄 Atualizar Lista de Flows"):
-                st.cache_data.clear()
-                st.rerun()
-        
-        with col2:
-            if st.button("📋 Listar Todos os Flows"):
-                flows = get_kestra_flows()
-                if flows:
-                    st.write(f"**{len(flows)} flows encontrados:**")
-                    for flow in flows[:10]:  # Mostrar apenas os primeiros 10
-                        st.write(f"- {flow.get('id', 'N/A')}")
-                    if len(flows) > 10:
-                        st.write(f"... e mais {len(flows) - 10} flows")
-                else:
-                    st.write("Nenhum flow encontrado")
+    if error and not kestra:
+        st.error(f"❌ Falha ao consultar Kestra: {error}")
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
     
-    # Seção de monitoramento
-    st.markdown("### 📊 Monitoramento de Flows")
+    kestra = kestra or {}
+    flows = kestra.get("flows", [])
+    flows_status = kestra.get("status", {})
+    recent_executions = kestra.get("executions", {})
     
-    # Se não foram especificados flows, tentar obter automaticamente
-    if not flow_ids:
-        flows = get_kestra_flows()
-        if flows:
-            # Pegar os primeiros 5 flows como exemplo
-            flow_ids = [flow.get("id") for flow in flows[:5] if flow.get("id")]
-        else:
-            st.info("ℹ️ Nenhum flow encontrado. Configure flows específicos ou verifique a conexão.")
-            st.markdown('</div>', unsafe_allow_html=True)
-            return
+    with st.expander(f"📋 Flows encontrados ({len(flows)})", expanded=False):
+        for flow in flows[:10]:  # Mostrar apenas os primeiros 10
+            st.write(f"- {flow.get('id', 'N/A')} ({flow.get('namespace', 'N/A')})")
+        if len(flows) > 10:
+            st.write(f"... e mais {len(flows) - 10} flows")
     
-    # Obter status dos flows
-    flows_status = get_multiple_flows_status(flow_ids)
+    if not flows_status:
+        st.info("ℹ️ Nenhum flow encontrado. Configure KESTRA_FLOW_IDS ou verifique a conexão.")
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
     
     # Exibir status de cada flow
     for flow_id, status_info in flows_status.items():
@@ -588,11 +626,14 @@ def render_kestra_card(flow_ids: list = None):
                         st.success("✅ Disparado!")
                     else:
                         st.error(f"❌ {result['message']}")
-                    st.rerun()
             
             # Mostrar detalhes adicionais
             with st.expander(f"📋 Detalhes - {flow_id}", expanded=False):
                 st.json(status_info)
+                executions = recent_executions.get(flow_id, [])
+                if executions:
+                    st.markdown("**Execuções recentes:**")
+                    st.dataframe(pd.DataFrame(executions), use_container_width=True, hide_index=True)
     
     # Resumo geral
     st.divider()
@@ -6,7 +6,7 @@ Componentes de sidebar e controles
 import streamlit as st
 import time
 from ..config import TZ, REDSHIFT_THRESHOLD_MIN, REFRESH_ALERT_MIN, AUTO_REFRESH_SEC
-from ..db import get_redshift_conn, get_postgres_conn
+from ..db import get_redshift_pool, get_postgres_pool
 from datetime import datetime
 
 
@@ -90,19 +90,57 @@ def render_system_info():
         st.caption(f"🌍 Timezone: {TZ}")
         st.caption(f"👤 Usuário: {st.session_state.get('auth_user', 'Não logado')}")
         
-        # Status das conexões
+        # Status das conexões: só pelos contadores do pool e do circuito (nada de
+        # abrir conexão ou SELECT 1 por rerun; quem consulta as fontes é o coletor)
         st.caption("🔗 Status das conexões:")
+        for label, get_pool in (("Redshift", get_redshift_pool), ("Postgres", get_postgres_pool)):
+            try:
+                pool = get_pool()
+                ps = pool.stats()
+                info = pool.breaker.info() if pool.breaker is not None else None
+            except Exception as e:
+                st.caption(f"❌ {label}: {e}")
+                continue
+            usage = (f"pool {ps['in_use']}/{ps['max_size']} em uso, "
+                     f"espera média {ps['wait_sec_avg'] * 1000:.0f} ms")
+            if info is None or (info["last_success"] is None and info["last_failure"] is None):
+                st.caption(f"⚪ {label}: sem consultas ainda • {usage}")
+            elif info["state"] == "open":
+                st.caption(f"❌ {label}: circuito aberto (nova tentativa em {info['retry_in']:.0f}s) • "
+                           f"{info['last_error']}")
+            elif info["state"] == "half_open":
+                st.caption(f"⚠️ {label}: testando a conexão • {usage}")
+            elif info["last_success"] is None:
+                st.caption(f"⚠️ {label}: sem sucesso recente • {info['last_error']}")
+            else:
+                age = (datetime.now(TZ) - info["last_success"]).total_seconds()
+                st.caption(f"✅ {label}: último sucesso há {age:.0f}s • {usage}")
+
+        # Fila de gravação do histórico local
         try:
-            _ = get_redshift_conn()
-            st.caption("✅ Redshift: Conectado")
-        except:
-            st.caption("❌ Redshift: Desconectado")
-        
-        try:
-            _ = get_postgres_conn()
-            st.caption("✅ Postgres: Conectado")
-        except:
-            st.caption("❌ Postgres: Desconectado")
+            from ..db import get_history_writer_stats
+            from ..history import get_history_conn_stats
+            ws = get_history_writer_stats()
+            cs = get_history_conn_stats()
+            icon = "⚠️" if ws["dropped"] or ws["errors"] else "✅"
+            st.caption(
+                f"{icon} Histórico: fila {ws['queue_depth']} • {ws['written']} gravados em {ws['batches']} lotes, "
+                f"último lote {ws['flush_ms_last']:.0f} ms • {ws['dropped']} descartados • "
+                f"{cs['open']} conexões ({cs['reused']} reusos)"
+            )
+        except Exception:
+            pass
+
+        # Status do coletor em segundo plano
+        from ..collector import load_snapshot
+        from ..config import COLLECTOR_MAX_AGE_SEC
+        snap = load_snapshot(max_age_sec=None)
+        if snap is None:
+            st.caption("⚪ Coletor: não iniciado (consultas diretas)")
+        else:
+            age = (datetime.now(TZ) - snap["published_at"]).total_seconds()
+            icon = "✅" if age <= COLLECTOR_MAX_AGE_SEC else "⚠️"
+            st.caption(f"{icon} Coletor: v{snap['version']} • {age:.0f}s atrás")
 
 
 def render_auth_ui():